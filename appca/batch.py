@@ -0,0 +1,382 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Batch enrollment of devices on the private CA. The input is a directory or an archive (.tar, .tar.gz, .tgz or .zip) of
+request triples, which are named by device: <name>.csr, <name>.msg and <name>.sig, in any sub-directory. The
+manufacturer's certificate is verified once for the batch, the signatures of devices are verified in parallel by a
+pool of worker processes, and the certificates of the verified devices are issued by "openssl ca" in chunks of CSRs.
+
+The output is a directory or an archive (by the same extensions) of the issued certificates <name>.cert.pem, the CA
+certificate cacert.pem and the report report.json, which has the status of every device: issued, rejected (signature
+verification failed), incomplete (a file of the triple is missing) or failed (the certificate cannot be issued).
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tarfile
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../../../')
+from smit.security import certmngr
+from smit import utils
+
+REQUEST_FILES = {'.csr': 'CSR', '.msg': 'MSG', '.sig': 'SIG'}  # extension -> file of request
+ARCHIVES = ('.tar.gz', '.tgz', '.tar', '.zip')
+CHUNK = 256  # the max number of CSRs signed by one "openssl ca" call
+PEM_END = '-----END CERTIFICATE-----'
+
+
+def is_archive(path):
+    """Return True if the path is an archive by its extension.
+    """
+    return path.lower().endswith(ARCHIVES)
+
+
+def extract(archive, path):
+    """Extract an archive into a directory. Members with absolute paths or parent references are refused.
+
+    :param archive: path to the archive.
+    :param path: the directory.
+    :type archive: str.
+    :type path: str.
+    """
+    if archive.lower().endswith('.zip'):
+        f = zipfile.ZipFile(archive)
+        names = f.namelist()
+        members = None
+    else:
+        f = tarfile.open(archive)
+        members = [m for m in f.getmembers() if m.isfile() or m.isdir()]  # links and devices are skipped.
+        names = [m.name for m in members]
+    try:
+        for name in names:
+            if os.path.isabs(name) or '..' in name.replace('\\', '/').split('/'):
+                raise IOError('Unsafe path \"' + name + '\" in archive \"' + archive + '\".')
+        if members is None:
+            f.extractall(path)
+        else:
+            f.extractall(path, members)
+    finally:
+        f.close()
+
+
+def pack(path, archive):
+    """Pack a directory into an archive, the members are relative to the directory.
+
+    :param path: the directory.
+    :param archive: path to the archive.
+    :type path: str.
+    :type archive: str.
+    """
+    if archive.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as f:
+            for root, dirs, files in os.walk(path):
+                for name in files:
+                    f.write(os.path.join(root, name), os.path.relpath(os.path.join(root, name), path))
+    else:
+        f = tarfile.open(archive, 'w:gz' if archive.lower().endswith(('.gz', '.tgz')) else 'w')
+        try:
+            for name in sorted(os.listdir(path)):
+                f.add(os.path.join(path, name), name)
+        finally:
+            f.close()
+
+
+def find_requests(path):
+    """Find the request triples in a directory.
+
+    :param path: the directory.
+    :type path: str.
+
+    Return:
+            dict - device name -> {'CSR': path, 'MSG': path, 'SIG': path}, a file may be missing.
+    """
+    requests = {}
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() in REQUEST_FILES:
+                name = os.path.relpath(os.path.join(root, stem), path)
+                requests.setdefault(name, {})[REQUEST_FILES[ext.lower()]] = os.path.join(root, filename)
+    return requests
+
+
+def verify_request(args):
+    """Verify the signature of a request, it runs in a worker process.
+
+    :param args: (device name, files of request, configuration of certificate manager).
+    :type args: tuple.
+
+    Return:
+            tuple - (device name, True if the signature is valid, reason of failure).
+    """
+    name, files, config = args
+    cm = certmngr.CertManager()
+    cm.config = dict(config, MSG=files['MSG'], SIG=files['SIG'])
+    try:
+        with open(os.devnull, 'w') as null:
+            stdout = os.dup(1)
+            os.dup2(null.fileno(), 1)  # the output of openssl and certificate manager is not useful in a batch.
+            try:
+                return name, bool(cm.verify_sig()), None
+            finally:
+                sys.stdout.flush()
+                os.dup2(stdout, 1)
+                os.close(stdout)
+    except Exception as e:
+        return name, False, str(e) or 'signature verification failed.'
+
+
+def split_certs(data):
+    """Split PEM certificates.
+
+    :param data: concatenated certificates in PEM format.
+    :type data: str.
+
+    Return:
+            list - the certificates.
+    """
+    return [block[block.find('-----BEGIN'):] + PEM_END + '\n' for block in data.split(PEM_END)[:-1]]
+
+
+class BatchEnrollment(object):
+    """
+    This class enrolls a batch of devices with the configuration of CA and its certificate manager.
+    """
+    utl = utils.Utils()
+
+    def __init__(self, ca_config, cert_config, lock, workers):
+        """Constructor initializes variables
+
+        :param ca_config: configuration of CA (SIGCHAIN, SIGCERT, OCSP and CACERT).
+        :param cert_config: configuration of certificate manager (OPENSSL_PATH, EXTENSIONS, CERTDB and CERTS).
+        :param lock: the lock of "openssl ca" of the CA.
+        :param workers: number of worker processes to verify signatures.
+        :type ca_config: dict.
+        :type cert_config: dict.
+        :type lock: multiprocessing.Lock.
+        :type workers: int.
+        """
+        self.ca_config = ca_config
+        self.cert_config = cert_config
+        self.lock = lock
+        self.workers = max(1, workers)
+        self.timing = []  # (step, time in seconds)
+
+    def verify_signer(self):
+        """Verify the manufacturer's certificate, which signs the messages of all devices in the batch.
+
+        Return:
+                bool - True if the certificate is valid.
+        """
+        cm = certmngr.CertManager()
+        cm.config = dict(self.cert_config)
+        try:
+            return cm.verify_cert(self.ca_config.get('SIGCHAIN', ''), self.ca_config.get('SIGCERT', ''),
+                                  self.ca_config.get('OCSP', ''))
+        except Exception as e:
+            print (e)
+            return False
+
+    def verify(self, requests):
+        """Verify the signatures of requests in parallel.
+
+        :param requests: device name -> files of request.
+        :type requests: dict.
+
+        Return:
+                dict - device name -> reason of failure, None if the signature is valid.
+        """
+        config = dict(self.cert_config, SIGCERT=self.ca_config.get('SIGCERT', ''))
+        tasks = [(name, files, config) for name, files in sorted(requests.iteritems())]
+        if self.workers == 1:
+            results = map(verify_request, tasks)
+        else:
+            pool = Pool(self.workers)
+            try:
+                results = pool.map(verify_request, tasks, chunksize=max(1, len(tasks) // (self.workers * 4)))
+            finally:
+                pool.close()
+                pool.join()
+        return dict((name, None if valid else (reason or 'signature verification failed.'))
+                    for name, valid, reason in results)
+
+    def sign_chunk(self, csrs):
+        """Issue the certificates of CSRs by one "openssl ca" call. The certificates are read from the standard output,
+           since some versions of openssl keep only the last certificate in the file of "-out".
+
+        :param csrs: paths to the CSRs.
+        :type csrs: list.
+
+        Return:
+                list - the certificates in the order of CSRs.
+        """
+        cmd = ['openssl', 'ca', '-batch', '-notext', '-config', self.cert_config.get('OPENSSL_PATH', '')]
+        extensions = self.cert_config.get('EXTENSIONS', '').strip()
+        if extensions != '':
+            cmd += ['-extensions', extensions]
+        with open(os.devnull, 'w') as null:
+            p = subprocess.Popen(cmd + ['-infiles'] + csrs, stdout=subprocess.PIPE, stderr=null)
+            out = p.communicate()[0]
+        if p.returncode != 0:
+            raise RuntimeError('openssl ca returned ' + str(p.returncode) + '.')
+        certs = split_certs(out)
+        if len(certs) != len(csrs):
+            raise RuntimeError('openssl issued ' + str(len(certs)) + ' certificates for ' + str(len(csrs)) + ' CSRs.')
+        return certs
+
+    def sign_one(self, csr, path):
+        """Issue the certificate of a CSR by the certificate manager, which reuses the existing certificate of the
+           subject.
+
+        :param csr: path to the CSR.
+        :param path: the directory for the certificate.
+        :type csr: str.
+        :type path: str.
+
+        Return:
+                str - the certificate.
+        """
+        cm = certmngr.CertManager()
+        cm.config = dict(self.cert_config, CSR=csr, CERT=os.path.join(path, 'one.pem'))
+        cm.create_cert()
+        return self.utl.read_file(cm.config['CERT'], 'r')
+
+    def sign(self, requests, path):
+        """Issue the certificates of verified requests. A chunk of CSRs is signed by one "openssl ca" call, and if the
+           call fails (e.g., a subject is already in the certificate database), the CSRs of the chunk are signed one
+           by one to find the failed ones.
+
+        :param requests: device name -> files of request.
+        :param path: a temporary directory.
+        :type requests: dict.
+        :type path: str.
+
+        Return:
+                dict - device name -> the certificate, or an exception if it cannot be issued.
+        """
+        names = sorted(requests)
+        results = {}
+        with self.lock:
+            for i in range(0, len(names), CHUNK):
+                chunk = names[i:i + CHUNK]
+                try:
+                    certs = self.sign_chunk([requests[name]['CSR'] for name in chunk])
+                    results.update(zip(chunk, certs))
+                    continue
+                except (RuntimeError, OSError):
+                    pass
+                for name in chunk:
+                    try:
+                        results[name] = self.sign_one(requests[name]['CSR'], path)
+                    except Exception as e:
+                        results[name] = e
+        return results
+
+    def step(self, name, start):
+        """Record the time of a step.
+        """
+        self.timing.append((name, time.time() - start))
+        print ('Batch ' + name + ': ' + '%.3f' % self.timing[-1][1] + 's')
+
+    def run(self, source, output):
+        """Enroll the devices of a batch.
+
+        :param source: directory or archive of request triples.
+        :param output: directory or archive of the issued certificates and report.
+        :type source: str.
+        :type output: str.
+
+        Return:
+                dict - device name -> status of the device.
+        """
+        source = os.path.expanduser(source)
+        output = os.path.expanduser(output)
+        begin = time.time()
+        work = tempfile.mkdtemp(prefix='batch-')
+        try:
+            if os.path.isdir(source):
+                requests = find_requests(source)
+            elif os.path.isfile(source) and is_archive(source):
+                extract(source, os.path.join(work, 'in'))
+                requests = find_requests(os.path.join(work, 'in'))
+            else:
+                raise IOError('Path \"' + source + '\" of batch requests is not a directory or an archive.')
+            report = {}
+            complete = {}
+            for name, files in requests.iteritems():
+                if len(files) == len(REQUEST_FILES):
+                    complete[name] = files
+                else:
+                    missing = sorted(set(REQUEST_FILES.values()) - set(files))
+                    report[name] = {'status': 'incomplete', 'reason': ', '.join(missing) + ' missing.'}
+            print ('Batch of ' + str(len(requests)) + ' devices, ' + str(len(complete)) + ' complete requests.')
+
+            start = time.time()
+            if complete and not self.verify_signer():
+                raise RuntimeError('Manufacturer\'s certificate verification failed, the batch is rejected.')
+            self.step('signer verification', start)
+            start = time.time()
+            for name, reason in self.verify(complete).iteritems():
+                if reason is not None:
+                    report[name] = {'status': 'rejected', 'reason': reason}
+                    del complete[name]
+            self.step('signature verification', start)
+
+            start = time.time()
+            out_dir = os.path.join(work, 'out') if is_archive(output) else output
+            self.utl.makedir(out_dir)
+            for name, cert in self.sign(complete, work).iteritems():
+                if isinstance(cert, Exception):
+                    report[name] = {'status': 'failed', 'reason': str(cert) or 'certificate cannot be issued.'}
+                    continue
+                cert_path = os.path.join(out_dir, name + '.cert.pem')
+                if os.path.dirname(cert_path) != out_dir:
+                    self.utl.makedir(os.path.dirname(cert_path))
+                self.utl.write_file(cert, cert_path, 'w')
+                report[name] = {'status': 'issued'}
+            self.step('issue', start)
+
+            ca_path = os.path.expanduser(self.ca_config.get('CACERT', ''))
+            if os.path.isfile(ca_path):
+                shutil.copyfile(ca_path, os.path.join(out_dir, 'cacert.pem'))
+            summary = dict((status, sum(1 for r in report.itervalues() if r['status'] == status))
+                           for status in ('issued', 'rejected', 'incomplete', 'failed'))
+            self.timing.append(('total', time.time() - begin))
+            with open(os.path.join(out_dir, 'report.json'), 'w') as f:
+                json.dump({'summary': summary, 'timing': dict(self.timing), 'devices': report}, f, sort_keys=True,
+                          indent=1)
+            if is_archive(output):
+                pack(out_dir, output)
+            print ('Batch completed in ' + '%.3f' % self.timing[-1][1] + 's: ' +
+                   ', '.join(str(summary[s]) + ' ' + s for s in ('issued', 'rejected', 'incomplete', 'failed')) +
+                   '. Output: ' + output)
+            return report
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
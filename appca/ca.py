@@ -21,17 +21,24 @@ along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
 import sys
+import time
 import socket
+import shutil
 import inspect
+import tempfile
+import threading
+import Queue
 
 sys.path.insert(0, '../../')
 sys.path.insert(0, '../../../')
 from smit.security import certmngr
+from smit.security import framing
+from smit.security import revocation
+from smit.appca import batch
 from smit import utils
 import traceback
-import random
-import string
 from multiprocessing import Process
+from multiprocessing import Lock
 
 
 class CA(object):
@@ -40,25 +47,41 @@ class CA(object):
        The configuration file allows to set the network information, local certificate information and etc.
        Such information is used to perform request verification and generate certificates.
        This class depends on the certificate management module which indeed generates certificate.
+
+       Requests are served by a pool of "WORKERS" workers, which are threads or pre-forked processes ("WORKERTYPE").
+       In thread mode, accepted connections wait in a queue of "QUEUESIZE" requests; when it is full, the CA stops
+       accepting and new connections wait in the listen backlog. Each request keeps its temporary files in its own
+       directory, so that workers never change the working directory, and certificates are issued one at a time
+       because "openssl ca" updates the certificate database.
+       Both the framed protocol (see security.framing) and the legacy protocol of string markers are accepted.
     """
     utl = utils.Utils()
     config = {'IP': '', 'PORT': '', 'CERT': 'tmpcert.pem', 'CSR': 'tmpcsr.csr', 'MSG': 'tmpmsg', 'SIG': 'tmpsig',
               'CACERT': '', 'CACHAIN': '', 'OCSP': '', 'OCSPPORT': '', 'SIGCERT': '', 'SIGCHAIN': '', 'OCSPCERT': '',
-              'OCSPSK': '', 'SELFSIGN': '', 'OPENSSL_PATH': ''}  # configuration keywords
+              'OCSPSK': '', 'SELFSIGN': '', 'OPENSSL_PATH': '', 'WORKERS': '', 'WORKERTYPE': '',
+              'QUEUESIZE': '', 'BACKEND': '', 'OCSPCACHE': ''}  # configuration keywords
     app_cnf = 'appcacnf'  # the path to configuration file for this package
     package_path = ''  # the path to this pakcage
     MAX_LEN = 1536  # the max length of packet which can be sent and received
+    WORKERS = 4  # the default number of workers
+    QUEUE_SIZE = 64  # the default max number of accepted requests waiting for a worker
+    TIMEOUT = 180  # requests time out after 180 seconds
+    WAIT_TIME = 1.0  # the time (in seconds) to wait for a free place in the queue before trying again
+    CHECK_TIME = 1.0  # the time (in seconds) to check worker processes
+    cert_config = None  # the configuration of certificate manager shared by all requests
 
     def __init__(self):
         self.package_path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
         os.chdir(self.package_path)
         self.config = self.utl.read_config(self.app_cnf, self.config)
+        self.issue_lock = Lock()  # serializes "openssl ca" of worker threads and processes
 
     def init_config(self, **args):
         """Initialize the package configuration according to the configuration file.
            This function MUST be called before other function call.
            The acceptable keywords are: config, IP, PORT, CERT, CSR, MSG, SIG, CACERT, CACHAIN, OCSP, OCSPPORT,
-           SIGCERT, SIGCHAIN, OCSPCERT, OCSPSK, SELFSIGN, OPENSSL_PATH.
+           SIGCERT, SIGCHAIN, OCSPCERT, OCSPSK, SELFSIGN, OPENSSL_PATH, WORKERS, WORKERTYPE, QUEUESIZE,
+           BACKEND, OCSPCACHE.
            Specifically, "config" is to set the path to configuration file.
            If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -75,7 +98,7 @@ class CA(object):
             if args.get(key, '') != '' and args[key] is not None:
                 self.config[key] = args[key]
                 update += 1
-        if args['OCSPPORT'] is not None and args.get('OCSPPORT', '') != '':  # change ocsp server url
+        if args.get('OCSPPORT') is not None and args['OCSPPORT'] != '':  # change ocsp server url
             url = self.config['OCSP']
             url = url[:str(url).rfind(':') + 1]  # get IP address
             self.config['OCSP'] = url + args['OCSPPORT']
@@ -94,104 +117,365 @@ class CA(object):
         f.write(data)
         f.close()
 
-    def connection_handler(self, sock, addr):
-        """This is a connection handler for subthread. It process a new connection for certificate request.
+    def load_cert_config(self):
+        """Read the configuration of certificate manager once, it is shared by the requests of all workers.
+        """
+        cm = certmngr.CertManager()
+        cm.init_config(config=self.app_cnf)
+        self.cert_config = cm.config
+
+    def session_manager(self, path):
+        """Return a certificate manager for a request. The temporary files of the request (CSR, message, signature and
+           certificate) are kept in the given directory.
+
+        :param path: directory of the request.
+        :type path: str.
+
+        Return:
+                CertManager - the certificate manager.
+        """
+        if self.cert_config is None:
+            self.load_cert_config()
+        cm = certmngr.CertManager()
+        cm.cert_cnf = self.app_cnf
+        cm.config = dict(self.cert_config)
+        for key in ('CSR', 'MSG', 'SIG', 'CERT'):
+            cm.config[key] = os.path.join(path, os.path.basename(self.config[key]))
+        return cm
+
+    def ca_cert(self):
+        """Return the CA certificate sent to applicants.
+
+        Return:
+                str - content of the CA certificate.
+        """
+        ca_path = os.path.expanduser(self.config.get('CACERT', ''))  # path to CA certificate
+        if not os.path.isfile(ca_path):
+            raise IOError('Path \"' + ca_path + '\" to the CA certificate is invalid or it is not a file. Please check '
+                          'the configuration file \"' + self.app_cnf + '\".')
+        return self.utl.read_file(ca_path, 'r')
+
+    def issue(self, cm, timing):
+        """Verify the received request files of a session and issue the certificate.
+
+        :param cm: the certificate manager of the session.
+        :param timing: the time of each step, which is appended by this function.
+        :type cm: CertManager.
+        :type timing: list.
+
+        Return:
+                str - content of the issued certificate, None if the request is rejected.
+        """
+        start = time.time()
+        try:
+            verified = cm.verify_sig()
+        except Exception as e:  # e.g., the signer's certificate is invalid.
+            print (e)
+            verified = False
+        timing.append(('signature', time.time() - start))
+        if not verified:
+            print ('Certificate request rejected: manufacturer\'s signature verification failed.')
+            return None
+        print('Manufacturer\'s signature verified.')
+        start = time.time()
+        try:
+            verified = cm.verify_cert(self.config.get('SIGCHAIN', ''), self.config.get('SIGCERT', ''),
+                                      self.config.get('OCSP', ''))
+        except Exception as e:  # e.g., OCSP server is not available.
+            print (e)
+            verified = False
+        timing.append(('certificate', time.time() - start))
+        if not verified:
+            print ('Certificate request rejected: manufacturer\'s certificate verification failed.')
+            return None
+        start = time.time()
+        with self.issue_lock:  # "openssl ca" updates the certificate database and serial number.
+            timing.append(('lock', time.time() - start))
+            start = time.time()
+            cm.create_cert()
+            cert_path = cm.find_cert()  # path to the generated certificate.
+        timing.append(('issue', time.time() - start))
+        return self.utl.read_file(cert_path, 'r')
+
+    def serve_framed(self, sock, cm, timing):
+        """Serve a request of the framed protocol (see framing): the CSR, message and signature are received in one
+           request, and the certificate and CA certificate are sent in one response.
+
+        :param sock: client socket.
+        :param cm: the certificate manager of the session.
+        :param timing: the time of each step, which is appended by this function.
+        :type sock: int.
+        :type cm: CertManager.
+        :type timing: list.
+
+        Return:
+                str - result of the request.
+        """
+        request = framing.recv_message(sock)
+        for frame_type, key in ((framing.CSR, 'CSR'), (framing.MSG, 'MSG'), (framing.SIG, 'SIG')):
+            if frame_type not in request:
+                framing.send_message(sock, [(framing.ERROR, 'incomplete request, ' + key + ' is missing.')])
+                return 'failed'
+            self.write_file(request[frame_type], cm.config[key])
+        print ('Request files received.')
+        try:
+            cert = self.issue(cm, timing)
+        except Exception as e:  # the certificate cannot be issued, tell the client before closing the connection.
+            print ('Error: certificate cannot be issued: ' + str(e))
+            framing.send_message(sock, [(framing.ERROR, 'certificate cannot be issued.')])
+            return 'failed'
+        if cert is None:
+            framing.send_message(sock, [(framing.ERROR, 'verification of the request failed.')])
+            return 'rejected'
+        framing.send_message(sock, [(framing.CERT, cert), (framing.CACERT, self.ca_cert())])
+        print ('Client certificate and CA certificate delivered.')
+        return 'completed'
+
+    def serve_legacy(self, sock, cm, timing):
+        """Serve a request of the legacy protocol: the CSR, message and signature are sent one by one with string
+           markers and acknowledged, and then the certificate and CA certificate are sent.
+
+        :param sock: client socket.
+        :param cm: the certificate manager of the session.
+        :param timing: the time of each step, which is appended by this function.
+        :type sock: int.
+        :type cm: CertManager.
+        :type timing: list.
+
+        Return:
+                str - result of the request.
+        """
+        # The While loop processes enroll request according to the designed message follow.
+        # The specified indicators like 'c' and 'm' may be changed in later version. It is currently for the test
+        # and simplicity.
+        while True:
+            data = sock.recv(self.MAX_LEN)
+            if not data:  # the applicant closed the connection.
+                return 'failed'
+            if data.startswith('#$c$#'):  # it is a CSR string and then write it to a file.
+                self.write_file(data[len('#$c$#'):], cm.config['CSR'])
+                print ('CSR file received.')
+                sock.send('ok')  # send acknowledgement to the applicant
+            if data.startswith('#$m$#'):  # it is a message string and then write it to a file.
+                self.write_file(data[len('#$m$#'):], cm.config['MSG'])
+                print ('Message file received.')
+                sock.send('ok')
+            if data.startswith('#$s$#'):  # it is a signature file then check if it is valid.
+                self.write_file(data[len('#$s$#'):], cm.config['SIG'])
+                print ('Signature file received.')
+                sock.send('ok')
+                try:
+                    cert = self.issue(cm, timing)
+                except Exception as e:  # the certificate cannot be issued, tell the client before closing.
+                    print ('Error: certificate cannot be issued: ' + str(e))
+                    sock.send('failed')
+                    return 'failed'
+                if cert is None:  # verification failed and send result to applicant.
+                    sock.send('failed')
+                    return 'rejected'
+                sock.send('#$t$#' + cert + '#^#*')  # send client certificate.
+                print ('Client certificate delivered.')
+                sock.send('#$a$#' + self.ca_cert() + '#^#*')  # send CA certificate.
+                print ('CA certificate delivered.')
+                return 'completed'
+
+    def connection_handler(self, sock, addr, queued=None):
+        """This is a connection handler for workers. It process a new connection for certificate request, in the
+           framed protocol or the legacy protocol.
            This function takes a client socket for DTLS packets transmission and the parameter addr is used to show
            the client IP address.
-           This function will be called in individual thread to process a specific client's connection.
+           The time of each step of the request is printed when the request is completed.
 
         :param sock: client socket.
         :param addr: client IP address
+        :param queued: the time when the request was queued, None if it was not queued.
         :type sock: int.
         :type addr: tuple.
+        :type queued: float.
         """
-        sock.settimeout(180)  # request timeout after 180 seconds to close the thread.
+        begin = time.time()
+        timing = []  # (step, time in seconds)
+        if queued is not None:
+            timing.append(('queue', begin - queued))
+        result = 'failed'
+        sock.settimeout(self.TIMEOUT)  # request timeout after 180 seconds to release the worker.
         print ('===== New connection from: ' + addr[0])
+        path = None
         try:
             # Create a directory to contain temporary files (e.g., certificate and received files)
             # generated during the interaction.
-            path = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
-            cm = certmngr.CertManager()
-            cm.init_config(config=self.app_cnf)
-            self.utl.makedir('tmp/' + path)
-            os.chdir('tmp/' + path)  # change the current working directory
-
-            # The While loop processes enroll request according to the designed message follow.
-            # The specified indicators like 'c' and 'm' may be changed in later version. It is currently for the test
-            # and simplicity.
-            while True:
-                data = sock.recv(self.MAX_LEN)
-                if data.startswith('#$c$#'):  # it is a CSR string and then write it to a file.
-                    self.write_file(data[len('#$c$#'):], self.config['CSR'])
-                    print ('CSR file received.')
-                    sock.send('ok')  # send acknowledgement to the applicant
-                if data.startswith('#$m$#'):  # it is a message string and then write it to a file.
-                    self.write_file(data[len('#$m$#'):], self.config['MSG'])
-                    print ('Message file received.')
-                    sock.send('ok')
-                if data.startswith('#$s$#'):  # it is a signature file then check if it is valid.
-                    self.write_file(data[len('#$s$#'):], self.config['SIG'])
-                    print ('Signature file received.')
-                    sock.send('ok')
-                    if not cm.verify_sig():  # signature verification failed and send result to applicant.
-                        sock.send('failed')
-                        print ('Certificate request rejected: manufacturer\'s signature verification failed.')
-                        break
-                    else:  # signature verified so that generate certificate.
-                        print('Manufacturer\'s signature verified.')
-                        if not cm.verify_cert(self.config.get('SIGCHAIN', ''), self.config.get('SIGCERT', ''),
-                                              self.config.get('OCSP', '')):
-                            return
-                        cm.create_cert()
-                        cert_path = cm.find_cert()  # path to the generated certificate.
-                        cert = self.utl.read_file(cert_path, 'r')
-                        cert = '#$t$#' + cert + '#^#*'
-                        sock.send(cert)  # send client certificate.
-                        print ('Client certificate delivered.')
-                        ca_path = os.path.expanduser(self.config.get('CACERT', ''))  # path to CA certificate
-                        if not os.path.isfile(ca_path):
-                            raise IOError('Path \"' + ca_path + '\" to the CA certificate is invalid or it is not a '
-                                          'file. Please check the configuration file \"' +
-                                          self.app_cnf + '\".')
-                        cert = self.utl.read_file(ca_path, 'r')
-                        cert = '#$a$#' + cert + '#^#*'
-                        sock.send(cert)  # send CA certificate.
-                        print ('CA certificate delivered.')
-                        break
+            path = tempfile.mkdtemp(prefix='enroll-', dir=os.path.join(self.package_path, 'tmp'))
+            cm = self.session_manager(path)
+            if framing.is_framed(sock):
+                result = self.serve_framed(sock, cm, timing)
+            else:
+                result = self.serve_legacy(sock, cm, timing)
         except socket.timeout:
-            pass
+            result = 'timed out'
         except KeyboardInterrupt:
-            sock.shutdown(socket.SHUT_RDWR)
-            sock.close()
+            pass
         except Exception as e:
             print (e)
         finally:
             # delete temporary directory to clean up session.
             print ('Clean up...')
-            self.utl.call('rm -rf ../' + path, shell=True)
-            print ('Session completed.')
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+            timing.append(('total', time.time() - (begin if queued is None else queued)))
+            print ('Session of ' + addr[0] + ' ' + result + ': ' +
+                   ', '.join(step + ' ' + '%.3f' % seconds + 's' for step, seconds in timing))
+
+    def run_thread(self, requests):
+        """Worker thread: serve the requests in the queue.
+
+        :param requests: queue of requests in the form of (client socket, client address, queued time).
+        :type requests: Queue.Queue.
+        """
+        while True:
+            sock, addr, queued = requests.get()
+            self.connection_handler(sock, addr, queued)
+
+    def run_process(self, sock):
+        """Worker process: accept and serve requests from the listening socket shared by all worker processes.
+
+        :param sock: the listening socket.
+        :type sock: socket.socket.
+        """
+        try:
+            while True:
+                cnsock, addr = sock.accept()
+                self.connection_handler(cnsock, addr)
+        except KeyboardInterrupt:
+            pass
+
+    def serve_threads(self, sock, workers, queue_size):
+        """Accept requests and queue them for worker threads. When the queue is full, no request is accepted until a
+           worker is free.
+
+        :param sock: the listening socket.
+        :param workers: number of worker threads.
+        :param queue_size: the max number of requests waiting for a worker.
+        :type sock: socket.socket.
+        :type workers: int.
+        :type queue_size: int.
+        """
+        requests = Queue.Queue(queue_size)
+        for i in range(0, workers):
+            thread = threading.Thread(target=self.run_thread, args=(requests,))
+            thread.daemon = True
+            thread.start()
+        while True:
+            cnsock, addr = sock.accept()
+            request = (cnsock, addr, time.time())
+            while True:
+                try:
+                    requests.put(request, timeout=self.WAIT_TIME)
+                    break
+                except Queue.Full:
+                    pass
+
+    def serve_processes(self, sock, workers):
+        """Start worker processes which share the listening socket, and restart the dead ones until the CA is
+           interrupted.
+
+        :param sock: the listening socket.
+        :param workers: number of worker processes.
+        :type sock: socket.socket.
+        :type workers: int.
+        """
+        processes = [None] * workers
+        try:
+            while True:
+                for i, p in enumerate(processes):
+                    if p is None or not p.is_alive():
+                        if p is not None:
+                            print ('Worker ' + str(i) + ' exited with code ' + str(p.exitcode) + ', restarting.')
+                        processes[i] = Process(target=self.run_process, args=(sock,))
+                        processes[i].start()
+                time.sleep(self.CHECK_TIME)
+        finally:
+            for p in processes:
+                if p is not None and p.is_alive():
+                    p.terminate()
+                    p.join()
+
+    def enroll_batch(self, source, output):
+        """Enroll a batch of devices without connections, see the module batch for the formats of input and output.
+           The signatures are verified by "WORKERS" worker processes.
+
+        :param source: directory or archive of request triples (<name>.csr, <name>.msg and <name>.sig).
+        :param output: directory or archive of the issued certificates and report.
+        :type source: str.
+        :type output: str.
+
+        Return:
+                dict - device name -> status of the device.
+        """
+        if self.cert_config is None:
+            self.load_cert_config()
+        workers = int(self.config.get('WORKERS', '') or self.WORKERS)
+        return batch.BatchEnrollment(self.config, self.cert_config, self.issue_lock, workers).run(source, output)
+
+    def publish_crl(self, full=False):
+        """Publish the CRL of the certificates revoked in the certificate database of this CA, with the certificate
+           and private key in its openssl configuration "OPENSSL_PATH". A delta CRL of the certificates revoked since
+           the last full CRL is published, unless a full CRL is required or the last one is out of date.
+
+        :param full: True to publish a full CRL.
+        :type full: bool.
+
+        Return:
+                str - path to the published CRL.
+        """
+        if self.cert_config is None:
+            self.load_cert_config()
+        try:
+            publisher = revocation.CRLPublisher(self.cert_config.get('OPENSSL_PATH', ''))
+            path, number, count = publisher.publish(full)
+            print (('Delta CRL' if path == publisher.delta_path else 'CRL') + ' ' + str(number) + ' of ' + str(count) +
+                   ' revoked certificates published to ' + path)
+            return path
+        except Exception as e:
+            print ('Error: CRL cannot be published: ' + str(e))
+            raise
 
     def start(self):
         """This function starts the CA to process certificate generation requests.
-           This function support multi-thread processing so that requests can be handle in parallel.
+           Requests are processed in parallel by a pool of worker threads or processes.
         """
+        sock = None
         try:
+            workers = int(self.config.get('WORKERS', '') or self.WORKERS)
+            queue_size = int(self.config.get('QUEUESIZE', '') or self.QUEUE_SIZE)
+            worker_type = str(self.config.get('WORKERTYPE', '') or 'thread').lower()
+            if worker_type not in ('thread', 'process'):
+                raise ValueError('The type of workers is invalid, it should be either \"thread\" or \"process\". '
+                                 'Please check the configuration file \"' + self.app_cnf + '\".')
+            self.utl.makedir(os.path.join(self.package_path, 'tmp'))
+            self.load_cert_config()
             # create socket
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             host = self.config.get('IP', '127.0.0.1')
             port = int(self.config.get('PORT', 12345))
             sock.bind((host, port))
 
             # listen requests
-            sock.listen(5)
-            print ('CA started and awaiting request ...')
-            while True:
-                cnsock, addr = sock.accept()
-                # create a new thread to handle the accepted connection.
-                p = Process(target=self.connection_handler, args=(cnsock, addr,))
-                p.start()
+            sock.listen(queue_size)
+            print ('CA started with ' + str(workers) + ' worker ' + worker_type + 's and awaiting request ...')
+            if worker_type == 'process':
+                self.serve_processes(sock, workers)
+            else:
+                self.serve_threads(sock, workers, queue_size)
         except KeyboardInterrupt:
-            sock.shutdown(socket.SHUT_RDWR)
-            sock.close()
+            pass
         except Exception as e:
             print (e)
+        finally:
+            if sock is not None:
+                sock.close()
@@ -25,6 +25,8 @@ import inspect
 sys.path.insert(0,'../../')
 sys.path.insert(0,'../../../')
 from smit import utils
+from smit.appca import responder
+from smit.security import cryptobackend
 import traceback
 
 
@@ -34,7 +36,8 @@ class OCSP(object):
        The configuration file allows to set the network information, local certificate information and etc.
     """
     utl = utils.Utils()
-    config = {'CACERT': '', 'OCSPPORT': '', 'OCSPCERT': '', 'OCSPSK': '', 'CERTDB': ''}  # configuration keywords
+    config = {'CACERT': '', 'OCSPPORT': '', 'OCSPCERT': '', 'OCSPSK': '', 'CERTDB': '', 'RESPONDER': '',
+              'VALIDITY': ''}  # configuration keywords
     app_cnf = 'ocspcnf'  # the path to configuration file for this class
     package_path = ''  # the path to this package
 
@@ -45,7 +48,7 @@ class OCSP(object):
     def init_config(self, **kwargs):
         """Initialize the package configuration according to the configuration file.
            This function MUST be called before other function call.
-           The acceptable keywords are: config, CACERT, OCSPPORT, OCSPCERT, OCSPSK, CERTDB.
+           The acceptable keywords are: config, CACERT, OCSPPORT, OCSPCERT, OCSPSK, CERTDB, RESPONDER, VALIDITY.
            Specifically, "config" is to set the path to configuration file.
            If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -67,6 +70,8 @@ class OCSP(object):
 
     def start(self):
         """This function starts an OCSP server according to the configuration.
+           The embedded responder (see the module responder) is used by default, and "openssl ocsp" is used if
+           "RESPONDER" is "openssl" or the cryptography library is not installed.
         """
         port = self.config.get('OCSPPORT', '')
         db_path = os.path.expanduser(self.config.get('CERTDB', ''))
@@ -84,7 +89,11 @@ class OCSP(object):
             if not os.path.isfile(ca_path):
                 raise IOError('Path \"' + ca_path + '\" to the simulated global CA\'s certificate is invalid or it '
                               'is not a file.')
-            if port != '':
+            if port != '' and self.config.get('RESPONDER', '') != 'openssl' and cryptobackend.AVAILABLE:
+                validity = self.config.get('VALIDITY', '')
+                responder.Responder(ca_path, signer_path, key_path, db_path,
+                                    int(validity) if validity != '' else responder.VALIDITY).serve(int(port))
+            elif port != '':
                 self.utl.check_call('openssl ocsp -index ' + db_path + ' -port ' + port + ' -rsigner ' + signer_path +
                                     ' -rkey ' + key_path + ' -CA ' + ca_path + ' -text -out log.txt', shell=True)
             else:
@@ -0,0 +1,525 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Embedded OCSP responder of the simulated global CA. It serves the same requests as "openssl ocsp -index -port", while:
+    - the certificate database (index.txt) is loaded into a hash map of serial numbers, instead of being read for every
+      request;
+    - the responses are signed in advance with a validity window (thisUpdate to nextUpdate, RFC 5019), so that a
+      request is answered from the cache without signing;
+    - requests are served concurrently by threads;
+    - the database is checked periodically, and only the responses of changed serial numbers are signed again.
+
+The responses are encoded in DER by this module and signed by the "cryptography" library. Pre-signed responses carry
+no nonce, which openssl clients accept with a warning. Requests of unknown serial numbers or of other CAs are signed on
+demand and not cached.
+'''
+
+import os
+import sys
+import time
+import base64
+import urllib
+import hashlib
+import threading
+import SocketServer
+import BaseHTTPServer
+
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../../../')
+from smit.security import cryptobackend
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+except ImportError:
+    pass
+
+VALIDITY = 60  # the default validity (in minutes) of responses
+CHECK_TIME = 5  # the interval (in seconds) to check the certificate database and the validity of responses
+MAX_REQUEST = 65536  # the max length of a request
+QUEUE_SIZE = 128  # the backlog of the listening socket
+# OID of hash algorithm of CertID -> name in hashlib
+HASHES = {'1.3.14.3.2.26': 'sha1', '2.16.840.1.101.3.4.2.1': 'sha256', '2.16.840.1.101.3.4.2.2': 'sha384',
+          '2.16.840.1.101.3.4.2.3': 'sha512'}
+# reason of revocation in the certificate database -> CRLReason
+REASONS = {'unspecified': 0, 'keyCompromise': 1, 'CACompromise': 2, 'affiliationChanged': 3, 'superseded': 4,
+           'cessationOfOperation': 5, 'certificateHold': 6, 'removeFromCRL': 8}
+# responseStatus of OCSPResponse
+SUCCESSFUL = 0
+MALFORMED_REQUEST = 1
+INTERNAL_ERROR = 2
+OCSP_BASIC = '1.3.6.1.5.5.7.48.1.1'
+SHA1 = '1.3.14.3.2.26'
+ECDSA_SHA256 = '1.2.840.10045.4.3.2'
+RSA_SHA256 = '1.2.840.113549.1.1.11'
+NULL = '\x05\x00'
+
+
+def encode(tag, content):
+    """Encode a DER element.
+
+    :param tag: the tag.
+    :param content: the content.
+    :type tag: int.
+    :type content: str.
+
+    Return:
+            str - the element.
+    """
+    size = len(content)
+    if size < 0x80:
+        return chr(tag) + chr(size) + content
+    length = ''
+    while size:
+        length = chr(size & 0xff) + length
+        size >>= 8
+    return chr(tag) + chr(0x80 | len(length)) + length + content
+
+
+def decode(data, pos=0):
+    """Decode the header of a DER element.
+
+    :param data: DER data.
+    :param pos: the position of the element.
+    :type data: str.
+    :type pos: int.
+
+    Return:
+            tuple - (tag, beginning of content, end of element, beginning of element).
+    """
+    start = pos
+    if pos + 2 > len(data):
+        raise ValueError('truncated DER element.')
+    tag = ord(data[pos])
+    size = ord(data[pos + 1])
+    pos += 2
+    if size & 0x80:
+        num = size & 0x7f
+        if num == 0 or num > 4 or pos + num > len(data):
+            raise ValueError('invalid length of DER element.')
+        size = int(data[pos:pos + num].encode('hex'), 16)
+        pos += num
+    if pos + size > len(data):
+        raise ValueError('truncated DER element.')
+    return tag, pos, pos + size, start
+
+
+def children(data, begin, end):
+    """Return the elements in the content of a constructed DER element.
+
+    :param data: DER data.
+    :param begin: beginning of the content.
+    :param end: end of the content.
+    :type data: str.
+    :type begin: int.
+    :type end: int.
+
+    Return:
+            list - (tag, beginning of content, end of element, beginning of element) of the elements.
+    """
+    elements = []
+    while begin < end:
+        elements.append(decode(data, begin))
+        begin = elements[-1][2]
+    return elements
+
+
+def sequence(*items):
+    """Return a DER SEQUENCE of encoded elements.
+    """
+    return encode(0x30, ''.join(items))
+
+
+def integer(value):
+    """Return a DER INTEGER of a non-negative integer.
+    """
+    content = ''
+    while True:
+        content = chr(value & 0xff) + content
+        value >>= 8
+        if value == 0:
+            break
+    if ord(content[0]) & 0x80:
+        content = '\x00' + content
+    return encode(0x02, content)
+
+
+def oid(dotted):
+    """Return a DER OBJECT IDENTIFIER of a dotted string.
+    """
+    parts = [int(p) for p in dotted.split('.')]
+    content = chr(40 * parts[0] + parts[1])
+    for part in parts[2:]:
+        sub = chr(part & 0x7f)
+        part >>= 7
+        while part:
+            sub = chr(0x80 | (part & 0x7f)) + sub
+            part >>= 7
+        content += sub
+    return encode(0x06, content)
+
+
+def oid_string(content):
+    """Return the dotted string of the content of an OID element.
+    """
+    values = []
+    value = 0
+    for c in content:
+        value = (value << 7) | (ord(c) & 0x7f)
+        if not ord(c) & 0x80:
+            values.append(value)
+            value = 0
+    if not values:
+        raise ValueError('empty OID.')
+    first = min(values[0] // 40, 2)
+    return '.'.join(str(v) for v in [first, values[0] - 40 * first] + values[1:])
+
+
+def generalized_time(seconds):
+    """Return a DER GeneralizedTime of seconds since the epoch.
+    """
+    return encode(0x18, time.strftime('%Y%m%d%H%M%SZ', time.gmtime(seconds)))
+
+
+def cert_fields(der):
+    """Return the subject and the public key of a certificate.
+
+    :param der: the certificate in DER.
+    :type der: str.
+
+    Return:
+            tuple - (subject in DER, content of the public key bit string without the unused bits byte).
+    """
+    tag, begin, end, start = decode(der)
+    tag, begin, end, start = decode(der, begin)  # tbsCertificate
+    fields = children(der, begin, end)
+    if fields[0][0] == 0xa0:  # version
+        fields = fields[1:]
+    subject = fields[4]
+    tag, begin, end, start = children(der, fields[5][1], fields[5][2])[1]  # subjectPublicKey of subjectPublicKeyInfo
+    return der[subject[3]:subject[2]], der[begin + 1:end]
+
+
+def issuer_serial(der):
+    """Return the issuer and the serial number of a certificate.
+
+    :param der: the certificate in DER.
+    :type der: str.
+
+    Return:
+            tuple - (issuer in DER, serial number).
+    """
+    tag, begin, end, start = decode(der)
+    tag, begin, end, start = decode(der, begin)  # tbsCertificate
+    fields = children(der, begin, end)
+    if fields[0][0] == 0xa0:  # version
+        fields = fields[1:]
+    serial, issuer = fields[0], fields[2]
+    return der[issuer[3]:issuer[2]], int(der[serial[1]:serial[2]].encode('hex'), 16)
+
+
+def parse_request(der):
+    """Parse an OCSP request. Request extensions (e.g., nonce) and signatures are ignored.
+
+    :param der: the request in DER.
+    :type der: str.
+
+    Return:
+            list - (CertID in DER, OID of hash algorithm, issuerNameHash, issuerKeyHash, serial number) of requested
+                   certificates.
+    """
+    tag, begin, end, start = decode(der)
+    if tag != 0x30 or end != len(der):
+        raise ValueError('request is not a sequence.')
+    tag, begin, end, start = decode(der, begin)  # tbsRequest
+    request_list = [e for e in children(der, begin, end) if e[0] == 0x30]
+    if len(request_list) != 1:
+        raise ValueError('request list is missing.')
+    requests = []
+    for tag, begin, end, start in children(der, request_list[0][1], request_list[0][2]):
+        cert_id = children(der, begin, end)[0]
+        algorithm, name_hash, key_hash, serial = children(der, cert_id[1], cert_id[2])[:4]
+        algorithm_oid = children(der, algorithm[1], algorithm[2])[0]
+        if algorithm_oid[0] != 0x06 or name_hash[0] != 0x04 or key_hash[0] != 0x04 or serial[0] != 0x02:
+            raise ValueError('invalid CertID.')
+        requests.append((der[cert_id[3]:cert_id[2]], oid_string(der[algorithm_oid[1]:algorithm_oid[2]]),
+                         der[name_hash[1]:name_hash[2]], der[key_hash[1]:key_hash[2]],
+                         int(der[serial[1]:serial[2]].encode('hex') or '0', 16)))
+    if not requests:
+        raise ValueError('no certificate is requested.')
+    return requests
+
+
+def error_response(status):
+    """Return an OCSP response without response bytes, e.g., malformedRequest.
+    """
+    return sequence(encode(0x0a, chr(status)))
+
+
+def revocation_time(value):
+    """Convert the revocation time in the certificate database (UTCTime or GeneralizedTime) to GeneralizedTime.
+    """
+    if len(value) == 13:
+        value = ('19' if int(value[:2]) >= 50 else '20') + value
+    return encode(0x18, value)
+
+
+class Responder(object):
+    """
+    This class answers OCSP requests from pre-signed responses of the certificates in a certificate database.
+    """
+
+    def __init__(self, ca_path, signer_path, key_path, db_path, validity=VALIDITY):
+        """Constructor loads the certificates and the private key.
+
+        :param ca_path: path to the certificate of the CA.
+        :param signer_path: path to the certificate of OCSP server.
+        :param key_path: path to the private key of OCSP server.
+        :param db_path: path to the certificate database of the CA (index.txt).
+        :param validity: validity of responses in minutes.
+        :type ca_path: str.
+        :type signer_path: str.
+        :type key_path: str.
+        :type db_path: str.
+        :type validity: int.
+        """
+        ca_der = cryptobackend.load_cert_der(ca_path)
+        signer_der = cryptobackend.load_cert_der(signer_path)
+        self.key = cryptobackend.load_key(key_path)
+        if isinstance(self.key, ec.EllipticCurvePrivateKey):
+            self.algorithm = sequence(oid(ECDSA_SHA256))
+        else:
+            self.algorithm = sequence(oid(RSA_SHA256), NULL)
+        ca_subject, ca_key = cert_fields(ca_der)
+        # OID of hash algorithm -> (issuerNameHash, issuerKeyHash) of the CA
+        self.issuer = dict((algorithm, (hashlib.new(name, ca_subject).digest(), hashlib.new(name, ca_key).digest()))
+                           for algorithm, name in HASHES.iteritems())
+        self.responder_id = encode(0xa2, encode(0x04, hashlib.sha1(cert_fields(signer_der)[1]).digest()))  # byKey
+        self.certs = encode(0xa0, sequence(signer_der))
+        self.db_path = db_path
+        self.db_stat = None
+        self.validity = max(1, validity) * 60
+        self.entries = {}  # serial number -> (status, revocation time, reason) in the certificate database
+        self.cache = {}  # CertID -> (serial number, response, time to sign again, nextUpdate)
+        self.lock = threading.Lock()
+        self.signed = 0
+        self.hits = 0
+
+    def cert_id(self, serial):
+        """Return the CertID of a serial number with SHA1, which is used by openssl clients by default.
+        """
+        return sequence(sequence(oid(SHA1), NULL), encode(0x04, self.issuer[SHA1][0]),
+                        encode(0x04, self.issuer[SHA1][1]), integer(serial))
+
+    def load_db(self):
+        """Load the certificate database.
+
+        Return:
+                dict - serial number -> (status, revocation time, reason).
+        """
+        entries = {}
+        with open(self.db_path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 4 or fields[3] == '':
+                    continue
+                revoked = fields[2].split(',')
+                entries[int(fields[3], 16)] = (fields[0], revoked[0], revoked[1] if len(revoked) > 1 else '')
+        return entries
+
+    def single_response(self, cert_id, entry, now):
+        """Return a SingleResponse.
+
+        :param cert_id: CertID in DER.
+        :param entry: the entry in the certificate database, None if the certificate is unknown.
+        :param now: the time of thisUpdate.
+        :type cert_id: str.
+        :type entry: tuple.
+        :type now: float.
+        """
+        if entry is not None and entry[0] == 'V':
+            status = encode(0x80, '')  # good
+        elif entry is not None and entry[0] == 'R' and entry[1] != '':
+            reason = encode(0xa0, encode(0x0a, chr(REASONS[entry[2]]))) if entry[2] in REASONS else ''
+            status = encode(0xa1, revocation_time(entry[1]) + reason)  # revoked
+        else:
+            status = encode(0x82, '')  # unknown
+        return sequence(cert_id, status, generalized_time(now), encode(0xa0, generalized_time(now + self.validity)))
+
+    def sign(self, singles, now):
+        """Sign SingleResponses into an OCSP response.
+
+        :param singles: the SingleResponses.
+        :param now: the time of producedAt.
+        :type singles: list.
+        :type now: float.
+
+        Return:
+                str - the OCSP response in DER.
+        """
+        tbs = sequence(self.responder_id, generalized_time(now), sequence(*singles))
+        signature = cryptobackend.sign(self.key, tbs, hashes.SHA256())
+        basic = sequence(tbs, self.algorithm, encode(0x03, '\x00' + signature), self.certs)
+        self.signed += 1
+        return sequence(encode(0x0a, chr(SUCCESSFUL)), encode(0xa0, sequence(oid(OCSP_BASIC), encode(0x04, basic))))
+
+    def respond(self, der):
+        """Answer an OCSP request, from the cache if it is possible.
+
+        :param der: the request in DER.
+        :type der: str.
+
+        Return:
+                str - the OCSP response in DER.
+        """
+        try:
+            requests = parse_request(der)
+        except (ValueError, IndexError):
+            return error_response(MALFORMED_REQUEST)
+        now = time.time()
+        if len(requests) == 1:
+            cached = self.cache.get(requests[0][0])
+            if cached is not None and now < cached[3]:
+                self.hits += 1
+                return cached[1]
+        singles = []
+        entry = None
+        for cert_id, algorithm, name_hash, key_hash, serial in requests:
+            entry = self.entries.get(serial) if self.issuer.get(algorithm) == (name_hash, key_hash) else None
+            singles.append(self.single_response(cert_id, entry, now))
+        try:
+            response = self.sign(singles, now)
+        except Exception as e:
+            print ('Error: OCSP response cannot be signed: ' + str(e))
+            return error_response(INTERNAL_ERROR)
+        if len(requests) == 1 and entry is not None:
+            cert_id, serial = requests[0][0], requests[0][4]
+            with self.lock:
+                if self.entries.get(serial) is entry:  # the database is not changed while signing.
+                    self.cache[cert_id] = (serial, response, now + self.validity / 2, now + self.validity)
+        return response
+
+    def refresh(self):
+        """Reload the certificate database if it is changed, drop the responses of changed serial numbers and sign
+           the responses which are missing or in the second half of their validity.
+
+        Return:
+                int - number of signed responses.
+        """
+        stat = os.stat(self.db_path)
+        stat = (stat.st_mtime, stat.st_size, stat.st_ino)
+        if stat != self.db_stat:
+            entries = self.load_db()
+            with self.lock:
+                changed = set(serial for serial in set(entries) | set(self.entries)
+                              if entries.get(serial) != self.entries.get(serial))
+                self.entries = entries
+                self.db_stat = stat
+                for cert_id in [k for k, v in self.cache.iteritems() if v[0] in changed]:
+                    del self.cache[cert_id]
+        now = time.time()
+        with self.lock:
+            for cert_id in [k for k, v in self.cache.iteritems() if now >= v[2]]:
+                del self.cache[cert_id]
+        signed = 0
+        for serial, entry in self.entries.items():
+            cert_id = self.cert_id(serial)
+            if cert_id in self.cache:
+                continue
+            response = self.sign([self.single_response(cert_id, entry, now)], now)
+            with self.lock:
+                if self.entries.get(serial) is entry:
+                    self.cache[cert_id] = (serial, response, now + self.validity / 2, now + self.validity)
+            signed += 1
+        return signed
+
+    def check(self):
+        """Refresh the responses periodically, it runs in a thread.
+        """
+        while True:
+            time.sleep(CHECK_TIME)
+            try:
+                signed = self.refresh()
+                if signed > 0:
+                    print ('OCSP responder signed ' + str(signed) + ' responses, ' + str(len(self.entries)) +
+                           ' certificates in database, ' + str(self.hits) + ' requests answered from cache.')
+            except Exception as e:
+                print ('Error: OCSP responses cannot be refreshed: ' + str(e))
+
+    def serve(self, port):
+        """Serve OCSP requests over HTTP (POST and GET) until interrupted.
+
+        :param port: the port number.
+        :type port: int.
+        """
+        signed = self.refresh()
+        print ('OCSP responder pre-signed ' + str(signed) + ' responses, valid for ' + str(self.validity // 60) +
+               ' minutes.')
+        checker = threading.Thread(target=self.check)
+        checker.daemon = True
+        checker.start()
+        server = HTTPServer(('', port), RequestHandler)
+        server.responder = self
+        print ('OCSP responder is listening on port ' + str(port) + '.')
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    This class handles an HTTP request of OCSP (RFC 6960 appendix A).
+    """
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        if length <= 0 or length > MAX_REQUEST:
+            self.reply(error_response(MALFORMED_REQUEST))
+            return
+        self.reply(self.server.responder.respond(self.rfile.read(length)))
+
+    def do_GET(self):
+        try:
+            der = base64.b64decode(urllib.unquote(self.path.lstrip('/')))
+        except TypeError:
+            der = ''
+        self.reply(self.server.responder.respond(der))
+
+    def reply(self, response):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/ocsp-response')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass  # requests are not logged, they would slow down the responder at boot of many devices.
+
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server which serves every connection in a thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = QUEUE_SIZE
@@ -29,6 +29,7 @@ sys.path.insert(0, '../../../')
 from smit.security import certmngr
 from smit import utils
 from smit.security import DTLSWrap
+from smit.security import framing
 import traceback
 import random
 import string
@@ -82,7 +83,7 @@ class Client(object):
         if update > 0:
             self.utl.update_config(self.client_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.client_cnf + ' ' + self.config['CN'] + '.clientcnf.bck', shell=True)
+        self.utl.backup_file(self.client_cnf, self.config['CN'] + '.clientcnf.bck')
 
     def enroll(self):
         """This function request a certificate from the internal private CA.
@@ -111,62 +112,22 @@ class Client(object):
             port = int(self.config.get('CAPORT', 12345))
             sock.connect((host, port))
             print ('CA connected.')
-            # Send three files to CA for certificate generation request.
+            # Send three files to CA in one request and receive both certificates in one response.
             csr = self.utl.read_file(csr_path, 'r')
             msg = self.utl.read_file(msg_path, 'r')
             sig = self.utl.read_file(sig_path, 'r')
-            buf = '#$c$#' + csr
             sock.settimeout(180)  # socket timeout after 180 seconds.
-            data_len = sock.send(buf)
-            print str(data_len) + ' bytes sent for CSR file.'
-            ack = sock.recv(self.MAX_LEN)  # receive acknowledgement from CA.
-            if ack != 'ok':
-                raise RuntimeError('CA\'s acknowledgement for receiving CSR file is failedis failed.')
-            buf = '#$m$#' + msg
-            data_len = sock.send(buf)
-            print str(data_len) + ' bytes sent for message file.'
-            ack = sock.recv(self.MAX_LEN)
-            if ack != 'ok':
-                raise RuntimeError('CA\'s acknowledgement for receiving message file is failed.')
-            buf = '#$s$#' + sig
-            data_len = sock.send(buf)
-            print str(data_len) + ' bytes sent for signature file.'
-            ack = sock.recv(self.MAX_LEN)
-            if ack != 'ok':
-                raise RuntimeError('CA\'s acknowledgement for receiving signature file is failed.')
-
-            data = ''  # received data
-            ca_cert_ok = False  # indicate if CA certificate received.
-            sv_cert_ok = False  # indicate if client certificate received.
-            while True:
-                data = data + sock.recv(self.MAX_LEN)
-                if data == 'failed':  # Certificate request failed.
-                    print ('Certificate request rejected because provide files may not be valid.')
-                    raise
-                if data.count('#^#*') == 2 and data.find('#$t$#') != -1 and data.find('#$a$#') != -1:
-                    # Wait the transmission complete then process data. If connection broken, this will timeout after
-                    # 180 seconds. extract my certificate
-                    begin = data.find('#$t$#') + len('#$t$#')
-                    end = data.find('#^#*')
-                    path = os.path.dirname(self.config['CERT'])
-                    if path != '':
-                        self.utl.makedir(path)
-                    self.utl.write_file(data[begin:end], self.config['CERT'], 'w')
-                    sv_cert_ok = True
-                    data = data[end + len('#^#*'):]
-                    print ('My certificate received and stored at: \"' + self.config['CERT'] + '\".')
-
-                    # extract CA certificate
-                    begin = data.find('#$a$#') + len('#$a$#')
-                    end = data.rfind('#^#*')
-                    path = os.path.dirname(self.config['CACERT'])
-                    if path != '':
-                        self.utl.makedir(path)
-                    self.utl.write_file(data[begin:end], self.config['CACERT'], 'w')
-                    ca_cert_ok = True
-                    print ('CA certificate received and stored at: \"' + self.config['CACERT'] + '\".')
-                if ca_cert_ok and sv_cert_ok:
-                    break
+            cert, ca_cert = framing.request_certificate(sock, csr, msg, sig)
+            path = os.path.dirname(self.config['CERT'])
+            if path != '':
+                self.utl.makedir(path)
+            self.utl.write_file(cert, self.config['CERT'], 'w')
+            print ('My certificate received and stored at: \"' + self.config['CERT'] + '\".')
+            path = os.path.dirname(self.config['CACERT'])
+            if path != '':
+                self.utl.makedir(path)
+            self.utl.write_file(ca_cert, self.config['CACERT'], 'w')
+            print ('CA certificate received and stored at: \"' + self.config['CACERT'] + '\".')
             sock.close()
         except socket.timeout:
             print 'Request timeout.'
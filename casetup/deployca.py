@@ -104,8 +104,8 @@ class DeployCA(object):
                                                               self.cert_config['CN'] + '.key.pem')
             self.utl.update_config(self.cert_cnf, self.cert_config)
         # Backup configuration files
-        self.utl.call('cp -f ' + self.opensslcnf + ' ' + self.cert_config['CN'] + '.openssl.cnf.bck', shell=True)
-        self.utl.call('cp -f ' + self.cert_cnf + ' ' + self.cert_config['CN'] + '.certcnf.bck', shell=True)
+        self.utl.backup_file(self.opensslcnf, self.cert_config['CN'] + '.openssl.cnf.bck')
+        self.utl.backup_file(self.cert_cnf, self.cert_config['CN'] + '.certcnf.bck')
         # Update depend configuration files
         if package != '':
             os.chdir(self.package_path)
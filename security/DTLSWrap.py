@@ -23,29 +23,159 @@ import ssl
 import socket
 import sys
 import os
+import time
+import ctypes
 import traceback
 
 sys.path.insert(0, '..')
 from utils import Utils
 from dtls import do_patch
 
+SESSION_ID_CONTEXT = 'smit-dtls'  # the session id context of servers, which is required to resume verified sessions
+SSL_CTRL_GET_SESSION_REUSED = 8  # the control command of macro SSL_session_reused
+CERT_OPT = {'CERT_NONE': ssl.CERT_NONE, 'CERT_OPTIONAL': ssl.CERT_OPTIONAL, 'CERT_REQUIRED': ssl.CERT_REQUIRED}
+# control commands of OCSP stapling (the status_request extension)
+SSL_CTRL_SET_TLSEXT_STATUS_REQ_CB = 63
+SSL_CTRL_SET_TLSEXT_STATUS_REQ_TYPE = 65
+SSL_CTRL_GET_TLSEXT_STATUS_REQ_OCSP_RESP = 70
+SSL_CTRL_SET_TLSEXT_STATUS_REQ_OCSP_RESP = 71
+TLSEXT_STATUSTYPE_OCSP = 1
+SSL_TLSEXT_ERR_OK = 0
+SSL_TLSEXT_ERR_NOACK = 3
+STATUS_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+_session_functions = None
+_staple_functions = None
+
+
+def session_functions():
+    """Load the OpenSSL functions of session resumption which are not exported by PyDTLS.
+
+    Return:
+            dict - function name -> function, empty if the functions are not available.
+    """
+    global _session_functions
+    if _session_functions is None:
+        _session_functions = {}
+        try:
+            from dtls import openssl
+            for name, restype, argtypes in (
+                    ('SSL_get1_session', ctypes.c_void_p, [ctypes.c_void_p]),
+                    ('SSL_set_session', ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+                    ('SSL_SESSION_free', None, [ctypes.c_void_p]),
+                    ('SSL_ctrl', ctypes.c_long, [ctypes.c_void_p, ctypes.c_int, ctypes.c_long, ctypes.c_void_p]),
+                    ('SSL_CTX_set_session_id_context', ctypes.c_int,
+                     [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint])):
+                func = getattr(openssl.libssl, name)
+                func.restype = restype
+                func.argtypes = argtypes
+                _session_functions[name] = func
+            _session_functions['SSL_CTX_set_session_cache_mode'] = openssl.SSL_CTX_set_session_cache_mode
+            _session_functions['SSL_SESS_CACHE_SERVER'] = openssl.SSL_SESS_CACHE_SERVER
+        except (ImportError, AttributeError, OSError) as e:
+            print ('DTLS session resumption is disabled: ' + str(e))
+            _session_functions = {}
+    return _session_functions
+
+
+def disable_resumption(error):
+    """Disable session resumption in this process after a failure of the OpenSSL functions, so that later handshakes
+       are full handshakes instead of failing.
+
+    :param error: the failure.
+    :type error: Exception.
+    """
+    global _session_functions
+    print ('DTLS session resumption is disabled: ' + str(error))
+    _session_functions = {}
+
+
+def raw_pointer(param):
+    """Return the address of an OpenSSL object wrapped by PyDTLS (dtls.openssl.FuncParam), which is not accepted as a
+       ctypes.c_void_p argument.
+
+    :param param: the wrapped object, or an address.
+    :type param: dtls.openssl.FuncParam or int.
+
+    Return:
+            int - the address.
+    """
+    return getattr(param, 'raw', param)
+
+
+def staple_functions():
+    """Load the OpenSSL functions of OCSP stapling which are not exported by PyDTLS.
+
+    Return:
+            dict - function name -> function, empty if the functions are not available.
+    """
+    global _staple_functions
+    if _staple_functions is None:
+        _staple_functions = {}
+        try:
+            from dtls import openssl
+            for lib, name, restype, argtypes in (
+                    (openssl.libssl, 'SSL_ctrl', ctypes.c_long,
+                     [ctypes.c_void_p, ctypes.c_int, ctypes.c_long, ctypes.c_void_p]),
+                    (openssl.libssl, 'SSL_CTX_callback_ctrl', ctypes.c_long,
+                     [ctypes.c_void_p, ctypes.c_int, STATUS_CALLBACK]),
+                    (openssl.libcrypto, 'CRYPTO_malloc', ctypes.c_void_p,
+                     [ctypes.c_size_t, ctypes.c_char_p, ctypes.c_int])):
+                func = getattr(lib, name)
+                func.restype = restype
+                func.argtypes = argtypes
+                _staple_functions[name] = func
+        except (ImportError, AttributeError, OSError) as e:
+            print ('OCSP stapling is disabled: ' + str(e))
+            _staple_functions = {}
+    return _staple_functions
+
+
+def disable_stapling(error):
+    """Disable OCSP stapling in this process after a failure of the OpenSSL functions, so that later handshakes go on
+       without stapled responses instead of failing.
+
+    :param error: the failure.
+    :type error: Exception.
+    """
+    global _staple_functions
+    print ('OCSP stapling is disabled: ' + str(error))
+    _staple_functions = {}
+
 
 class DtlsWrap(object):
     """This is a wrap class for some functions from PyDTLS.
        Note that this class only wraps essential functions from PyDTLS.
        To use the class, it is requried to have the configuration file "dtlscnf".
        For more information and available functions, please see the documentation of PyDTLS.
+
+       The validated parameters of wrapping are cached per configuration and shared by all instances in a process.
+       Unless "RESUME" is "no", servers keep a session cache and clients resume the session of their last connection
+       to the same server, so that reconnecting clients do an abbreviated handshake. The time of the last handshake
+       is kept in "handshake_time" and "resumed".
+
+       If "STAPLE" is set, servers staple the OCSP response in that file (see CertManager.ocsp_response) to their
+       certificate in handshakes, and clients request the stapled response and save it to that file after the
+       handshake, so that it can be checked by CertManager.verify_cert without querying OCSP server.
     """
     utl = Utils()
     dtls_cnf = 'dtlscnf'
     dtls_sock = None
-    config = {'SK': '', 'CERT': '', 'TYPE': '', 'CACERT': '', 'CERT_REQS': ''}
+    config = {'SK': '', 'CERT': '', 'TYPE': '', 'CACERT': '', 'CERT_REQS': '', 'RESUME': '', 'CIPHERS': '',
+              'STAPLE': ''}
+    contexts = {}  # cached parameters of wrapping: configuration -> keyword arguments of ssl.wrap_socket
+    sessions = {}  # the sessions of clients to resume: (configuration, server address) -> SSL_SESSION pointer
+    peer = None  # the address of server connected by a client
+    handshake_time = None  # the time (in seconds) of the last handshake
+    resumed = False  # whether the last handshake resumed a session
+    status_callbacks = {}  # the OCSP status callbacks of server contexts, kept alive for OpenSSL: path -> callback
+    staples = {}  # the OCSP responses stapled by servers: path -> (modification time, response)
+    stapled = None  # the OCSP response stapled by the server in the last handshake of a client
 
     def init_config(self, **args):
         """Initialize the package configuration according to the configuration file. Usually, this function should be
            called before other function calls. It reads the configuration files according to the given keywords list
            and initialize the DTLS environment.
-           The acceptable keywords are: config, SK, CERT, TYPE, CACERT, CERT_REQS.
+           The acceptable keywords are: config, SK, CERT, TYPE, CACERT, CERT_REQS, RESUME, CIPHERS, STAPLE.
            Specifically, the keyword "config" sets the configuration file of the class.
            If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -65,9 +195,70 @@ class DtlsWrap(object):
         if update > 0:
             self.utl.update_config(self.dtls_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.dtls_cnf + ' ' + self.config['TYPE'] + '.dtls.bck', shell=True)
+        self.utl.backup_file(self.dtls_cnf, self.config['TYPE'] + '.dtls.bck')
         do_patch()
 
+    def context_key(self):
+        """Return the key of the current configuration in the cache of contexts and sessions.
+
+        Return:
+                tuple - the configuration.
+        """
+        return tuple(str(self.config.get(key, '')) for key in ('TYPE', 'SK', 'CERT', 'CACERT', 'CERT_REQS', 'RESUME',
+                                                                'CIPHERS', 'STAPLE'))
+
+    def resumption(self):
+        """Return True if session resumption is enabled and supported by the OpenSSL library.
+        """
+        return str(self.config.get('RESUME', '')).lower() != 'no' and bool(session_functions())
+
+    def stapling(self):
+        """Return True if OCSP stapling is enabled and supported by the OpenSSL library.
+        """
+        return self.config.get('STAPLE', '') != '' and bool(staple_functions())
+
+    def get_context(self):
+        """Return the parameters of wrapping for the current configuration. The parameters are validated once and
+           cached for all later connections with the same configuration.
+
+        Return:
+                dict - keyword arguments of ssl.wrap_socket.
+        """
+        key = self.context_key()
+        context = self.contexts.get(key)
+        if context is not None:
+            return context
+        key_path = os.path.expanduser(self.config.get('SK', ''))
+        cert_path = os.path.expanduser(self.config.get('CERT', ''))
+        ca_cert_path = os.path.expanduser(self.config.get('CACERT', ''))
+        cert_reqs = self.config.get('CERT_REQS', 'CERT_NONE')
+        # check if required files exist.
+        if not os.path.isfile(key_path):
+            raise IOError('My private key \"' + key_path + '\" is not a file or invalid.')
+        if cert_reqs not in CERT_OPT:
+            raise ValueError(
+                'The value of keyword \"CERT-REQS\" is invalid. Please check the configuration file \"' +
+                self.dtls_cnf + '\"')
+        if not os.path.isfile(cert_path) and CERT_OPT[cert_reqs] == ssl.CERT_REQUIRED:
+            raise IOError('My certificate \"' + cert_path + '\" is not a file or invalid.')
+        if not os.path.isfile(ca_cert_path) and CERT_OPT[cert_reqs] == ssl.CERT_REQUIRED:
+            raise IOError('CA\'s certificate \"' + ca_cert_path + '\" is not a file or invalid.')
+
+        # the parameters based on the device type, i.e "server" or "client"
+        context = {'keyfile': key_path, 'certfile': cert_path, 'cert_reqs': CERT_OPT[cert_reqs],
+                   'ca_certs': ca_cert_path}
+        ciphers = self.config.get('CIPHERS', '')
+        if str(self.config.get('TYPE', '')).lower() == 'server':
+            context.update(server_side=True, do_handshake_on_connect=False, ciphers=ciphers or 'ALL')
+        elif str(self.config.get('TYPE', '')).lower() == 'client':
+            context.update(ciphers=ciphers or 'IBIHOP-AES256-SHA')
+        else:
+            raise ValueError(
+                'The type of device is invalid, it should be either \"server\" or \"client\". Please check the '
+                'configuration file \"' + self.dtls_cnf + '\".')
+        self.contexts[key] = context
+        return context
+
     def wrap_socket(self, sock):
         """This a wrapper function to wrap a socket for DTLS communication. The DTLS socket is created by using security
             configurations including certificate and private key, etc. The created DTLS socket can be used to send and
@@ -76,42 +267,204 @@ class DtlsWrap(object):
         :param sock: socket.
         :type sock: int.
         """
-        key_path = os.path.expanduser(self.config.get('SK', ''))
-        cert_path = os.path.expanduser(self.config.get('CERT', ''))
-        ca_cert_path = os.path.expanduser(self.config.get('CACERT', ''))
-        cert_reqs = self.config.get('CERT_REQS', 'CERT_NONE')
-        cert_opt = {'CERT_NONE': ssl.CERT_NONE, 'CERT_OPTIONAL': ssl.CERT_OPTIONAL, 'CERT_REQUIRED': ssl.CERT_REQUIRED}
-
         try:
-            # check if required files exist.
-            if not os.path.isfile(key_path):
-                raise IOError('My private key \"' + key_path + '\" is not a file or invalid.')
-            if not os.path.isfile(cert_path) and cert_opt[cert_reqs] == ssl.CERT_REQUIRED:
-                raise IOError('My certificate \"' + cert_path + '\" is not a file or invalid.')
-            if not os.path.isfile(ca_cert_path) and cert_opt[cert_reqs] == ssl.CERT_REQUIRED:
-                raise IOError('CA\'s certificate \"' + ca_cert_path + '\" is not a file or invalid.')
-            if cert_reqs not in cert_opt:
-                raise ValueError(
-                    'The value of keyword \"CERT-REQS\" is invalid. Please check the configuration file \"' +
-                    self.dtls_cnf + '\"')
-
-            # wrap a socket based on the device type, i.e "server" or "client"
-            if str(self.config.get('TYPE', '')).lower() == 'server':
-                self.dtls_sock = ssl.wrap_socket(sock, keyfile=key_path, certfile=cert_path,
-                                                 cert_reqs=cert_opt[cert_reqs],
-                                                 ca_certs=ca_cert_path, server_side=True,
-                                                 do_handshake_on_connect=False, ciphers="ALL")
-            elif str(self.config.get('TYPE', '')).lower() == 'client':
-                self.dtls_sock = ssl.wrap_socket(sock, keyfile=key_path, certfile=cert_path,
-                                                 cert_reqs=cert_opt[cert_reqs],
-                                                 ca_certs=ca_cert_path, ciphers='IBIHOP-AES256-SHA')
-            else:
-                raise ValueError(
-                    'The type of device is invalid, it should be either \"server\" or \"client\". Please check the '
-                    'configuration file \"' + self.dtls_cnf + '\".')
+            context = self.get_context()
+            callbacks = {}
+            if self.resumption() or self.stapling():
+                if context.get('server_side'):
+                    callbacks['cb_user_config_ssl_ctx'] = self.config_server_ctx
+                else:
+                    callbacks['cb_user_config_ssl'] = self.config_client_ssl
+            self.dtls_sock = ssl.wrap_socket(sock, **dict(context, **callbacks))
         except Exception as e:
             print (e)
 
+    def config_server_ctx(self, ctx):
+        """Enable the session cache and OCSP stapling of a server context, it is called by PyDTLS when the context is
+           created. The connections accepted by a listening socket share its context and so its session cache.
+
+        :param ctx: the SSL context.
+        :type ctx: dtls.sslconnection.SSLContext.
+        """
+        if self.resumption():
+            try:
+                funcs = session_functions()
+                funcs['SSL_CTX_set_session_id_context'](raw_pointer(ctx._ctx), SESSION_ID_CONTEXT,
+                                                        len(SESSION_ID_CONTEXT))
+                funcs['SSL_CTX_set_session_cache_mode'](ctx._ctx, funcs['SSL_SESS_CACHE_SERVER'])
+            except Exception as e:
+                disable_resumption(e)
+        if self.stapling():
+            path = os.path.expanduser(self.config['STAPLE'])
+            if path not in self.status_callbacks:
+                self.status_callbacks[path] = STATUS_CALLBACK(lambda ssl_ptr, arg: self.staple(ssl_ptr, path))
+            try:
+                staple_functions()['SSL_CTX_callback_ctrl'](raw_pointer(ctx._ctx), SSL_CTRL_SET_TLSEXT_STATUS_REQ_CB,
+                                                            self.status_callbacks[path])
+            except Exception as e:
+                disable_stapling(e)
+
+    def staple(self, ssl_ptr, path):
+        """Staple the OCSP response in a file to the handshake, it is called by OpenSSL when a client requests the
+           certificate status. The response is read again only if the file is modified. Any failure is reported to
+           OpenSSL as no response, since exceptions cannot be raised through it.
+
+        :param ssl_ptr: pointer to the OpenSSL connection.
+        :param path: path to the OCSP response in DER.
+        :type ssl_ptr: int.
+        :type path: str.
+
+        Return:
+                int - SSL_TLSEXT_ERR_OK if the response is stapled, SSL_TLSEXT_ERR_NOACK otherwise.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+            cached = self.staples.get(path)
+            if cached is None or cached[0] != mtime:
+                with open(path, 'rb') as f:
+                    cached = (mtime, f.read())
+                self.staples[path] = cached
+            response = cached[1]
+            if not response:
+                return SSL_TLSEXT_ERR_NOACK
+            funcs = staple_functions()
+            if not funcs:
+                return SSL_TLSEXT_ERR_NOACK
+            buf = funcs['CRYPTO_malloc'](len(response), __file__, 0)  # freed by OpenSSL with the connection.
+            if not buf:
+                return SSL_TLSEXT_ERR_NOACK
+            ctypes.memmove(buf, response, len(response))
+            funcs['SSL_ctrl'](ssl_ptr, SSL_CTRL_SET_TLSEXT_STATUS_REQ_OCSP_RESP, len(response), buf)
+            return SSL_TLSEXT_ERR_OK
+        except (IOError, OSError):
+            return SSL_TLSEXT_ERR_NOACK
+        except Exception as e:
+            disable_stapling(e)
+            return SSL_TLSEXT_ERR_NOACK
+
+    def config_client_ssl(self, ssl_obj):
+        """Offer the saved session of the server to resume it and request the stapled OCSP response, it is called by
+           PyDTLS before the client handshake.
+
+        :param ssl_obj: the SSL connection.
+        :type ssl_obj: dtls.sslconnection.SSL.
+        """
+        if self.resumption():
+            session = self.sessions.get((self.context_key(), self.peer))
+            if session:
+                try:
+                    session_functions()['SSL_set_session'](raw_pointer(ssl_obj._ssl), session)
+                except Exception as e:
+                    disable_resumption(e)
+        if self.stapling():
+            try:
+                staple_functions()['SSL_ctrl'](raw_pointer(ssl_obj._ssl), SSL_CTRL_SET_TLSEXT_STATUS_REQ_TYPE,
+                                               TLSEXT_STATUSTYPE_OCSP, None)
+            except Exception as e:
+                disable_stapling(e)
+
+    def save_staple(self):
+        """Save the OCSP response stapled by the server in the handshake of a connected client to the file "STAPLE".
+           The file is replaced atomically, and it is removed if no response is stapled. It is kept after a resumed
+           handshake, in which the server sends neither its certificate nor the response.
+        """
+        pointer = self.ssl_pointer()
+        if pointer is None:
+            return
+        buf = ctypes.c_void_p()
+        try:
+            length = staple_functions()['SSL_ctrl'](pointer, SSL_CTRL_GET_TLSEXT_STATUS_REQ_OCSP_RESP, 0,
+                                                    ctypes.byref(buf))
+            self.stapled = ctypes.string_at(buf, length) if buf.value and length > 0 else None
+        except Exception as e:
+            disable_stapling(e)
+            self.stapled = None
+        path = os.path.expanduser(self.config['STAPLE'])
+        if self.stapled is None:
+            if not self.resumed and os.path.isfile(path):
+                os.remove(path)
+            return
+        tmp_path = path + '.' + str(os.getpid())
+        self.utl.write_file(self.stapled, tmp_path, 'wb')
+        os.rename(tmp_path, path)
+
+    def save_peer_cert(self, path):
+        """Save the certificate of the peer of a connected socket in PEM format, e.g., to check it with the stapled
+           OCSP response by CertManager.verify_cert. The file is replaced atomically.
+
+        :param path: path to the certificate.
+        :type path: str.
+
+        Return:
+                bool - True if the certificate is saved, False if the peer sent no certificate.
+        """
+        der = self.dtls_sock.getpeercert(True)
+        if not der:
+            return False
+        path = os.path.expanduser(path)
+        tmp_path = path + '.' + str(os.getpid())
+        self.utl.write_file(ssl.DER_cert_to_PEM_cert(der), tmp_path, 'w')
+        os.rename(tmp_path, path)
+        return True
+
+    def ssl_pointer(self):
+        """Return the pointer to the OpenSSL connection of the DTLS socket, None if it is not connected.
+        """
+        conn = getattr(self.dtls_sock, '_sslobj', None)
+        if conn is None or getattr(conn, '_ssl', None) is None:
+            return None
+        return raw_pointer(conn._ssl.value)
+
+    def save_session(self):
+        """Save the session of a connected client, so that the next connection to the server resumes it.
+        """
+        pointer = self.ssl_pointer()
+        if pointer is None:
+            return
+        funcs = session_functions()
+        try:
+            session = funcs['SSL_get1_session'](pointer)
+        except Exception as e:
+            disable_resumption(e)
+            return
+        if not session:
+            return
+        key = (self.context_key(), self.peer)
+        old = self.sessions.get(key)
+        self.sessions[key] = session
+        if old and old != session:
+            funcs['SSL_SESSION_free'](old)
+
+    def session_reused(self):
+        """Return True if the handshake of the DTLS socket resumed a session.
+        """
+        pointer = self.ssl_pointer()
+        if pointer is None or not session_functions():
+            return False
+        try:
+            return session_functions()['SSL_ctrl'](pointer, SSL_CTRL_GET_SESSION_REUSED, 0, None) == 1
+        except Exception as e:
+            disable_resumption(e)
+            return False
+
+    def do_handshake(self):
+        """This is a wrapper function to perform the DTLS handshake explicitly, e.g., on a connection accepted by a
+           server. The handshake is timed.
+        """
+        begin = time.time()
+        result = self.dtls_sock.do_handshake()
+        self.handshake_time = time.time() - begin
+        self.resumed = self.resumption() and self.session_reused()
+        return result
+
+    def handshake_info(self):
+        """Return the timing of the last handshake.
+
+        Return:
+                dict - 'time': handshake time in seconds, 'resumed': whether a session was resumed.
+        """
+        return {'time': self.handshake_time, 'resumed': self.resumed}
+
     def set_dtls_socket(self, sock):
         """This function sets a wrapped DTLS socket. It is usually used to handle a connection established from the
            "accept" function. Note that it is unnecessary to call init_config before this function.
@@ -141,9 +494,20 @@ class DtlsWrap(object):
 
     def connect(self, *args, **keywords):
         """This is a wrapper function to connect server via DTLS connection.
-           It is used to connect a DTLS server.
+           It is used to connect a DTLS server. The handshake is timed, and the session is saved to be resumed by the
+           next connection to the same server.
         """
-        return self.dtls_sock.connect(*args, **keywords)
+        if args:
+            self.peer = tuple(args[0][:2])
+        begin = time.time()
+        result = self.dtls_sock.connect(*args, **keywords)
+        self.handshake_time = time.time() - begin
+        if self.resumption():
+            self.resumed = self.session_reused()
+            self.save_session()
+        if self.stapling():
+            self.save_staple()
+        return result
 
         # def connect(self, addr):
 
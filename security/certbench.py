@@ -0,0 +1,263 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Latency benchmark of the backends of certificate manager. Every operation of CertManager is run N times with the
+openssl command line tool and with the in-process cryptography backend, on keys and certificates created in a temporary
+directory by a throwaway CA. The benchmark reports the latency of each operation and backend, and writes it in JSON.
+
+Usage: python certbench.py [-n 50] [-curve secp256k1] [-ops create_sk gen_sig ...] [-out certbench.json]
+'''
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, '..')
+sys.path.insert(0, '../../')
+from smit.security import certmngr
+from smit.security import cryptobackend
+
+BACKENDS = ['openssl', 'cryptography']
+OPERATIONS = ['create_sk', 'create_csr', 'gen_sig', 'verify_sig', 'verify_cert_key', 'verify_cert']
+PERCENTILES = [50, 90, 99]  # percentiles of latency in the report
+SUBJECT = {'C': 'AU', 'ST': 'NSW', 'L': 'Sydney', 'O': 'SMIT', 'OU': 'Bench', 'CN': 'bench.smit',
+           'emailAddress': 'bench@smit'}
+
+
+def openssl(cmd):
+    """Run an openssl command quietly.
+
+    :param cmd: the command.
+    :type cmd: str.
+    """
+    with open(os.devnull, 'w') as null:
+        subprocess.check_call('openssl ' + cmd, shell=True, stdout=null, stderr=null)
+
+
+def setup(path, curve):
+    """Create a CA and a device key, CSR, certificate, message and signature in a directory.
+
+    :param path: the directory.
+    :param curve: name of the curve of keys.
+    :type path: str.
+    :type curve: str.
+
+    Return:
+            dict - name -> path of the created files.
+    """
+    files = dict((name, os.path.join(path, name)) for name in ('ca.key', 'ca.pem', 'dev.key', 'dev.csr', 'dev.pem',
+                                                                'msg', 'sig'))
+    openssl('ecparam -name ' + curve + ' -genkey -noout -out ' + files['ca.key'])
+    openssl('req -new -x509 -sha256 -days 30 -key ' + files['ca.key'] + ' -out ' + files['ca.pem'] +
+            ' -subj "/CN=bench.ca"')
+    openssl('ecparam -name ' + curve + ' -genkey -noout -out ' + files['dev.key'])
+    openssl('req -new -key ' + files['dev.key'] + ' -out ' + files['dev.csr'] + ' -subj "/CN=bench.smit"')
+    openssl('x509 -req -sha256 -days 30 -in ' + files['dev.csr'] + ' -CA ' + files['ca.pem'] + ' -CAkey ' +
+            files['ca.key'] + ' -set_serial 1 -out ' + files['dev.pem'])
+    with open(files['msg'], 'w') as f:
+        f.write('SMIT certificate manager benchmark\n' * 32)
+    openssl('dgst -sha256 -sign ' + files['dev.key'] + ' -out ' + files['sig'] + ' ' + files['msg'])
+    return files
+
+
+def manager(backend, files, curve, path):
+    """Return a certificate manager of a backend which works on the benchmark files.
+
+    :param backend: name of the backend.
+    :param files: the files created by setup.
+    :param curve: name of the curve of keys.
+    :param path: directory of the files written by the benchmark.
+    :type backend: str.
+    :type files: dict.
+    :type curve: str.
+    :type path: str.
+
+    Return:
+            CertManager - the certificate manager.
+    """
+    cm = certmngr.CertManager()
+    cm.config = dict(certmngr.CertManager.config, **SUBJECT)
+    cm.config.update(BACKEND=backend, ECCPARAM=curve, SK=files['dev.key'], CERT=files['dev.pem'],
+                     MSG=files['msg'], SIGCERT=files['dev.pem'], SIG=os.path.join(path, backend + '.sig'),
+                     CSR=os.path.join(path, backend + '.csr'))
+    return cm
+
+
+def operation(cm, name, files, path):
+    """Return a function which runs an operation once.
+
+    :param cm: the certificate manager.
+    :param name: name of the operation.
+    :param files: the files created by setup.
+    :param path: directory of the files written by the benchmark.
+    :type cm: CertManager.
+    :type name: str.
+    :type files: dict.
+    :type path: str.
+    """
+    if name == 'create_sk':
+        def create_sk():
+            cm.config['SK'] = os.path.join(path, cm.config['BACKEND'] + '.key')
+            try:
+                cm.create_sk()
+            finally:
+                cm.config['SK'] = files['dev.key']
+        return create_sk
+    if name == 'verify_sig':
+        def verify_sig():
+            cm.config['SIG'] = files['sig']
+            if not cm.verify_sig():
+                raise RuntimeError('signature is invalid.')
+        return verify_sig
+    if name == 'verify_cert':
+        def verify_cert():
+            if not cm.verify_cert(files['ca.pem'], files['dev.pem'], ''):
+                raise RuntimeError('certificate is invalid.')
+        return verify_cert
+    return getattr(cm, name)
+
+
+def quiet(func):
+    """Run a function with the standard output discarded, including the output of openssl.
+
+    :param func: the function.
+    :type func: function.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    null = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(null, 1)
+    try:
+        return func()
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(null)
+
+
+def measure(func, num):
+    """Run a function num times and return the latency distribution in milliseconds.
+
+    :param func: the function.
+    :param num: number of runs.
+    :type func: function.
+    :type num: int.
+
+    Return:
+            dict - mean, min, max and percentiles.
+    """
+    samples = []
+    for i in xrange(num):
+        begin = time.time()
+        func()
+        samples.append((time.time() - begin) * 1000.0)
+    samples.sort()
+    result = {'mean': sum(samples) / len(samples), 'min': samples[0], 'max': samples[-1]}
+    for p in PERCENTILES:
+        result['p' + str(p)] = samples[min(int(len(samples) * p / 100.0), len(samples) - 1)]
+    return result
+
+
+def run(num, curve, operations):
+    """Run the benchmark.
+
+    :param num: number of runs of each operation and backend.
+    :param curve: name of the curve of keys.
+    :param operations: names of the operations.
+    :type num: int.
+    :type curve: str.
+    :type operations: list.
+
+    Return:
+            dict - the report of benchmark.
+    """
+    path = tempfile.mkdtemp(prefix='certbench-')
+    cwd = os.getcwd()
+    os.chdir(path)  # the command line backend writes temporary files into the working directory.
+    report = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'runs': num, 'curve': curve, 'results': []}
+    try:
+        files = setup(path, curve)
+        for name in operations:
+            for backend in BACKENDS:
+                result = {'operation': name, 'backend': backend}
+                if backend == 'cryptography' and not cryptobackend.AVAILABLE:
+                    result['error'] = 'the cryptography library is not installed.'
+                else:
+                    func = operation(manager(backend, files, curve, path), name, files, path)
+                    try:
+                        quiet(func)  # warm up
+                        result['latency_ms'] = quiet(lambda: measure(func, num))
+                    except Exception as e:
+                        result['error'] = str(e)
+                report['results'].append(result)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+    return report
+
+
+def print_report(report):
+    """Print the summary of a benchmark report.
+
+    :param report: the report of benchmark.
+    :type report: dict.
+    """
+    print ('%-16s %-13s %10s %10s %10s %10s' % ('operation', 'backend', 'mean (ms)', 'p50 (ms)', 'p99 (ms)',
+                                                'speedup'))
+    baseline = {}
+    for result in report['results']:
+        latency = result.get('latency_ms')
+        if latency is None:
+            print ('%-16s %-13s %s' % (result['operation'], result['backend'], result.get('error', '')))
+            continue
+        if result['backend'] == BACKENDS[0]:
+            baseline[result['operation']] = latency['mean']
+        speedup = baseline.get(result['operation'])
+        print ('%-16s %-13s %10.3f %10.3f %10.3f %10s' % (
+            result['operation'], result['backend'], latency['mean'], latency['p50'], latency['p99'],
+            '%.1fx' % (speedup / latency['mean']) if speedup and latency['mean'] else '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of the backends of certificate manager.')
+    parser.add_argument('-n', dest='num', type=int, default=50, help='Set the number of runs of each operation.')
+    parser.add_argument('-curve', dest='curve', default='secp256k1', help='Set the curve of keys (default: secp256k1).')
+    parser.add_argument('-ops', dest='ops', nargs='+', default=OPERATIONS, choices=OPERATIONS,
+                        help='Set the operations to benchmark (default: all).')
+    parser.add_argument('-out', dest='out', help='Write the report in JSON to this file.')
+    args = parser.parse_args()
+    report = run(args.num, args.curve, args.ops)
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, sort_keys=True, indent=1)
+        print ('Report written to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
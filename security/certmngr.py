@@ -23,15 +23,36 @@ import subprocess
 import os
 import filecmp
 import sys
+import time
+import hashlib
+import calendar
+import tempfile
 
 sys.path.insert(0, '..')
 sys.path.insert(0, '../../')
 import smit.utils
+from smit.security import cryptobackend
+from smit.security import revocation
+from smit.appca import responder
+
+
+VERIFY_TTL = 60  # the default time (in minutes) to keep the results of certificate verification with OCSP
 
 
 class CertManager(object):
     """This class provides functions to facilitate certificate generation and signature verification, etc.
        Most arguments used in the class are specified in the configuration file "certcnf".
+       If "BACKEND" is "cryptography", keys, CSRs, signatures and certificate verification are done in process by
+       the cryptography library, and the operations which it does not support (e.g., IBIHOP keys) fall back to the
+       openssl command line tool. Certificates are always issued by the command line tool, which uses the openssl
+       configuration file and the certificate database of CA.
+       OCSP responses are cached in the directory "OCSPCACHE" by the issuer and serial number of certificates, and a
+       cached response is used until its nextUpdate. The cache is shared by all processes on the host.
+       The successful results of verify_cert_key and verify_cert are kept in the directory "VERIFYCACHE" by the content
+       hashes of the key, certificate and chain, until the notAfter of the certificates, or at most "VERIFYTTL" minutes
+       if the revocation status is checked by OCSP or CRL.
+       If "CRL" is set, the revocation status is checked offline against a snapshot of the CRL and the delta CRL
+       "DELTACRL" (see the module revocation), and OCSP server is queried only if the CRL is out of date.
     """
     utl = smit.utils.Utils()
     cert_cnf = 'certcnf'  # path to certificate configuration file
@@ -40,13 +61,15 @@ class CertManager(object):
               'emailAddress': '', 'SK': '', 'CSR': '', 'ECCPARAM': '',
               'SELFSIGN': '', 'CERT': '', 'CERTDB': '', 'CERTS': '',
               'MSG': '', 'SIG': '', 'SIGCERT': '', 'CACHAIN': '', 'OCSP': '', 'MCERT': '',
-              'EXTENSIONS': '', 'OPENSSL_PATH': ''}
+              'EXTENSIONS': '', 'OPENSSL_PATH': '', 'BACKEND': '', 'OCSPCACHE': '', 'VERIFYCACHE': '',
+              'VERIFYTTL': '', 'CRL': '', 'DELTACRL': '', 'CRLINDEX': ''}
 
     def init_config(self, **args):
         """Initialize the package configuration according to the configuration file.
            This function MUST be called before other function call.
            The acceptable keywords are: config, WORKPATH, C, ST, L, O, OU, CN, emailAddress, SK, CSR, ECCPARAM,
-           SELFSIGN, CERT, CERTDB, CERTS, MSG, SIG, SIGCERT, CACHAIN, OCSP, MCERT, EXTENSIONS, OPENSSL_PATH.
+           SELFSIGN, CERT, CERTDB, CERTS, MSG, SIG, SIGCERT, CACHAIN, OCSP, MCERT, EXTENSIONS, OPENSSL_PATH, BACKEND,
+           OCSPCACHE, VERIFYCACHE, VERIFYTTL, CRL, DELTACRL, CRLINDEX.
            Specifically, "config" is to set the path to configuration file.
            If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -90,7 +113,26 @@ class CertManager(object):
         if update > 0:
             self.utl.update_config(self.cert_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.cert_cnf + ' ' + self.config['CN'] + '.certcnf.bck', shell=True)
+        self.utl.backup_file(self.cert_cnf, self.config['CN'] + '.certcnf.bck')
+
+    def in_process(self, operation, *args):
+        """Run an operation of the in-process backend if it is selected by the keyword "BACKEND".
+
+        :param operation: name of the function in the module cryptobackend.
+        :param args: arguments of the function.
+        :type operation: str.
+
+        Return:
+                tuple - (True, result) if the operation is done in process, (False, None) if it should be done by
+                the openssl command line tool.
+        """
+        if str(self.config.get('BACKEND', '')).lower() != 'cryptography':
+            return False, None
+        try:
+            return True, getattr(cryptobackend, operation)(*args)
+        except cryptobackend.Unsupported as e:
+            print ('In-process ' + operation + ' is not supported, use openssl instead: ' + str(e))
+            return False, None
 
     def create_csr(self):
         """Create certificate signing request (CSR) file based on the information of configuration file.
@@ -114,6 +156,8 @@ class CertManager(object):
         path = os.path.dirname(csr_path)
         if path != '':
             self.utl.makedir(path)
+        if self.in_process('create_csr', key_path, csr_path, self.config)[0]:
+            return
         cmd = 'openssl req -new -key ' + key_path + ' -out ' + csr_path + ' -subj "' + \
               '/C=' + self.config.get('C', '') + '/ST=' + self.config.get('ST', '') + '/L=' + \
               self.config.get('L', '') + '/O=' + self.config.get('O', '') + '/OU=' + \
@@ -143,6 +187,8 @@ class CertManager(object):
             path = os.path.dirname(key_path)
             if path != '':
                 self.utl.makedir(path)
+            if self.in_process('create_sk', key_path, self.config['ECCPARAM'])[0]:
+                return
             self.utl.check_call('openssl ecparam -name ' + self.config['ECCPARAM'] + ' -genkey -noout -out ' + key_path,
                                 shell=True)
         except subprocess.CalledProcessError:
@@ -218,6 +264,91 @@ class CertManager(object):
         except:
             raise
 
+    def verify_key(self, operation, paths, extra=''):
+        """Return the key of a verification result in the cache, i.e., the hash of the operation and the content of
+           the files.
+
+        :param operation: name of the verification.
+        :param paths: paths to the verified files.
+        :param extra: other parameters of the verification.
+        :type operation: str.
+        :type paths: list.
+        :type extra: str.
+
+        Return:
+                str - the key, empty if the cache is disabled.
+        """
+        if self.config.get('VERIFYCACHE', '') == '':
+            return ''
+        digest = hashlib.sha256(operation + '\0' + extra)
+        for path in paths:
+            with open(path, 'rb') as f:
+                digest.update('\0' + hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def verified(self, key):
+        """Check if a verification succeeded before and the result is not expired.
+
+        :param key: key of the verification result.
+        :type key: str.
+
+        Return:
+                bool - True if the result is in the cache.
+        """
+        if key == '':
+            return False
+        try:
+            with open(os.path.join(os.path.expanduser(self.config['VERIFYCACHE']), key), 'r') as f:
+                return time.time() < float(f.read())
+        except (IOError, ValueError):
+            return False
+
+    def save_verified(self, key, expiry):
+        """Save a successful verification result in the cache. The cache directory is only accessible by the user,
+           and the result is written to a temporary file and then renamed.
+
+        :param key: key of the verification result.
+        :param expiry: the time (in seconds since the epoch) when the result expires.
+        :type key: str.
+        :type expiry: float.
+        """
+        if key == '' or expiry <= time.time():
+            return
+        cache_path = os.path.expanduser(self.config['VERIFYCACHE'])
+        try:
+            if not os.path.isdir(cache_path):
+                self.utl.makedir(cache_path)
+                os.chmod(cache_path, 0o700)
+            fd, tmp_path = tempfile.mkstemp(prefix='.verify-', dir=cache_path)
+            with os.fdopen(fd, 'w') as f:
+                f.write(repr(expiry))
+            os.rename(tmp_path, os.path.join(cache_path, key))
+        except (IOError, OSError) as e:
+            print ('Verification result is not cached: ' + str(e))
+
+    def not_after(self, paths):
+        """Return the earliest notAfter of the certificates in files.
+
+        :param paths: paths to the certificates.
+        :type paths: list.
+
+        Return:
+                float - the time in seconds since the epoch, 0 if it cannot be read.
+        """
+        times = []
+        for path in paths:
+            try:
+                times.append(calendar.timegm(cryptobackend.not_after(path).utctimetuple()))
+            except cryptobackend.Unsupported:
+                p = subprocess.Popen(['openssl', 'x509', '-noout', '-enddate', '-in', path], stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+                out = p.communicate()[0].strip()
+                try:
+                    times.append(calendar.timegm(time.strptime(out.split('=', 1)[1], '%b %d %H:%M:%S %Y %Z')))
+                except (IndexError, ValueError):
+                    return 0
+        return min(times) if times else 0
+
     def verify_cert_key(self):
         """This function checks the validity of a pair of certificate (CERT) and private key (SK). CERT and SK
         settings can be specified in the configuration file. It raises an error message if the verification failed,
@@ -236,16 +367,23 @@ class CertManager(object):
                 raise Exception('Error: certificate \"' + cert_path + '\" is not a file.')
             if not os.path.isfile(key_path):
                 raise Exception('Error: private key \"' + key_path + '\" is not a file.')
+            cache_key = self.verify_key('verify_cert_key', [cert_path, key_path])
+            if self.verified(cache_key):
+                print ('Certificate and private key pair is valid (cached).')
+                return True
 
-            # Extract public key from the private key.
-            self.utl.check_call('openssl pkey -in ' + key_path + ' -out tmpk1.pem -pubout', shell=True)
-            # Extract public key from the certificate.
-            self.utl.check_call('openssl x509 -pubkey -noout -in ' + cert_path + ' > tmpk2.pem', shell=True)
-            # Compare if two public key are identical.
-            rs = filecmp.cmp('tmpk1.pem', 'tmpk2.pem')
-            self.utl.call('rm tmpk1.pem tmpk2.pem', shell=True)
+            done, rs = self.in_process('verify_cert_key', cert_path, key_path)
+            if not done:
+                # Extract public key from the private key.
+                self.utl.check_call('openssl pkey -in ' + key_path + ' -out tmpk1.pem -pubout', shell=True)
+                # Extract public key from the certificate.
+                self.utl.check_call('openssl x509 -pubkey -noout -in ' + cert_path + ' > tmpk2.pem', shell=True)
+                # Compare if two public key are identical.
+                rs = filecmp.cmp('tmpk1.pem', 'tmpk2.pem')
+                self.utl.call('rm tmpk1.pem tmpk2.pem', shell=True)
             if rs:
                 print ('Certificate and private key pair is valid.')
+                self.save_verified(cache_key, self.not_after([cert_path]))
                 return True
             else:
                 raise Exception('Certificate and private key pair is invalid.')
@@ -335,6 +473,8 @@ class CertManager(object):
             if not os.path.isfile(key_path):
                 raise Exception('Error: private key \"' + key_path + '\" is not a file.')
             # Generate a signature and output it to SIG
+            if self.in_process('gen_sig', key_path, msg_path, sig_path)[0]:
+                return
             self.utl.check_call('openssl dgst -sha256 -sign ' + key_path + ' -out ' + sig_path + ' ' + msg_path,
                                 shell=True)
         except subprocess.CalledProcessError:
@@ -349,11 +489,13 @@ class CertManager(object):
         Return:
 
             True -- signature is valid.
-            error -- otherwise, error may be raised.
+            False -- signature is invalid, by either backend.
+            error -- otherwise, e.g., the files or the signer's certificate are invalid.
         """
         msg_path = os.path.expanduser(self.config.get('MSG', ''))
         sig_path = os.path.expanduser(self.config.get('SIG', ''))
         cert_path = os.path.expanduser(self.config.get('SIGCERT', ''))
+        pubkey_path = None
         try:
             # Check if the paths to MSG, SIG and SIGNER-CERT files are valid.
             if not os.path.isfile(msg_path):
@@ -367,40 +509,218 @@ class CertManager(object):
             if not os.path.isfile(cert_path):
                 raise Exception('Error: signer\'s certificate \"' + cert_path + '\" is not a file.')
 
-            # Extract public key from the signer's certificate (SIGNER-CERT).
-            self.utl.check_call('openssl x509 -pubkey -noout -in ' + cert_path + ' > tmpk.pem', shell=True)
+            done, valid = self.in_process('verify_sig', cert_path, msg_path, sig_path)
+            if done:
+                if not valid:
+                    print ('Error: signature verification failed. Please check if message file \"' + msg_path +
+                           '\" and signatre file \"' + sig_path +
+                           '\" are a pair, and if the used signer\'s certificate \"' + cert_path + '\" is correct.')
+                    return False
+                print ('Signature is valid.')
+                return True
+            # Extract public key from the signer's certificate (SIGNER-CERT) into a temporary file next to the
+            # signature, so that concurrent verifications do not share the file.
+            fd, pubkey_path = tempfile.mkstemp(suffix='.pem', dir=os.path.dirname(os.path.abspath(sig_path)))
+            os.close(fd)
+            self.utl.check_call('openssl x509 -pubkey -noout -in ' + cert_path + ' > ' + pubkey_path, shell=True)
             # Verify the signature
-            self.utl.check_call('openssl dgst -sha256 -verify tmpk.pem -signature ' + sig_path + ' ' + msg_path,
-                                shell=True)
+            self.utl.check_call('openssl dgst -sha256 -verify ' + pubkey_path + ' -signature ' + sig_path + ' ' +
+                                msg_path, shell=True)
             print ('Signature is valid.')
             return True
         except subprocess.CalledProcessError as cpe:
             if str(cpe.cmd).find('-pubkey') != -1:  # Certificate SIGNER-CERT is invalid.
                 print ('Error: signature verificate faild. Signer\'s certificate \"' + cert_path + '\" is invalid.')
                 raise
-            if str(cpe.cmd).find('-verify') != -1:  # Signature verification failed.
+            if str(cpe.cmd).find('-verify') != -1:  # Signature verification failed, as in the in-process backend.
                 print ('Error: signature verification failed. Please check if message file \"' + msg_path +
                        '\" and signatre file \"' + sig_path +
                        '\" are a pair, and if the used signer\'s certificate \"' + cert_path + '\" is correct.')
-                raise
+                return False
+            raise
         except Exception as e:
             print (e)
             raise
+        finally:
+            if pubkey_path is not None and os.path.isfile(pubkey_path):
+                os.remove(pubkey_path)
+
+    def ocsp_cache_path(self, cert_path):
+        """Return the path to the cached OCSP response of a certificate, which is named by the issuer and the serial
+           number of the certificate.
 
-    def verify_cert(self, cert_chain, cert, ocsp):
+        :param cert_path: path to the certificate.
+        :type cert_path: str.
+
+        Return:
+                str - the path, empty if the cache is disabled or the certificate cannot be read.
+        """
+        cache_path = os.path.expanduser(self.config.get('OCSPCACHE', ''))
+        if cache_path == '':
+            return ''
+        try:
+            issuer, serial = cryptobackend.ocsp_key(cert_path)
+        except cryptobackend.Unsupported:
+            # the same key as cryptobackend.ocsp_key, so that both backends share the cached responses.
+            p = subprocess.Popen(['openssl', 'x509', '-outform', 'DER', '-in', cert_path], stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            der = p.communicate()[0]
+            if p.returncode != 0:
+                return ''
+            try:
+                issuer, serial = responder.issuer_serial(der)
+            except (ValueError, IndexError):
+                return ''
+            issuer, serial = hashlib.sha1(issuer).hexdigest(), '%X' % serial
+        return os.path.join(cache_path, issuer + '-' + serial + '.der')
+
+    def ocsp_check(self, chain_path, cert_path, resp_path):
+        """Return the status of a certificate in a stored OCSP response, e.g., a cached or stapled response.
+           The response is checked in process if the cryptography library is installed, otherwise by openssl.
+
+        :param chain_path: path to CA chain.
+        :param cert_path: path to the certificate.
+        :param resp_path: path to the OCSP response in DER.
+        :type chain_path: str.
+        :type cert_path: str.
+        :type resp_path: str.
+
+        Return:
+                str - "good", "revoked" or "unknown", None if the response is missing, invalid or out of date.
+        """
+        if resp_path == '' or not os.path.isfile(resp_path):
+            return None
+        try:
+            with open(resp_path, 'rb') as f:
+                result = cryptobackend.ocsp_status(chain_path, cert_path, f.read())
+            return result[0] if result is not None else None
+        except cryptobackend.Unsupported:
+            pass
+        except IOError:
+            return None
+        p = subprocess.Popen(['openssl', 'ocsp', '-respin', resp_path, '-CAfile', chain_path, '-issuer', chain_path,
+                              '-cert', cert_path], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        out, err = p.communicate()
+        if p.returncode != 0 or err.lower().find('error') != -1 or (out + err).find('Status times invalid') != -1 or \
+                out.find('Next Update') == -1:
+            return None
+        for status in ('revoked', 'good', 'unknown'):
+            if out.find(': ' + status) != -1:
+                return status
+        return None
+
+    def ocsp_query(self, chain_path, cert_path, ocsp, resp_path=''):
+        """Query the status of a certificate from OCSP server, and save the response if a path is given.
+           The response is written to a temporary file and then renamed, so that other processes never read a
+           partial response.
+
+        :param chain_path: path to CA chain.
+        :param cert_path: path to the certificate.
+        :param ocsp: URL of OCSP server.
+        :param resp_path: path to save the OCSP response in DER, empty not to save it.
+        :type chain_path: str.
+        :type cert_path: str.
+        :type ocsp: str.
+        :type resp_path: str.
+
+        Return:
+                str - "revoked" if the certificate was revoked, otherwise "good".
+        """
+        cmd = ['openssl', 'ocsp', '-CAfile', chain_path, '-issuer', chain_path, '-cert', cert_path, '-url', ocsp,
+               '-resp_text']
+        tmp_path = ''
+        if resp_path != '':
+            try:
+                self.utl.makedir(os.path.dirname(resp_path))
+                fd, tmp_path = tempfile.mkstemp(prefix='.ocsp-', dir=os.path.dirname(resp_path))
+                os.close(fd)
+                cmd += ['-respout', tmp_path]
+            except (IOError, OSError):
+                tmp_path = ''  # the cache is not writable, query without caching.
+        try:
+            p = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+            out, err = p.communicate()
+            if err.lower().find('error') != -1:
+                raise RuntimeError(err)
+            if tmp_path != '' and os.path.getsize(tmp_path) > 0:
+                os.rename(tmp_path, resp_path)
+                tmp_path = ''
+        finally:
+            if tmp_path != '' and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return 'revoked' if out.find('revoked') != -1 else 'good'
+
+    def crl_status(self, chain_path, cert_path):
+        """Return the status of a certificate in the snapshot of CRLs, which is rebuilt when the CRL files change.
+
+        :param chain_path: path to CA chain.
+        :param cert_path: path to the certificate.
+        :type chain_path: str.
+        :type cert_path: str.
+
+        Return:
+                str - "good" or "revoked", None if no current CRL of the issuer is available.
+        """
+        crl_path = os.path.expanduser(self.config.get('CRL', ''))
+        if crl_path == '' or not os.path.isfile(crl_path):
+            return None
+        index_path = os.path.expanduser(self.config.get('CRLINDEX', '') or crl_path + '.idx')
+        try:
+            snapshot = revocation.snapshot(chain_path, crl_path, os.path.expanduser(self.config.get('DELTACRL', '')),
+                                           index_path)
+            issuer, serial = cryptobackend.ocsp_key(cert_path)
+            if not snapshot.current() or snapshot.issuer_hash.encode('hex') != issuer:
+                return None
+            return 'revoked' if snapshot.lookup(int(serial, 16)) is not None else 'good'
+        except (cryptobackend.Unsupported, ValueError, IOError, OSError) as e:
+            print ('CRL is not used: ' + str(e))
+            return None
+
+    def ocsp_response(self, cert_chain, cert, ocsp, resp_path=''):
+        """Return the path to a current OCSP response of a certificate, which is queried from OCSP server if the stored
+           one is missing or out of date. It can be stapled to the certificate, e.g., in DTLS handshakes (see "STAPLE"
+           of DtlsWrap), so that peers do not query OCSP server.
+
+        :param cert_chain: path to CA chain.
+        :param cert: path to the certificate.
+        :param ocsp: URL of OCSP server.
+        :param resp_path: path to store the OCSP response, empty to use the cache "OCSPCACHE".
+        :type cert_chain: str.
+        :type cert: str.
+        :type ocsp: str.
+        :type resp_path: str.
+
+        Return:
+                str - path to the OCSP response, empty if it is not available.
+        """
+        chain_path = os.path.expanduser(cert_chain)
+        cert_path = os.path.expanduser(cert)
+        resp_path = os.path.expanduser(resp_path) if resp_path != '' else self.ocsp_cache_path(cert_path)
+        if resp_path == '':
+            return ''
+        if self.ocsp_check(chain_path, cert_path, resp_path) is None and ocsp != '':
+            self.ocsp_query(chain_path, cert_path, ocsp, resp_path)
+        return resp_path if os.path.isfile(resp_path) else ''
+
+    def verify_cert(self, cert_chain, cert, ocsp, staple=''):
         """This function verifies a certificate according to the given certificate chain.
+           The revocation status is taken from the snapshot of CRL, the stapled OCSP response, or the cached
+           response, and OCSP server is queried only if none of them is current.
 
         :param cert_chain: path to CA chain.
         :param cert: path to certificate.
         :param ocsp: URL of OCSP server.
+        :param staple: path to an OCSP response of the certificate received from its owner.
         :type cert_chain: str.
         :type cert: str.
         :type ocsp: str.
+        :type staple: str.
 
         Return:
 
             True -- verification succeeds
-            False/error -- otherwise, false or error may be raised.
+            False -- the certificate is revoked or not authenticated by the valid CA, by either backend.
+            error -- otherwise, e.g., the files are invalid.
         """
         chain_path = os.path.expanduser(cert_chain)  # os.path.expanduser(self.config.get('CACHAIN',''))
         cert_path = os.path.expanduser(cert)  # os.path.expanduser(self.config.get('CERT',''))
@@ -409,26 +729,45 @@ class CertManager(object):
                 raise IOError('Path \"' + cert_path + '\" to the certificate is invalid or it is not a file.')
             if not os.path.isfile(chain_path):
                 raise IOError('Path \"' + chain_path + '\" to CA certificate chain is invalid or it is not a file.')
+            # the stapled response is part of the key, so that a new response (e.g., revoked) is always checked.
+            staple_path = os.path.expanduser(staple)
+            paths = [chain_path, cert_path] + ([staple_path] if staple != '' and os.path.isfile(staple_path) else [])
+            cache_key = self.verify_key('verify_cert', paths, ocsp + '\0' + self.config.get('CRL', ''))
+            if self.verified(cache_key):
+                print ('Certificate verified (cached).')
+                return True
 
             # cmd to verify certificate chain and certificate
-            if ocsp != '':
-                # OCSP server is set and then check if certificate was revoked.
-                p = subprocess.Popen(
-                    ['openssl', 'ocsp', '-CAfile', chain_path, '-issuer', chain_path, '-cert', cert_path, '-url',
-                     ocsp, '-resp_text'], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-                out, err = p.communicate()
-                if err.lower().find('error') != -1:
-                    raise RuntimeError(err)
-                if out.find('revoked') != -1:
-                    print ('Invalid certificate: ' + self.config['CERT'] + ' was revoked.')
-                    return False
-            self.utl.check_call('openssl verify -verbose -CAfile ' + chain_path + ' ' + cert_path, shell=True)
+            status = self.crl_status(chain_path, cert_path)
+            if status is None and (ocsp != '' or staple != ''):
+                # OCSP server or response is set and then check if certificate was revoked.
+                status = self.ocsp_check(chain_path, cert_path, staple_path)
+                if status is None and ocsp != '':
+                    resp_path = self.ocsp_cache_path(cert_path)
+                    status = self.ocsp_check(chain_path, cert_path, resp_path)
+                    if status is None:
+                        status = self.ocsp_query(chain_path, cert_path, ocsp, resp_path)
+            if status == 'revoked':
+                print ('Invalid certificate: ' + self.config['CERT'] + ' was revoked.')
+                return False
+            done, reason = self.in_process('verify_cert', chain_path, cert_path)
+            if done and reason is not None:
+                print ('Error: certificate verification failed because the certificate is not authenticated by the '
+                       'valid CA: ' + reason)
+                return False
+            if not done:
+                self.utl.check_call('openssl verify -verbose -CAfile ' + chain_path + ' ' + cert_path, shell=True)
             print ('Certificate verified.')
+            expiry = self.not_after([chain_path, cert_path])
+            if ocsp != '' or staple != '' or self.config.get('CRL', '') != '':
+                ttl = self.config.get('VERIFYTTL', '')
+                expiry = min(expiry, time.time() + 60 * (float(ttl) if ttl != '' else VERIFY_TTL))
+            self.save_verified(cache_key, expiry)
             return True
-        except subprocess.CalledProcessError:
+        except subprocess.CalledProcessError:  # "openssl verify" failed, as in the in-process backend.
             print (
                 'Error: certificate verification failed because the certificate is not authenticated by the valid CA.')
-            raise
+            return False
         except IOError as ioe:
             print (ioe)
             raise
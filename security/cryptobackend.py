@@ -0,0 +1,478 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+In-process backend of the certificate manager, based on the "cryptography" library. It implements the operations
+which do not need the openssl configuration file or the certificate database of CA: private keys, CSRs, signatures
+and the verification of certificates against a CA chain. The files are in the same formats as the ones written by the
+openssl command line tool, so that both backends can be mixed.
+
+Every function raises Unsupported when the library is not installed or the keys and certificates cannot be handled by
+it (e.g., IBIHOP keys of the patched OpenSSL), so that the certificate manager can fall back to the command line tool.
+'''
+
+import hashlib
+import datetime
+
+try:
+    from cryptography import x509
+    from cryptography.x509 import ocsp
+    from cryptography.x509.oid import NameOID
+    from cryptography.x509.oid import ExtendedKeyUsageOID
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.asymmetric import padding
+    AVAILABLE = True
+
+    # name of curve in "openssl ecparam" -> curve of cryptography
+    CURVES = {'prime192v1': ec.SECP192R1, 'secp192r1': ec.SECP192R1, 'secp224r1': ec.SECP224R1,
+              'prime256v1': ec.SECP256R1, 'secp256r1': ec.SECP256R1, 'secp256k1': ec.SECP256K1,
+              'secp384r1': ec.SECP384R1, 'secp521r1': ec.SECP521R1, 'sect163k1': ec.SECT163K1,
+              'sect163r2': ec.SECT163R2, 'sect233k1': ec.SECT233K1, 'sect233r1': ec.SECT233R1,
+              'sect283k1': ec.SECT283K1, 'sect283r1': ec.SECT283R1, 'sect409k1': ec.SECT409K1,
+              'sect409r1': ec.SECT409R1, 'sect571k1': ec.SECT571K1, 'sect571r1': ec.SECT571R1,
+              'brainpoolP256r1': ec.BrainpoolP256R1, 'brainpoolP384r1': ec.BrainpoolP384R1,
+              'brainpoolP512r1': ec.BrainpoolP512R1}
+except ImportError:
+    AVAILABLE = False
+    CURVES = {}
+
+# configuration keyword of the subject -> name of the attribute in cryptography.x509.oid.NameOID, in the order of the
+# subject written by "openssl req"
+SUBJECT = [('C', 'COUNTRY_NAME'), ('ST', 'STATE_OR_PROVINCE_NAME'), ('L', 'LOCALITY_NAME'), ('O', 'ORGANIZATION_NAME'),
+           ('OU', 'ORGANIZATIONAL_UNIT_NAME'), ('CN', 'COMMON_NAME'), ('emailAddress', 'EMAIL_ADDRESS')]
+MAX_CHAIN = 10  # the max length of certificate chain
+CLOCK_SKEW = datetime.timedelta(minutes=5)  # the tolerance of thisUpdate of OCSP responses in the future
+
+
+class Unsupported(Exception):
+    """The operation is not supported by this backend and should be done by the openssl command line tool.
+    """
+    pass
+
+
+def check():
+    """Raise Unsupported if the cryptography library is not installed.
+    """
+    if not AVAILABLE:
+        raise Unsupported('the cryptography library is not installed.')
+
+
+def read(path):
+    """Return the content of a file.
+
+    :param path: path to the file.
+    :type path: str.
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write(data, path):
+    """Write data to a file.
+
+    :param data: content of the file.
+    :param path: path to the file.
+    :type data: str.
+    :type path: str.
+    """
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def load_key(path):
+    """Load a private key in PEM format.
+
+    :param path: path to the private key.
+    :type path: str.
+
+    Return:
+            the private key.
+    """
+    check()
+    try:
+        return serialization.load_pem_private_key(read(path), password=None, backend=default_backend())
+    except (ValueError, TypeError, UnsupportedAlgorithm) as e:
+        raise Unsupported('cannot load private key \"' + path + '\": ' + str(e))
+
+
+def load_certs(path):
+    """Load the certificates in a PEM file, e.g., a CA chain.
+
+    :param path: path to the certificates.
+    :type path: str.
+
+    Return:
+            list - the certificates.
+    """
+    check()
+    data = read(path)
+    end = '-----END CERTIFICATE-----'
+    certs = []
+    try:
+        for block in data.split(end)[:-1]:
+            certs.append(x509.load_pem_x509_certificate(block.strip() + '\n' + end + '\n', default_backend()))
+    except (ValueError, UnsupportedAlgorithm) as e:
+        raise Unsupported('cannot load certificate \"' + path + '\": ' + str(e))
+    if not certs:
+        raise Unsupported('no certificate is found in \"' + path + '\".')
+    return certs
+
+
+def load_cert_der(path):
+    """Load the first certificate in a PEM file in DER format.
+
+    :param path: path to the certificate.
+    :type path: str.
+
+    Return:
+            str - the certificate in DER.
+    """
+    return load_certs(path)[0].public_bytes(serialization.Encoding.DER)
+
+
+def create_sk(path, curve):
+    """Create an ECC private key, in the same format as "openssl ecparam -genkey -noout".
+
+    :param path: path to the private key.
+    :param curve: name of the curve, e.g., secp256k1.
+    :type path: str.
+    :type curve: str.
+    """
+    check()
+    curve_type = CURVES.get(curve)
+    if curve_type is None:
+        raise Unsupported('curve \"' + curve + '\" is not supported.')
+    key = ec.generate_private_key(curve_type(), default_backend())
+    write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                            serialization.NoEncryption()), path)
+
+
+def create_csr(key_path, csr_path, subject):
+    """Create a CSR signed with SHA256, in the same format as "openssl req -new". Empty subject fields are skipped.
+
+    :param key_path: path to the private key.
+    :param csr_path: path to the CSR.
+    :param subject: configuration including the subject fields C, ST, L, O, OU, CN and emailAddress.
+    :type key_path: str.
+    :type csr_path: str.
+    :type subject: dict.
+    """
+    key = load_key(key_path)
+    name = x509.Name([x509.NameAttribute(getattr(NameOID, oid), unicode(subject[field]))
+                      for field, oid in SUBJECT if subject.get(field, '')])
+    try:
+        csr = x509.CertificateSigningRequestBuilder().subject_name(name).sign(key, hashes.SHA256(), default_backend())
+    except (ValueError, TypeError, UnsupportedAlgorithm) as e:
+        raise Unsupported('cannot sign CSR: ' + str(e))
+    write(csr.public_bytes(serialization.Encoding.PEM), csr_path)
+
+
+def sign(key, data, algorithm):
+    """Sign data with a private key, in the same format as "openssl dgst -sign".
+
+    :param key: the private key.
+    :param data: data to sign.
+    :param algorithm: hash algorithm.
+
+    Return:
+            str - the signature.
+    """
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return key.sign(data, ec.ECDSA(algorithm))
+    if isinstance(key, rsa.RSAPrivateKey):
+        return key.sign(data, padding.PKCS1v15(), algorithm)
+    raise Unsupported('the type of private key is not supported.')
+
+
+def verify(public_key, signature, data, algorithm):
+    """Verify a signature.
+
+    :param public_key: the public key.
+    :param signature: the signature.
+    :param data: signed data.
+    :param algorithm: hash algorithm.
+
+    Return:
+            bool - True if the signature is valid.
+    """
+    try:
+        if isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, data, ec.ECDSA(algorithm))
+        elif isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, data, padding.PKCS1v15(), algorithm)
+        else:
+            raise Unsupported('the type of public key is not supported.')
+    except InvalidSignature:
+        return False
+    return True
+
+
+def gen_sig(key_path, msg_path, sig_path):
+    """Sign a message file with SHA256, the same as "openssl dgst -sha256 -sign".
+
+    :param key_path: path to the private key.
+    :param msg_path: path to the message file.
+    :param sig_path: path to the signature file.
+    :type key_path: str.
+    :type msg_path: str.
+    :type sig_path: str.
+    """
+    write(sign(load_key(key_path), read(msg_path), hashes.SHA256()), sig_path)
+
+
+def verify_sig(cert_path, msg_path, sig_path):
+    """Verify the signature of a message file with the public key of a certificate, the same as
+       "openssl dgst -sha256 -verify".
+
+    :param cert_path: path to the certificate of signer.
+    :param msg_path: path to the message file.
+    :param sig_path: path to the signature file.
+    :type cert_path: str.
+    :type msg_path: str.
+    :type sig_path: str.
+
+    Return:
+            bool - True if the signature is valid.
+    """
+    cert = load_certs(cert_path)[0]
+    return verify(cert.public_key(), read(sig_path), read(msg_path), hashes.SHA256())
+
+
+def public_bytes(public_key):
+    """Return the DER encoding of a public key.
+    """
+    return public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def verify_cert_key(cert_path, key_path):
+    """Check if a private key is the key of a certificate.
+
+    :param cert_path: path to the certificate.
+    :param key_path: path to the private key.
+    :type cert_path: str.
+    :type key_path: str.
+
+    Return:
+            bool - True if they are a pair.
+    """
+    return public_bytes(load_certs(cert_path)[0].public_key()) == public_bytes(load_key(key_path).public_key())
+
+
+def ca_failure(issuer):
+    """Check if a certificate may issue certificates: its basicConstraints must allow it, and its keyUsage, if any,
+       must include keyCertSign. Only a self-signed v1 certificate, which has no extensions, is accepted without
+       basicConstraints.
+
+    :param issuer: the certificate of issuer.
+    :type issuer: cryptography.x509.Certificate.
+
+    Return:
+            str - None if it is a CA, otherwise the reason.
+    """
+    if issuer.version == x509.Version.v1:
+        return None if issuer.subject == issuer.issuer else 'is a v1 certificate which is not self-signed'
+    try:
+        if not issuer.extensions.get_extension_for_class(x509.BasicConstraints).value.ca:
+            return 'is not a CA'
+    except x509.ExtensionNotFound:
+        return 'has no basicConstraints'
+    try:
+        if not issuer.extensions.get_extension_for_class(x509.KeyUsage).value.key_cert_sign:
+            return 'may not sign certificates'
+    except x509.ExtensionNotFound:
+        pass
+    return None
+
+
+def verify_path(chain, cert, now, depth):
+    """Verify a certificate up to a self-signed certificate in a CA chain. Every certificate in the chain with the
+       subject of the issuer is tried, until one of them verifies.
+
+    :param chain: the CA chain.
+    :param cert: the certificate.
+    :param now: the time of verification.
+    :param depth: the depth of the certificate, it is 0 for the leaf certificate.
+    :type chain: list.
+    :type cert: cryptography.x509.Certificate.
+    :type now: datetime.datetime.
+    :type depth: int.
+
+    Return:
+            str - None if the certificate is valid, otherwise the reason of failure.
+    """
+    if depth >= MAX_CHAIN:
+        return 'certificate chain is too long.'
+    if not cert.not_valid_before <= now <= cert.not_valid_after:
+        return 'certificate at depth ' + str(depth) + ' is not in its validity period.'
+    if cert.signature_hash_algorithm is None:
+        raise Unsupported('the signature algorithm of certificate is not supported.')
+    reason = 'unable to get issuer certificate at depth ' + str(depth) + '.'
+    for issuer in [c for c in chain if c.subject == cert.issuer]:
+        failure = ca_failure(issuer)
+        if failure is not None:
+            reason = 'issuer at depth ' + str(depth + 1) + ' ' + failure + '.'
+            continue
+        if not verify(issuer.public_key(), cert.signature, cert.tbs_certificate_bytes,
+                      cert.signature_hash_algorithm):
+            reason = 'certificate signature failure at depth ' + str(depth) + '.'
+            continue
+        if issuer.subject == issuer.issuer:  # reached a trusted root in the chain.
+            if not issuer.not_valid_before <= now <= issuer.not_valid_after:
+                reason = 'root certificate is not in its validity period.'
+                continue
+            return None
+        reason = verify_path(chain, issuer, now, depth + 1)
+        if reason is None:
+            return None
+    return reason
+
+
+def verify_cert(chain_path, cert_path, now=None):
+    """Verify a certificate against a CA chain: each certificate up to a self-signed certificate in the chain must be
+       in its validity period and signed by its issuer, which must be a CA (see ca_failure).
+
+    :param chain_path: path to the CA chain.
+    :param cert_path: path to the certificate.
+    :param now: the time of verification, the current UTC time if it is None.
+    :type chain_path: str.
+    :type cert_path: str.
+    :type now: datetime.datetime.
+
+    Return:
+            str - None if the certificate is valid, otherwise the reason of failure.
+    """
+    return verify_path(load_certs(chain_path), load_certs(cert_path)[0], now or datetime.datetime.utcnow(), 0)
+
+
+def not_after(path):
+    """Return the earliest notAfter of the certificates in a file, e.g., a CA chain.
+
+    :param path: path to the certificates.
+    :type path: str.
+
+    Return:
+            datetime.datetime - the time in UTC.
+    """
+    return min(cert.not_valid_after for cert in load_certs(path))
+
+
+def ocsp_key(cert_path):
+    """Return the key of a certificate in the cache of OCSP responses.
+
+    :param cert_path: path to the certificate.
+    :type cert_path: str.
+
+    Return:
+            tuple - (SHA1 of the issuer name in hex, serial number in hex).
+    """
+    cert = load_certs(cert_path)[0]
+    return hashlib.sha1(cert.issuer.public_bytes(default_backend())).hexdigest(), '%X' % cert.serial_number
+
+
+def key_bits(public_key):
+    """Return the content of the subjectPublicKey bit string of a public key, which is hashed in the CertID of OCSP.
+    """
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.PKCS1)
+    raise Unsupported('the type of public key is not supported.')
+
+
+def ocsp_signer(issuer, response):
+    """Return the certificate which signed an OCSP response: the issuer of the certificate, or a certificate in the
+       response which is issued by it for OCSP signing.
+
+    :param issuer: the issuer of the certificate in the response.
+    :param response: the OCSP response.
+
+    Return:
+            the signer's certificate, None if the response is not signed by an authorized responder.
+    """
+    for signer in [issuer] + list(response.certificates):
+        if signer != issuer:
+            if signer.issuer != issuer.subject or not verify(issuer.public_key(), signer.signature,
+                                                             signer.tbs_certificate_bytes,
+                                                             signer.signature_hash_algorithm):
+                continue
+            try:
+                usage = signer.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value
+            except x509.ExtensionNotFound:
+                continue
+            if ExtendedKeyUsageOID.OCSP_SIGNING not in usage:
+                continue
+        if verify(signer.public_key(), response.signature, response.tbs_response_bytes,
+                  response.signature_hash_algorithm):
+            return signer
+    return None
+
+
+def ocsp_status(chain_path, cert_path, data, now=None):
+    """Check an OCSP response of a certificate in DER format, e.g., a cached or stapled response. The response must be
+       about the certificate, signed by its issuer in the chain or a responder authorized by the issuer, and current,
+       i.e., now is between thisUpdate and nextUpdate.
+
+    :param chain_path: path to the CA chain.
+    :param cert_path: path to the certificate.
+    :param data: the OCSP response.
+    :param now: the time of check, the current UTC time if it is None.
+    :type chain_path: str.
+    :type cert_path: str.
+    :type data: str.
+    :type now: datetime.datetime.
+
+    Return:
+            tuple - (status, nextUpdate), where status is "good", "revoked" or "unknown", None if the response is not
+            valid for the certificate or it is not current.
+    """
+    chain = load_certs(chain_path)
+    cert = load_certs(cert_path)[0]
+    now = now or datetime.datetime.utcnow()
+    try:
+        response = ocsp.load_der_ocsp_response(data)
+        if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+            return None
+        algorithm = response.hash_algorithm.name
+        serial = response.serial_number
+    except (ValueError, UnsupportedAlgorithm) as e:
+        raise Unsupported('cannot load OCSP response: ' + str(e))
+    issuers = [c for c in chain if c.subject == cert.issuer]
+    if not issuers or serial != cert.serial_number:
+        return None
+    issuer = issuers[0]
+    try:
+        name_hash = hashlib.new(algorithm, issuer.subject.public_bytes(default_backend())).digest()
+        key_hash = hashlib.new(algorithm, key_bits(issuer.public_key())).digest()
+    except ValueError as e:
+        raise Unsupported('hash algorithm of OCSP response is not supported: ' + str(e))
+    if response.issuer_name_hash != name_hash or response.issuer_key_hash != key_hash:
+        return None
+    if response.next_update is None or not response.this_update - CLOCK_SKEW <= now <= response.next_update:
+        return None
+    if ocsp_signer(issuer, response) is None:
+        return None
+    return response.certificate_status.name.lower(), response.next_update
@@ -0,0 +1,397 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Handshake benchmark of DTLS cipher suites. For every cipher list, a client and a server (DtlsWrap, in one process)
+run N handshakes over loopback UDP through a relay, which counts the datagrams and bytes in both directions and the
+flights of the handshake. The benchmark reports the distribution of handshake latency (measured by the client), the
+CPU time of client and server, the bytes on the wire and the round trips of every cipher list, and writes them in JSON
+so that the results can be compared between builds.
+
+The configuration files of client and server are in the format of "dtlscnf" (SK, CERT, CACERT, CERT_REQS). The cipher
+list under test overrides "CIPHERS" of both sides, and session resumption is disabled unless "-resume" is given.
+
+Usage: python dtlsbench.py -clientcnf client_dtlscnf -servercnf server_dtlscnf -n 100
+       [-ciphers IBIHOP-AES256-SHA ECDHE-ECDSA-AES256-SHA] [-out bench.json]
+'''
+
+import os
+import sys
+import ssl
+import time
+import json
+import socket
+import select
+import argparse
+import resource
+import threading
+import Queue
+
+sys.path.insert(0, '..')
+import DTLSWrap
+
+HOST = '::1'
+CIPHERS = ['IBIHOP-AES256-SHA', 'ECDHE-ECDSA-AES256-SHA', 'ECDHE-ECDSA-AES128-GCM-SHA256']  # default cipher lists
+PERCENTILES = [50, 90, 99]  # percentiles of handshake latency in the report
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1)  # resource usage of the calling thread, Linux only
+TIMEOUT = 10.0  # the max time (in seconds) of a handshake
+
+
+def thread_cpu():
+    """Return the CPU time (user and system) of the calling thread in seconds.
+    """
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(samples, p):
+    """Return a percentile of samples by linear interpolation.
+
+    :param samples: sorted samples.
+    :param p: percentile in [0, 100].
+    :type samples: list.
+    :type p: float.
+    """
+    if not samples:
+        return None
+    rank = (len(samples) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+
+def distribution(samples, scale=1000.0):
+    """Return the distribution of samples, in milliseconds by default.
+
+    :param samples: samples in seconds.
+    :param scale: the factor to scale samples.
+    :type samples: list.
+    :type scale: float.
+
+    Return:
+            dict - mean, min, max and percentiles, empty if there is no sample.
+    """
+    if not samples:
+        return {}
+    samples = sorted(s * scale for s in samples)
+    result = {'mean': sum(samples) / len(samples), 'min': samples[0], 'max': samples[-1]}
+    for p in PERCENTILES:
+        result['p' + str(p)] = percentile(samples, p)
+    return result
+
+
+class UdpRelay(object):
+    """
+    This class forwards datagrams between clients and a server on the loopback interface and traces the datagrams of
+    the current handshake. Each client address is forwarded from its own socket, so that the server sees a new peer
+    for every client.
+    """
+    WAIT_TIME = 0.1  # the max time (in seconds) to wait for datagrams before closing the forgotten sockets
+
+    def __init__(self, server_addr, host=HOST):
+        """Constructor initializes variables
+
+        :param server_addr: address of the server.
+        :param host: address to bind the relay sockets.
+        :type server_addr: tuple.
+        :type host: str.
+        """
+        self.host = host
+        self.server_addr = server_addr
+        self.front = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self.front.bind((host, 0))
+        self.address = self.front.getsockname()[:2]
+        self.backs = {}  # client address -> socket forwarding the datagrams of the client
+        self.clients = {}  # socket -> client address
+        self.forgotten = Queue.Queue()  # client addresses whose sockets are to be closed
+        self.trace = []  # datagrams of the current handshake: (direction, bytes), 0 is client to server
+        self.running = True
+
+    def reset(self):
+        """Start tracing a new handshake.
+        """
+        self.trace = []
+
+    def forget(self, addr):
+        """Close the socket forwarding the datagrams of a client.
+
+        :param addr: client address.
+        :type addr: tuple.
+        """
+        self.forgotten.put(addr[:2])
+
+    def summary(self):
+        """Return the traffic of the current handshake.
+
+        Return:
+                dict - bytes and datagrams in both directions, flights and round trips.
+        """
+        trace = list(self.trace)
+        flights = sum(1 for i, (direction, size) in enumerate(trace) if i == 0 or direction != trace[i - 1][0])
+        return {'bytes_c2s': sum(size for direction, size in trace if direction == 0),
+                'bytes_s2c': sum(size for direction, size in trace if direction == 1),
+                'datagrams_c2s': sum(1 for direction, size in trace if direction == 0),
+                'datagrams_s2c': sum(1 for direction, size in trace if direction == 1),
+                'flights': flights, 'round_trips': (flights + 1) // 2}
+
+    def run(self):
+        """Forward datagrams until the relay is stopped.
+        """
+        while self.running:
+            while not self.forgotten.empty():
+                sock = self.backs.pop(self.forgotten.get(), None)
+                if sock is not None:
+                    del self.clients[sock]
+                    sock.close()
+            readable, writable, errors = select.select([self.front] + self.clients.keys(), [], [], self.WAIT_TIME)
+            for sock in readable:
+                data, addr = sock.recvfrom(65535)
+                if sock is self.front:
+                    back = self.backs.get(addr[:2])
+                    if back is None:
+                        back = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                        back.bind((self.host, 0))
+                        self.backs[addr[:2]] = back
+                        self.clients[back] = addr[:2]
+                    back.sendto(data, self.server_addr)
+                    self.trace.append((0, len(data)))
+                else:
+                    self.front.sendto(data, self.clients[sock])
+                    self.trace.append((1, len(data)))
+
+    def start(self):
+        """Start the relay in a daemon thread.
+        """
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop the relay and close its sockets.
+        """
+        self.running = False
+        time.sleep(self.WAIT_TIME * 2)
+        for sock in [self.front] + self.clients.keys():
+            sock.close()
+
+
+class HandshakeBench(object):
+    """
+    This class runs the handshake benchmark of cipher lists.
+    """
+
+    def __init__(self, client_cnf, server_cnf, resume=False):
+        """Constructor reads the configuration of client and server.
+
+        :param client_cnf: path to the DTLS configuration file of client.
+        :param server_cnf: path to the DTLS configuration file of server.
+        :param resume: True to resume the session of the previous handshake.
+        :type client_cnf: str.
+        :type server_cnf: str.
+        :type resume: bool.
+        """
+        self.client = DTLSWrap.DtlsWrap()
+        self.client.init_config(config=client_cnf)
+        self.server = DTLSWrap.DtlsWrap()
+        self.server.init_config(config=server_cnf)
+        self.resume = 'yes' if resume else 'no'
+        self.index = 0  # the index of the current handshake of the client, which tags the results of the server
+
+    def serve(self, listener, results, running):
+        """Server thread: accept the connections and finish their handshakes, until the benchmark of a cipher list is
+           over. The result of each handshake is put into the queue, tagged with the index of the client handshake
+           when the connection is accepted.
+
+        :param listener: the listening DTLS socket.
+        :param results: queue of handshake results (index, server handshake time, server CPU time, resumed, error).
+        :param running: the event which is cleared to stop the thread.
+        :type listener: DtlsWrap.
+        :type results: Queue.Queue.
+        :type running: threading.Event.
+        """
+        listener.dtls_sock.settimeout(0.5)
+        while running.is_set():
+            cpu = thread_cpu()
+            try:
+                acc = listener.accept()
+            except Exception:
+                continue  # no handshake request within the timeout, or a request which failed the cookie exchange.
+            if not acc:
+                continue
+            index = self.index
+            try:
+                conn = DTLSWrap.DtlsWrap()
+                conn.set_dtls_socket(acc[0])
+                acc[0].settimeout(TIMEOUT)
+                conn.do_handshake()
+                results.put((index, conn.handshake_time, thread_cpu() - cpu, conn.resumed, None))
+                conn.close()
+            except Exception as e:
+                results.put((index, None, thread_cpu() - cpu, False, str(e)))
+
+    def run_cipher(self, cipher, num):
+        """Run the handshakes of a cipher list.
+
+        :param cipher: OpenSSL cipher list.
+        :param num: number of handshakes.
+        :type cipher: str.
+        :type num: int.
+
+        Return:
+                dict - the result of the cipher list.
+        """
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        sock.bind((HOST, 0))
+        listener = DTLSWrap.DtlsWrap()
+        listener.config = dict(self.server.config, CIPHERS=cipher, RESUME=self.resume)
+        listener.wrap_socket(sock)
+        if listener.dtls_sock is None:
+            return {'cipher': cipher, 'error': 'cannot create the DTLS server.'}
+        listener.listen(num)
+        relay = UdpRelay(sock.getsockname()[:2])
+        relay.start()
+        results = Queue.Queue()
+        running = threading.Event()
+        running.set()
+        server = threading.Thread(target=self.serve, args=(listener, results, running,))
+        server.daemon = True
+        server.start()
+        latency, client_cpu, server_cpu, traffic, errors = [], [], [], [], []
+        resumed = 0
+        try:
+            for i in xrange(num):
+                relay.reset()
+                client_sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                client_sock.settimeout(TIMEOUT)
+                client = DTLSWrap.DtlsWrap()
+                client.config = dict(self.client.config, CIPHERS=cipher, RESUME=self.resume)
+                self.index = i
+                cpu = thread_cpu()
+                try:
+                    client.wrap_socket(client_sock)
+                    client.connect(relay.address)
+                except Exception as e:
+                    errors.append(str(e))
+                    client_sock.close()
+                    continue
+                client_cpu.append(thread_cpu() - cpu)
+                # the results of earlier handshakes which failed on the client side are discarded.
+                deadline = time.time() + TIMEOUT
+                while True:
+                    try:
+                        index, server_time, cpu, server_resumed, error = results.get(
+                            timeout=max(deadline - time.time(), 0))
+                    except Queue.Empty:
+                        server_time, cpu, error = None, None, 'server handshake timed out.'
+                        break
+                    if index == i:
+                        break
+                if error is not None:
+                    errors.append(error)
+                else:
+                    latency.append(client.handshake_time)
+                    server_cpu.append(cpu)
+                    traffic.append(relay.summary())
+                    resumed += 1 if client.resumed else 0
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except Exception:
+                    pass
+                client.close()
+                relay.forget(client_sock.getsockname())
+        finally:
+            running.clear()
+            server.join(TIMEOUT)
+            relay.stop()
+            listener.close()
+        result = {'cipher': cipher, 'handshakes': len(latency), 'failed': len(errors), 'resumed': resumed,
+                  'latency_ms': distribution(latency), 'client_cpu_ms': distribution(client_cpu),
+                  'server_cpu_ms': distribution(server_cpu)}
+        for key in ('bytes_c2s', 'bytes_s2c', 'datagrams_c2s', 'datagrams_s2c', 'flights', 'round_trips'):
+            result[key] = float(sum(t[key] for t in traffic)) / len(traffic) if traffic else None
+        if errors:
+            result['errors'] = sorted(set(errors))[:10]
+        return result
+
+    def run(self, ciphers, num):
+        """Run the benchmark of cipher lists.
+
+        :param ciphers: OpenSSL cipher lists.
+        :param num: number of handshakes of every cipher list.
+        :type ciphers: list.
+        :type num: int.
+
+        Return:
+                dict - the report of benchmark.
+        """
+        report = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'openssl': getattr(ssl, 'DTLS_OPENSSL_VERSION', ssl.OPENSSL_VERSION),
+                  'handshakes': num, 'resume': self.resume == 'yes', 'results': []}
+        for cipher in ciphers:
+            print ('Benchmark ' + cipher + ' ...')
+            report['results'].append(self.run_cipher(cipher, num))
+        return report
+
+
+def print_report(report):
+    """Print the summary of a benchmark report.
+
+    :param report: the report of benchmark.
+    :type report: dict.
+    """
+    print ('%-32s %6s %6s %10s %10s %10s %10s %10s %8s' % ('cipher', 'ok', 'failed', 'p50 (ms)', 'p99 (ms)',
+                                                          'cli cpu', 'srv cpu', 'bytes', 'RTTs'))
+    for result in report['results']:
+        if 'error' in result:
+            print ('%-32s %s' % (result['cipher'], result['error']))
+            continue
+        latency = result['latency_ms']
+        total = (result['bytes_c2s'] or 0) + (result['bytes_s2c'] or 0)
+        print ('%-32s %6d %6d %10.2f %10.2f %10.2f %10.2f %10d %8.1f' % (
+            result['cipher'], result['handshakes'], result['failed'], latency.get('p50') or 0, latency.get('p99') or 0,
+            result['client_cpu_ms'].get('mean') or 0, result['server_cpu_ms'].get('mean') or 0, total,
+            result['round_trips'] or 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Handshake benchmark of DTLS cipher suites.')
+    parser.add_argument('-clientcnf', dest='clientcnf', required=True,
+                        help='Set the DTLS configuration file of client (key, certificate and CA certificate).')
+    parser.add_argument('-servercnf', dest='servercnf', required=True,
+                        help='Set the DTLS configuration file of server (key, certificate and CA certificate).')
+    parser.add_argument('-ciphers', dest='ciphers', nargs='+', default=CIPHERS,
+                        help='Set the OpenSSL cipher lists to benchmark (default: ' + ' '.join(CIPHERS) + ').')
+    parser.add_argument('-n', dest='num', type=int, default=100, help='Set the number of handshakes per cipher list.')
+    parser.add_argument('-resume', dest='resume', action='store_true',
+                        help='Resume the session of the previous handshake instead of full handshakes.')
+    parser.add_argument('-out', dest='out', help='Write the report in JSON to this file.')
+    args = parser.parse_args()
+    report = HandshakeBench(os.path.expanduser(args.clientcnf), os.path.expanduser(args.servercnf),
+                            args.resume).run(args.ciphers, args.num)
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, sort_keys=True, indent=1)
+        print ('Report written to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
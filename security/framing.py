@@ -0,0 +1,169 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Framed enrollment protocol between applicants (clients and servers) and the CA. The applicant sends the CSR, message
+and signature in one request, and the CA answers with the certificate and the CA certificate in one response, so that
+an enrollment takes one round trip instead of four.
+
+A request starts with the 4-byte magic "SMF1", which tells it from the legacy protocol of string markers. A message
+(request or response) is a sequence of frames, each of them is a 1-byte type, a 4-byte big-endian length and the
+payload, and it ends with a frame of type END. The frame types reuse the letters of the legacy markers:
+    c: CSR, m: message, s: signature (request)
+    t: certificate, a: CA certificate, f: reason of failure (response)
+    e: end of message
+'''
+
+import time
+import struct
+import socket
+
+MAGIC = 'SMF1'  # the beginning of framed requests
+HEADER = struct.Struct('!cI')  # type, length of payload
+CSR = 'c'
+MSG = 'm'
+SIG = 's'
+CERT = 't'
+CACERT = 'a'
+ERROR = 'f'
+END = 'e'
+MAX_FRAME = 65536  # the max length of the payload of a frame
+MAX_MESSAGE = 262144  # the max length of a message
+PEEK_TIME = 0.01  # the time (in seconds) to wait before peeking a partially received magic again
+
+
+def pack_message(frames, magic=False):
+    """Pack frames into a message.
+
+    :param frames: frames in the form of (type, payload).
+    :param magic: True to start the message with the magic, i.e., it is a request.
+    :type frames: list.
+    :type magic: bool.
+
+    Return:
+            str - the message.
+    """
+    parts = [MAGIC] if magic else []
+    for frame_type, payload in frames:
+        parts.append(HEADER.pack(frame_type, len(payload)))
+        parts.append(payload)
+    parts.append(HEADER.pack(END, 0))
+    return ''.join(parts)
+
+
+def send_message(sock, frames, magic=False):
+    """Send frames as one message.
+
+    :param sock: connected socket.
+    :param frames: frames in the form of (type, payload).
+    :param magic: True to start the message with the magic, i.e., it is a request.
+    :type sock: socket.socket.
+    :type frames: list.
+    :type magic: bool.
+    """
+    sock.sendall(pack_message(frames, magic))
+
+
+def recv_exact(sock, size):
+    """Receive exactly size bytes.
+
+    :param sock: connected socket.
+    :param size: number of bytes.
+    :type sock: socket.socket.
+    :type size: int.
+
+    Return:
+            str - the received bytes.
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        num = sock.recv_into(view[received:], size - received)
+        if num == 0:
+            raise RuntimeError('Connection closed in the middle of a message.')
+        received += num
+    return str(buf)
+
+
+def recv_message(sock):
+    """Receive a message.
+
+    :param sock: connected socket.
+    :type sock: socket.socket.
+
+    Return:
+            dict - frame type -> payload, the last payload is kept if a type is repeated.
+    """
+    frames = {}
+    total = 0
+    while True:
+        frame_type, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+        if frame_type == END:
+            return frames
+        total += length
+        if length > MAX_FRAME or total > MAX_MESSAGE:
+            raise RuntimeError('Message is too long.')
+        frames[frame_type] = recv_exact(sock, length)
+
+
+def is_framed(sock):
+    """Check if the request on a connection is framed without consuming it. It waits until the magic or another
+       beginning is received.
+
+    :param sock: connected socket.
+    :type sock: socket.socket.
+
+    Return:
+            bool - True if the request starts with the magic.
+    """
+    while True:
+        data = sock.recv(len(MAGIC), socket.MSG_PEEK)
+        if not data or not MAGIC.startswith(data):
+            return False
+        if data == MAGIC:
+            recv_exact(sock, len(MAGIC))
+            return True
+        time.sleep(PEEK_TIME)
+
+
+def request_certificate(sock, csr, msg, sig):
+    """Send an enrollment request to the CA and receive the certificates.
+
+    :param sock: socket connected to the CA.
+    :param csr: content of the CSR file.
+    :param msg: content of the message file.
+    :param sig: content of the signature file.
+    :type sock: socket.socket.
+    :type csr: str.
+    :type msg: str.
+    :type sig: str.
+
+    Return:
+            tuple - (certificate, CA certificate).
+    """
+    send_message(sock, [(CSR, csr), (MSG, msg), (SIG, sig)], magic=True)
+    response = recv_message(sock)
+    if ERROR in response:
+        raise RuntimeError('Certificate request rejected: ' + response[ERROR])
+    if CERT not in response or CACERT not in response:
+        raise RuntimeError('Incomplete response from CA.')
+    return response[CERT], response[CACERT]
@@ -0,0 +1,485 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Certificate revocation lists (CRLs) of the private CA and their compact serial index.
+
+The CA publishes a full CRL of all revoked certificates in its database (index.txt), and in between delta CRLs
+(RFC 5280, section 5.2.4) which only list the certificates revoked since the full CRL. The CRLs are signed with the
+certificate and private key in the openssl configuration of the CA.
+
+Verifiers check a full CRL and an optional delta CRL against the CA chain once, and merge them into a snapshot: a file
+of fixed-size entries sorted by serial number, which is memory-mapped and searched by bisection, so that the status of
+a certificate is found in O(log n) without reading the CRLs or querying OCSP server. The snapshot is rebuilt when the
+CRL files change.
+
+Snapshot format (big-endian):
+    header: magic "SMRV", version, SHA1 of the issuer name, CRL number, thisUpdate, nextUpdate, number of entries
+    entry: serial number (20 bytes), revocation time, reason (CRLReason), padding
+'''
+
+import os
+import time
+import mmap
+import struct
+import hashlib
+import calendar
+import datetime
+import tempfile
+
+from smit.security import cryptobackend
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+
+    # reason of revocation in the certificate database -> reason flag of cryptography
+    REASON_FLAGS = {'unspecified': x509.ReasonFlags.unspecified, 'keyCompromise': x509.ReasonFlags.key_compromise,
+                    'CACompromise': x509.ReasonFlags.ca_compromise,
+                    'affiliationChanged': x509.ReasonFlags.affiliation_changed,
+                    'superseded': x509.ReasonFlags.superseded,
+                    'cessationOfOperation': x509.ReasonFlags.cessation_of_operation,
+                    'certificateHold': x509.ReasonFlags.certificate_hold,
+                    'removeFromCRL': x509.ReasonFlags.remove_from_crl,
+                    'privilegeWithdrawn': x509.ReasonFlags.privilege_withdrawn,
+                    'AACompromise': x509.ReasonFlags.aa_compromise}
+except ImportError:
+    REASON_FLAGS = {}
+FLAG_REASONS = dict((flag, name) for name, flag in REASON_FLAGS.items())  # reason flag of cryptography -> reason
+
+MAGIC = 'SMRV'
+VERSION = 1
+HEADER = struct.Struct('!4sI20sQqqI')  # magic, version, issuer hash, CRL number, thisUpdate, nextUpdate, count
+ENTRY = struct.Struct('!20sqB3x')  # serial number, revocation time, reason
+SERIAL_SIZE = 20  # the max length of serial numbers (RFC 5280)
+CLOCK_SKEW = 300  # the tolerance (in seconds) of thisUpdate in the future
+CRL_DAYS = 30  # the default validity (in days) of full CRLs, if "default_crl_days" is not set in openssl configuration
+DELTA_HOURS = 24  # the validity (in hours) of delta CRLs
+# reason of revocation in the certificate database -> CRLReason
+REASONS = {'unspecified': 0, 'keyCompromise': 1, 'CACompromise': 2, 'affiliationChanged': 3, 'superseded': 4,
+           'cessationOfOperation': 5, 'certificateHold': 6, 'removeFromCRL': 8, 'privilegeWithdrawn': 9,
+           'AACompromise': 10}
+REMOVE_FROM_CRL = 8
+_snapshots = {}  # opened snapshots: path -> (modification time, Snapshot)
+
+
+def serial_bytes(serial):
+    """Return the fixed-size big-endian encoding of a serial number, which keeps the order of serial numbers.
+    """
+    data = ('%x' % serial).rjust(2 * SERIAL_SIZE, '0').decode('hex')
+    if len(data) > SERIAL_SIZE:
+        raise ValueError('serial number ' + hex(serial) + ' is too long.')
+    return data
+
+
+def epoch(value):
+    """Convert a naive UTC datetime to seconds since the epoch.
+    """
+    return calendar.timegm(value.utctimetuple())
+
+
+def write_snapshot(path, issuer_hash, crl_number, this_update, next_update, entries):
+    """Write a snapshot of revoked certificates. The file is written to a temporary file and then renamed, so that
+       processes which mapped the old snapshot are not affected.
+
+    :param path: path to the snapshot.
+    :param issuer_hash: SHA1 of the issuer name in DER.
+    :param crl_number: the CRL number.
+    :param this_update: thisUpdate in seconds since the epoch.
+    :param next_update: nextUpdate in seconds since the epoch.
+    :param entries: serial number -> (revocation time, reason).
+    :type path: str.
+    :type issuer_hash: str.
+    :type crl_number: int.
+    :type this_update: int.
+    :type next_update: int.
+    :type entries: dict.
+    """
+    parts = [HEADER.pack(MAGIC, VERSION, issuer_hash, crl_number, this_update, next_update, len(entries))]
+    for key, serial in sorted((serial_bytes(serial), serial) for serial in entries):
+        parts.append(ENTRY.pack(key, entries[serial][0], entries[serial][1]))
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(prefix='.revocation-', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(''.join(parts))
+    os.rename(tmp_path, path)
+
+
+class Snapshot(object):
+    """
+    This class looks up serial numbers in a memory-mapped snapshot of revoked certificates.
+    """
+
+    def __init__(self, path):
+        """Constructor maps the snapshot and checks its header.
+
+        :param path: path to the snapshot.
+        :type path: str.
+        """
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError('snapshot \"' + path + '\" is truncated.')
+        magic, version, self.issuer_hash, self.crl_number, self.this_update, self.next_update, self.count = \
+            HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or len(self.map) != HEADER.size + self.count * ENTRY.size:
+            self.map.close()
+            raise ValueError('\"' + path + '\" is not a valid snapshot of revoked certificates.')
+
+    def current(self, now=None):
+        """Return True if the time is between thisUpdate and nextUpdate of the CRLs.
+        """
+        now = time.time() if now is None else now
+        return self.this_update - CLOCK_SKEW <= now < self.next_update
+
+    def lookup(self, serial):
+        """Find a serial number by bisection.
+
+        :param serial: the serial number.
+        :type serial: int.
+
+        Return:
+                tuple - (revocation time, reason) if the certificate is revoked, otherwise None.
+        """
+        key = serial_bytes(serial)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * ENTRY.size
+            current = self.map[offset:offset + SERIAL_SIZE]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return ENTRY.unpack_from(self.map, offset)[1:]
+        return None
+
+    def entries(self):
+        """Return all entries of the snapshot.
+
+        Return:
+                dict - serial number -> (revocation time, reason).
+        """
+        result = {}
+        for i in xrange(self.count):
+            key, revoked, reason = ENTRY.unpack_from(self.map, HEADER.size + i * ENTRY.size)
+            result[int(key.encode('hex'), 16)] = (revoked, reason)
+        return result
+
+    def close(self):
+        self.map.close()
+
+
+def open_snapshot(path):
+    """Return the snapshot of a path, which is mapped once per process and mapped again when the file is replaced.
+
+    :param path: path to the snapshot.
+    :type path: str.
+
+    Return:
+            Snapshot - the snapshot.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _snapshots.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    snapshot = Snapshot(path)
+    _snapshots[path] = (mtime, snapshot)
+    return snapshot
+
+
+def load_crl(path):
+    """Load a CRL in PEM or DER format.
+
+    :param path: path to the CRL.
+    :type path: str.
+    """
+    cryptobackend.check()
+    data = cryptobackend.read(path)
+    try:
+        if data.lstrip().startswith('-----BEGIN'):
+            return x509.load_pem_x509_crl(data, default_backend())
+        return x509.load_der_x509_crl(data, default_backend())
+    except ValueError as e:
+        raise ValueError('cannot load CRL \"' + path + '\": ' + str(e))
+
+
+def crl_entries(crl):
+    """Return the entries of a CRL.
+
+    Return:
+            dict - serial number -> (revocation time, reason).
+    """
+    entries = {}
+    for revoked in crl:
+        try:
+            reason = REASONS[FLAG_REASONS[revoked.extensions.get_extension_for_class(x509.CRLReason).value.reason]]
+        except x509.ExtensionNotFound:
+            reason = 0
+        entries[revoked.serial_number] = (epoch(revoked.revocation_date), reason)
+    return entries
+
+
+def crl_number(crl):
+    """Return the CRL number of a CRL, 0 if it has none.
+    """
+    try:
+        return crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+    except x509.ExtensionNotFound:
+        return 0
+
+
+def build_snapshot(chain_path, crl_path, delta_path, path):
+    """Check a full CRL and an optional delta CRL against a CA chain, and merge them into a snapshot.
+
+    :param chain_path: path to the CA chain.
+    :param crl_path: path to the full CRL.
+    :param delta_path: path to the delta CRL, empty if there is none.
+    :param path: path to the snapshot.
+    :type chain_path: str.
+    :type crl_path: str.
+    :type delta_path: str.
+    :type path: str.
+    """
+    crl = load_crl(crl_path)
+    issuers = [c for c in cryptobackend.load_certs(chain_path) if c.subject == crl.issuer]
+    if not issuers or not crl.is_signature_valid(issuers[0].public_key()):
+        raise ValueError('CRL \"' + crl_path + '\" is not signed by a CA in the chain.')
+    if crl.next_update is None:
+        raise ValueError('CRL \"' + crl_path + '\" has no nextUpdate.')
+    entries = crl_entries(crl)
+    number = crl_number(crl)
+    this_update, next_update = epoch(crl.last_update), epoch(crl.next_update)
+    if delta_path != '' and os.path.isfile(delta_path):
+        delta = load_crl(delta_path)
+        try:
+            base = delta.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number
+        except x509.ExtensionNotFound:
+            raise ValueError('CRL \"' + delta_path + '\" is not a delta CRL.')
+        if delta.issuer != crl.issuer or not delta.is_signature_valid(issuers[0].public_key()):
+            raise ValueError('delta CRL \"' + delta_path + '\" is not signed by the issuer of CRL.')
+        if base <= number < crl_number(delta) and delta.next_update is not None:  # otherwise it is stale.
+            for serial, entry in crl_entries(delta).iteritems():
+                if entry[1] == REMOVE_FROM_CRL:
+                    entries.pop(serial, None)
+                else:
+                    entries[serial] = entry
+            number = crl_number(delta)
+            this_update = max(this_update, epoch(delta.last_update))
+            next_update = min(next_update, epoch(delta.next_update))
+    issuer_hash = hashlib.sha1(crl.issuer.public_bytes(default_backend())).digest()
+    write_snapshot(path, issuer_hash, number, this_update, next_update, entries)
+
+
+def snapshot(chain_path, crl_path, delta_path, path):
+    """Return the snapshot of CRLs, which is rebuilt if it is missing or older than the CRL files.
+
+    :param chain_path: path to the CA chain.
+    :param crl_path: path to the full CRL.
+    :param delta_path: path to the delta CRL, empty if there is none.
+    :param path: path to the snapshot.
+    :type chain_path: str.
+    :type crl_path: str.
+    :type delta_path: str.
+    :type path: str.
+
+    Return:
+            Snapshot - the snapshot.
+    """
+    sources = [p for p in (crl_path, delta_path) if p != '' and os.path.isfile(p)]
+    if not os.path.isfile(path) or any(os.path.getmtime(p) >= os.path.getmtime(path) for p in sources):
+        build_snapshot(chain_path, crl_path, delta_path, path)
+    return open_snapshot(path)
+
+
+def read_index(db_path):
+    """Read the revoked certificates in a certificate database of openssl (index.txt).
+
+    :param db_path: path to the database.
+    :type db_path: str.
+
+    Return:
+            dict - serial number -> (revocation time, reason).
+    """
+    entries = {}
+    with open(db_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) < 4 or fields[0] != 'R' or fields[2] == '':
+                continue
+            revoked = fields[2].split(',')
+            fmt = '%y%m%d%H%M%SZ' if len(revoked[0]) == 13 else '%Y%m%d%H%M%SZ'
+            entries[int(fields[3], 16)] = (calendar.timegm(time.strptime(revoked[0], fmt)),
+                                           REASONS.get(revoked[1], 0) if len(revoked) > 1 else 0)
+    return entries
+
+
+def read_openssl_ca(path):
+    """Read the settings of the default CA in an openssl configuration file, with "$dir" and other variables of the
+       section resolved.
+
+    :param path: path to the openssl configuration.
+    :type path: str.
+
+    Return:
+            dict - setting -> value.
+    """
+    sections = {}
+    section = ''
+    with open(os.path.expanduser(path), 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line.startswith('[') and line.endswith(']'):
+                section = line[1:-1].strip()
+            elif '=' in line:
+                key, value = line.split('=', 1)
+                sections.setdefault(section, {})[key.strip()] = value.strip()
+    settings = sections.get(sections.get('ca', {}).get('default_ca', 'CA_default'), {})
+    for key in settings.keys():
+        value = settings[key]
+        for name in sorted(settings, key=len, reverse=True):
+            value = value.replace('$' + name, settings[name])
+        settings[key] = value
+    return settings
+
+
+class CRLPublisher(object):
+    """
+    This class publishes the full and delta CRLs of the CA in an openssl configuration. The full CRL is written to
+    "crl" and the delta CRL to "delta.pem" in "crl_dir". The revoked certificates in the last full CRL are kept in the
+    snapshot "base.idx" in "crl_dir", to find the ones revoked after it.
+    """
+
+    def __init__(self, openssl_path):
+        """Constructor reads the settings of CA.
+
+        :param openssl_path: path to the openssl configuration of CA.
+        :type openssl_path: str.
+        """
+        settings = read_openssl_ca(openssl_path)
+        for key in ('database', 'certificate', 'private_key'):
+            if settings.get(key, '') == '':
+                raise ValueError('\"' + key + '\" of CA is not set in openssl configuration \"' + openssl_path + '\".')
+        self.db_path = os.path.expanduser(settings['database'])
+        self.cert_path = os.path.expanduser(settings['certificate'])
+        self.key_path = os.path.expanduser(settings['private_key'])
+        ca_dir = os.path.dirname(self.db_path)
+        self.crl_dir = os.path.expanduser(settings.get('crl_dir', '') or os.path.join(ca_dir, 'crl'))
+        self.crl_path = os.path.expanduser(settings.get('crl', '') or os.path.join(ca_dir, 'crl.pem'))
+        self.number_path = os.path.expanduser(settings.get('crlnumber', '') or os.path.join(ca_dir, 'crlnumber'))
+        self.delta_path = os.path.join(self.crl_dir, 'delta.pem')
+        self.base_path = os.path.join(self.crl_dir, 'base.idx')
+        days = settings.get('default_crl_days', '')
+        self.crl_days = int(days) if days.isdigit() else CRL_DAYS
+
+    def next_number(self):
+        """Return the next CRL number and save it in "crlnumber" in the format of openssl.
+        """
+        number = 1
+        if os.path.isfile(self.number_path):
+            with open(self.number_path, 'r') as f:
+                number = int(f.read().strip() or '1', 16)
+        with open(self.number_path, 'w') as f:
+            f.write('%02X\n' % (number + 1))
+        return number
+
+    def sign(self, entries, number, validity, base=None):
+        """Sign a CRL.
+
+        :param entries: serial number -> (revocation time, reason).
+        :param number: the CRL number.
+        :param validity: the interval to nextUpdate.
+        :param base: the CRL number of the base CRL of a delta CRL, None for a full CRL.
+        :type entries: dict.
+        :type number: int.
+        :type validity: datetime.timedelta.
+        :type base: int.
+
+        Return:
+                the CRL.
+        """
+        ca = cryptobackend.load_certs(self.cert_path)[0]
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        builder = x509.CertificateRevocationListBuilder().issuer_name(ca.subject).last_update(now).next_update(
+            now + validity).add_extension(x509.CRLNumber(number), critical=False)
+        if base is not None:
+            builder = builder.add_extension(x509.DeltaCRLIndicator(base), critical=True)
+        names = dict((code, name) for name, code in REASONS.iteritems())
+        for serial, (revoked, reason) in sorted(entries.iteritems()):
+            entry = x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(
+                datetime.datetime.utcfromtimestamp(revoked))
+            if reason:
+                entry = entry.add_extension(x509.CRLReason(REASON_FLAGS[names[reason]]), critical=False)
+            builder = builder.add_revoked_certificate(entry.build(default_backend()))
+        return builder.sign(cryptobackend.load_key(self.key_path), hashes.SHA256(), default_backend())
+
+    def write(self, crl, path):
+        """Write a CRL in PEM format, through a temporary file.
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix='.crl-', dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(crl.public_bytes(serialization.Encoding.PEM))
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+
+    def publish(self, full=False):
+        """Publish a delta CRL of the certificates revoked since the last full CRL, or a full CRL if it is required,
+           there is no valid full CRL, or the delta would be as large as half of the full CRL.
+
+        :param full: True to publish a full CRL.
+        :type full: bool.
+
+        Return:
+                tuple - (path to the CRL, CRL number, number of entries).
+        """
+        cryptobackend.check()
+        if not os.path.isdir(self.crl_dir):
+            os.makedirs(self.crl_dir)
+        revoked = read_index(self.db_path)
+        base = None
+        if not full and os.path.isfile(self.base_path) and os.path.isfile(self.crl_path):
+            base = Snapshot(self.base_path)
+            if not base.current():
+                base.close()
+                base = None
+        if base is not None:
+            delta = dict((serial, entry) for serial, entry in revoked.iteritems() if base.lookup(serial) != entry)
+            delta.update((serial, (int(time.time()), REMOVE_FROM_CRL)) for serial in base.entries()
+                         if serial not in revoked)  # e.g., a certificateHold released.
+            base.close()
+            if len(delta) * 2 <= len(revoked):
+                number = self.next_number()
+                crl = self.sign(delta, number, datetime.timedelta(hours=DELTA_HOURS), base.crl_number)
+                self.write(crl, self.delta_path)
+                return self.delta_path, number, len(delta)
+        number = self.next_number()
+        crl = self.sign(revoked, number, datetime.timedelta(days=self.crl_days))
+        self.write(crl, self.crl_path)
+        if os.path.isfile(self.delta_path):
+            os.remove(self.delta_path)
+        write_snapshot(self.base_path, hashlib.sha1(crl.issuer.public_bytes(default_backend())).digest(), number,
+                       epoch(crl.last_update), epoch(crl.next_update), revoked)
+        return self.crl_path, number, len(revoked)
@@ -0,0 +1,170 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Loopback handshakes of DtlsWrap. Run with "python -m unittest smit.security.test_dtlswrap".
+'''
+
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import datetime
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from smit.security import cryptobackend
+
+try:
+    from smit.security import DTLSWrap
+except (ImportError, OSError):  # PyDTLS is not installed or it cannot load OpenSSL
+    DTLSWrap = None
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+except ImportError:
+    pass
+
+
+@unittest.skipUnless(cryptobackend.AVAILABLE and DTLSWrap is not None, 'cryptography or PyDTLS is not installed.')
+class DtlsWrapTest(unittest.TestCase):
+    """
+    This class connects a client to a server on the loopback interface with the certificates of a temporary CA.
+    """
+
+    def setUp(self):
+        """Create a CA, the certificates of a server and a client, and their configuration in a temporary directory.
+        """
+        self.dir = tempfile.mkdtemp(prefix='smit-dtls-')
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # the backups of the configuration files are written to the current directory
+        ca_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'test CA')])
+        self.write_cert('ca', ca_name, ca_key, ca_key, True)
+        for name in ('server', 'client'):
+            key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+            with open(self.path(name + '.key'), 'wb') as f:
+                f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                          serialization.NoEncryption()))
+            self.write_cert(name, ca_name, key, ca_key, False)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        """Return the path to a file in the temporary directory.
+        """
+        return os.path.join(self.dir, name)
+
+    def write_cert(self, name, issuer, key, ca_key, ca):
+        """Write the certificate of a key signed by the CA.
+        """
+        now = datetime.datetime.utcnow()
+        subject = issuer if ca else x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, unicode(name))])
+        cert = x509.CertificateBuilder().subject_name(subject).issuer_name(issuer).public_key(
+            key.public_key()).serial_number(x509.random_serial_number()).not_valid_before(
+            now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=30)).add_extension(
+            x509.BasicConstraints(ca=ca, path_length=None), critical=True).sign(ca_key, hashes.SHA256(),
+                                                                                default_backend())
+        with open(self.path(name + '.pem'), 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+    def wrap(self, name, **args):
+        """Return a DtlsWrap of the server or the client with a socket wrapped.
+        """
+        with open(self.path(name + '.cnf'), 'w') as f:
+            f.write('SK="%s"\nCERT="%s"\nTYPE="%s"\nCACERT="%s"\nCERT_REQS="CERT_REQUIRED"\nRESUME="yes"\n'
+                    'CIPHERS="ALL"\nSTAPLE=""\n' % (self.path(name + '.key'), self.path(name + '.pem'), name,
+                                                   self.path('ca.pem')))
+        dw = DTLSWrap.DtlsWrap()
+        dw.init_config(config=self.path(name + '.cnf'), **args)
+        dw.wrap_socket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+        return dw
+
+    def handshakes(self, count, server_args=None, client_args=None):
+        """Connect the client to the server for a number of times and echo a message in each connection.
+
+        Return:
+                list - (server, client) pairs of DtlsWrap of each connection.
+        """
+        server = self.wrap('server', **(server_args or {}))
+        server.dtls_sock.bind(('127.0.0.1', 0))
+        server.listen(5)
+        accepted = []
+
+        def serve():
+            while len(accepted) < count:
+                conn = server.accept()
+                if conn is None:
+                    continue
+                dw = DTLSWrap.DtlsWrap()
+                dw.set_dtls_socket(conn[0])
+                dw.do_handshake()
+                dw.sendto(dw.recvfrom(1024))
+                accepted.append(dw)
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        clients = []
+        for _ in range(count):
+            client = self.wrap('client', **(client_args or {}))
+            client.connect(server.dtls_sock.getsockname())
+            client.sendto('message')
+            self.assertEqual(client.recvfrom(1024), 'message')
+            client.close()
+            clients.append(client)
+        thread.join(10)
+        server.close()
+        self.assertEqual(len(accepted), count)
+        return zip(accepted, clients)
+
+    def test_resumption(self):
+        """A reconnecting client resumes its session.
+        """
+        (server1, client1), (server2, client2) = self.handshakes(2)
+        self.assertFalse(client1.resumed or server1.resumed)
+        self.assertTrue(client2.resumed and server2.resumed)
+
+    def test_stapling(self):
+        """The response stapled by the server is saved by the client, and it is kept after a resumed handshake.
+        """
+        response = os.urandom(512)  # OpenSSL passes the stapled response as it is, it is checked by CertManager
+        with open(self.path('server.ocsp'), 'wb') as f:
+            f.write(response)
+        (server1, client1), (server2, client2) = self.handshakes(2, {'STAPLE': self.path('server.ocsp')},
+                                                                 {'STAPLE': self.path('client.ocsp')})
+        self.assertEqual(client1.stapled, response)
+        self.assertTrue(client2.resumed)
+        with open(self.path('client.ocsp'), 'rb') as f:
+            self.assertEqual(f.read(), response)
+
+
+if __name__ == '__main__':
+    unittest.main()
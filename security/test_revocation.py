@@ -0,0 +1,134 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Tests of the reasons of revocation in full and delta CRLs. Run with "python -m unittest smit.security.test_revocation".
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import datetime
+import unittest
+
+from smit.security import cryptobackend
+from smit.security import revocation
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+except ImportError:
+    pass
+
+
+@unittest.skipUnless(cryptobackend.AVAILABLE, 'cryptography is not installed.')
+class RevocationTest(unittest.TestCase):
+    """
+    This class publishes CRLs of a temporary CA and reads them back.
+    """
+
+    def setUp(self):
+        """Create a self-signed CA, its database and openssl configuration in a temporary directory.
+        """
+        self.dir = tempfile.mkdtemp(prefix='smit-crl-')
+        key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'test CA')])
+        now = datetime.datetime.utcnow()
+        cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+            key.public_key()).serial_number(1).not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(
+            now + datetime.timedelta(days=30)).sign(key, hashes.SHA256(), default_backend())
+        self.cert_path = os.path.join(self.dir, 'ca.pem')
+        with open(self.cert_path, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(os.path.join(self.dir, 'ca.key'), 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        self.db_path = os.path.join(self.dir, 'index.txt')
+        self.openssl_path = os.path.join(self.dir, 'openssl.cnf')
+        with open(self.openssl_path, 'w') as f:
+            f.write('[ ca ]\ndefault_ca = CA_default\n\n[ CA_default ]\ndir = ' + self.dir + '\n'
+                    'database = $dir/index.txt\ncertificate = $dir/ca.pem\nprivate_key = $dir/ca.key\n')
+        self.revoked = time.strftime('%y%m%d%H%M%SZ', time.gmtime(int(time.time()) - 60))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_index(self, reasons):
+        """Write the database of CA, with serial number -> reason of revocation, None if it is valid.
+        """
+        with open(self.db_path, 'w') as f:
+            for serial, reason in sorted(reasons.items()):
+                if reason is None:
+                    f.write('V\t301231235959Z\t\t%02X\tunknown\t/CN=dev%d\n' % (serial, serial))
+                else:
+                    f.write('R\t301231235959Z\t%s,%s\t%02X\tunknown\t/CN=dev%d\n' %
+                            (self.revoked, reason, serial, serial))
+
+    def lookup(self, publisher, serial):
+        """Return the entry of a serial number in the snapshot of the published CRLs.
+        """
+        path = os.path.join(self.dir, 'crl.idx')
+        revocation.build_snapshot(self.cert_path, publisher.crl_path, publisher.delta_path, path)
+        snapshot = revocation.Snapshot(path)
+        try:
+            return snapshot.lookup(serial)
+        finally:
+            snapshot.close()
+
+    def test_reasons(self):
+        """Every reason of revocation except removeFromCRL is kept in a full CRL.
+        """
+        reasons = [name for name in revocation.REASONS if name != 'removeFromCRL']
+        self.write_index(dict((serial, name) for serial, name in enumerate(sorted(reasons), 2)))
+        publisher = revocation.CRLPublisher(self.openssl_path)
+        publisher.publish(full=True)
+        entries = revocation.crl_entries(revocation.load_crl(publisher.crl_path))
+        for serial, name in enumerate(sorted(reasons), 2):
+            self.assertEqual(entries[serial][1], revocation.REASONS[name], name)
+            self.assertEqual(self.lookup(publisher, serial)[1], revocation.REASONS[name], name)
+
+    def test_hold_release(self):
+        """A certificate on hold and released is listed as removeFromCRL in the delta CRL, and not revoked.
+        """
+        devices = dict((serial, None) for serial in range(2, 8))
+        devices[2] = 'certificateHold'
+        devices.update((serial, 'keyCompromise') for serial in range(3, 6))
+        self.write_index(devices)
+        publisher = revocation.CRLPublisher(self.openssl_path)
+        publisher.publish(full=True)
+        self.assertEqual(self.lookup(publisher, 2)[1], revocation.REASONS['certificateHold'])
+        devices[2] = None
+        self.write_index(devices)
+        path, number, count = publisher.publish()
+        self.assertEqual(path, publisher.delta_path)
+        entries = revocation.crl_entries(revocation.load_crl(publisher.delta_path))
+        self.assertEqual(entries[2][1], revocation.REASONS['removeFromCRL'])
+        self.assertIsNone(self.lookup(publisher, 2))
+        self.assertEqual(self.lookup(publisher, 3)[1], revocation.REASONS['keyCompromise'])
+
+
+if __name__ == '__main__':
+    unittest.main()
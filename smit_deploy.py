@@ -30,6 +30,7 @@ import testbed.setupexp
 import appca.ca
 import appca.ocsp
 import argparse
+from multiprocessing import cpu_count
 import utils
 
 try:
@@ -57,6 +58,8 @@ def main():
             p45. Generate signature for device.
             P46. Generate certificate.
         p5. Create and start private CA applications.
+            p51. Enroll a batch of devices on the private CA.
+            p52. Publish the CRL of the private CA.
         p6. Create and start server application.
         p7. Create and start client application.
         p8. Setup testbed for performance test
@@ -123,6 +126,11 @@ def main():
     parser.add_argument('-type', dest='type', nargs=1, help='Set device type [client|server].')
     parser.add_argument('-certreq', dest='certreq', nargs=1,
                         help='Set certificate requirements for DTLS handshake [CERT_NONE|CERT_OPTIONAL|CERT_REQUIRED].')
+    parser.add_argument('-resume', dest='resume', nargs=1,
+                        help='Set if DTLS sessions are resumed on reconnection [yes|no].')
+    parser.add_argument('-ciphers', dest='ciphers', nargs=1, help='Set the OpenSSL cipher list of DTLS handshake.')
+    parser.add_argument('-staple', dest='staple', nargs=1,
+                        help='Set the file of OCSP response stapled in DTLS handshakes, e.g., cert/staple.der')
     parser.add_argument('-router-ip6', dest='router_ip6', nargs=1, help='Set border router\'s IPv6 address.')
     parser.add_argument('-client-ip6', dest='client_ip6', nargs=1,
                         help='Set the list of client IPv6 addresses. Format: address1,address2,...')
@@ -141,6 +149,46 @@ def main():
     parser.add_argument('-sink2client', dest='sink2client', nargs=1,
                         help='Set source directory/file to be uploaded to client devices.')
     parser.add_argument('-dtls', dest='dtls', action='store_true', help='Enable DTLS on sink server.')
+    parser.add_argument('-sinkmode', dest='sinkmode', nargs=1,
+                        help='Set the serving mode of sink server [process|loop|sharded|pool].')
+    parser.add_argument('-sinksockets', dest='sinksockets', nargs=1,
+                        help='Set the number of sockets sharing the port of sink server in loop mode.')
+    parser.add_argument('-sinkworkers', dest='sinkworkers', nargs=1,
+                        help='Set the number of worker processes (sharded mode) or session workers (pool mode) of sink '
+                             'server.')
+    parser.add_argument('-handshakes', dest='handshakes', nargs=1,
+                        help='Set the number of concurrent DTLS handshakes of sink server in pool mode.')
+    parser.add_argument('-handshake-timeout', dest='handshake_timeout', nargs=1,
+                        help='Set the time in seconds to finish a DTLS handshake of sink server in pool mode.')
+    parser.add_argument('-sinklog', dest='sinklog', nargs=1, help='Set the format of sink packet logs [text|binary].')
+    parser.add_argument('-statsport', dest='statsport', nargs=1,
+                        help='Set the local port of the live statistics endpoint of sink server.')
+    parser.add_argument('-certbackend', dest='certbackend', nargs=1,
+                        help='Set the backend of certificate operations [openssl|cryptography].')
+    parser.add_argument('-ocspcache', dest='ocspcache', nargs=1,
+                        help='Set the directory of cached OCSP responses, e.g., /tmp/smit-ocsp.')
+    parser.add_argument('-ocspresponder', dest='ocspresponder', nargs=1,
+                        help='Set the OCSP responder [embedded|openssl].')
+    parser.add_argument('-ocspvalidity', dest='ocspvalidity', nargs=1,
+                        help='Set the validity (in minutes) of responses of the embedded OCSP responder.')
+    parser.add_argument('-crlfull', dest='crlfull', action='store_true',
+                        help='Publish a full CRL instead of a delta CRL.')
+    parser.add_argument('-batch-in', dest='batch_in', nargs=1,
+                        help='Set the directory or archive of request files (<name>.csr, <name>.msg and <name>.sig) '
+                             'for batch enrollment.')
+    parser.add_argument('-batch-out', dest='batch_out', nargs=1,
+                        help='Set the directory or archive (.tar.gz, .tgz, .tar or .zip) to output the certificates of '
+                             'batch enrollment.')
+    parser.add_argument('-caworkers', dest='caworkers', nargs=1,
+                        help='Set the number of workers which process certificate requests on CA.')
+    parser.add_argument('-caworkertype', dest='caworkertype', nargs=1,
+                        help='Set the type of workers on CA [thread|process].')
+    parser.add_argument('-caqueue', dest='caqueue', nargs=1,
+                        help='Set the max number of certificate requests waiting for a worker on CA.')
+    parser.add_argument('-workers', dest='workers', nargs=1,
+                        help='Set the number of worker processes to analyze data (default: number of CPUs).')
+    parser.add_argument('-nocache', dest='nocache', action='store_true',
+                        help='Analyze all logs again without the cached results of unchanged logs.')
     parser.add_argument('-client-script', dest='client_script', nargs=1,
                         help='Set the path of Python script (on client device) to be executed.')
     parser.add_argument('-user', dest='user', nargs=1, help='Set a username to login client devices and border router.')
@@ -160,6 +208,14 @@ def main():
     parser.add_argument('-sendrate', dest='sendrate', nargs=1,
                         help='Set (for clients) the number of packets per second sent over the network.')
     parser.add_argument('-devnum', dest='devnum', nargs=1, help='Set the number of client devices.')
+    parser.add_argument('-traffic', dest='traffic', nargs=1,
+                        help='Set (for clients) the traffic model [tick|constant|poisson|bursty|trace].')
+    parser.add_argument('-burstsize', dest='burstsize', nargs=1,
+                        help='Set (for clients) the number of packets in a burst of the bursty traffic model.')
+    parser.add_argument('-tracefile', dest='tracefile', nargs=1,
+                        help='Set (for clients) the trace file of send times of the trace traffic model.')
+    parser.add_argument('-sendlog', dest='sendlog', nargs=1,
+                        help='Set (for clients) the format of send log [text|binary|none].')
 
     args = parser.parse_args()
     utl = utils.Utils()
@@ -240,7 +296,8 @@ def main():
             args.config = ['ocspcnf']
         ocsp.init_config(config=args.config[0], OCSPSK=get_value(args.sk), OCSPCERT=get_value(args.certpath),
                          CERTDB=get_value(args.certdb), CACERT=get_value(args.cacert),
-                         OCSPPORT=get_value(args.ocspport))
+                         OCSPPORT=get_value(args.ocspport), RESPONDER=get_value(args.ocspresponder),
+                         VALIDITY=get_value(args.ocspvalidity))
         ocsp.start()
     elif args.package[0] == 'p44':
         os.chdir('security')
@@ -259,7 +316,8 @@ def main():
                          CERTDB=get_value(args.certdb), CERTS=get_value(args.certs), MSG=get_value(args.msg),
                          SIG=get_value(args.sig), CACHAIN=get_value(args.cachain), OCSP=get_value(args.ocsp),
                          MCERT=get_value(args.mcert), EXTENSIONS=get_value(args.extensions),
-                         OPENSSL_PATH=get_value(args.opensslpath))
+                         OPENSSL_PATH=get_value(args.opensslpath), BACKEND=get_value(args.certbackend),
+                         OCSPCACHE=get_value(args.ocspcache))
         cert.create_csr()
     elif args.package[0] == 'p45':
         os.chdir('security')
@@ -278,7 +336,8 @@ def main():
                          CERTDB=get_value(args.certdb), CERTS=get_value(args.certs), MSG=get_value(args.msg),
                          SIG=get_value(args.sig), CACHAIN=get_value(args.cachain), OCSP=get_value(args.ocsp),
                          MCERT=get_value(args.mcert), EXTENSIONS=get_value(args.extensions),
-                         OPENSSL_PATH=get_value(args.opensslpath))
+                         OPENSSL_PATH=get_value(args.opensslpath), BACKEND=get_value(args.certbackend),
+                         OCSPCACHE=get_value(args.ocspcache))
         cert.gen_sig()
     elif args.package[0] == 'p46':
         os.chdir('security')
@@ -297,7 +356,8 @@ def main():
                          CERTDB=get_value(args.certdb), CERTS=get_value(args.certs), MSG=get_value(args.msg),
                          SIG=get_value(args.sig), CACHAIN=get_value(args.cachain), OCSP=get_value(args.ocsp),
                          MCERT=get_value(args.mcert), EXTENSIONS=get_value(args.extensions),
-                         OPENSSL_PATH=get_value(args.opensslpath))
+                         OPENSSL_PATH=get_value(args.opensslpath), BACKEND=get_value(args.certbackend),
+                         OCSPCACHE=get_value(args.ocspcache))
         cert.create_cert()
     elif args.package[0] == 'p5':
         if args.new:  # create new private CA.
@@ -328,8 +388,35 @@ def main():
                        CACERT=get_value(args.cacert), OCSPPORT=get_value(args.ocspport),
                        CACHAIN=get_value(args.cachain), OCSP=get_value(args.ocsp), IP=get_value(args.caip),
                        PORT=get_value(args.caport), SIGCERT=get_value(args.sigcert), SIGCHAIN=get_value(args.sigchain),
-                       SELFSIGN='n', OPENSSL_PATH=get_value(args.opensslpath))
+                       SELFSIGN='n', OPENSSL_PATH=get_value(args.opensslpath), WORKERS=get_value(args.caworkers),
+                       WORKERTYPE=get_value(args.caworkertype), QUEUESIZE=get_value(args.caqueue),
+                       BACKEND=get_value(args.certbackend), OCSPCACHE=get_value(args.ocspcache))
         ca.start()
+    elif args.package[0] == 'p51':
+        if not args.batch_in or not args.batch_out:
+            print ('Error: you should specify the input and output of batch enrollment.\n'
+                   'E.g.,: -batch-in requests.tar.gz -batch-out certs.tar.gz')
+            return
+        source = os.path.abspath(os.path.expanduser(args.batch_in[0]))
+        output = os.path.abspath(os.path.expanduser(args.batch_out[0]))
+        os.chdir('appca')
+        ca = appca.ca.CA()
+        if not args.config or args.config[0] == '':
+            args.config = ['appcacnf']
+        ca.init_config(config=args.config[0], CACERT=get_value(args.cacert), OCSPPORT=get_value(args.ocspport),
+                       CACHAIN=get_value(args.cachain), OCSP=get_value(args.ocsp), SIGCERT=get_value(args.sigcert),
+                       SIGCHAIN=get_value(args.sigchain), SELFSIGN='n', OPENSSL_PATH=get_value(args.opensslpath),
+                       WORKERS=get_value(args.caworkers), BACKEND=get_value(args.certbackend),
+                       OCSPCACHE=get_value(args.ocspcache))
+        ca.enroll_batch(source, output)
+    elif args.package[0] == 'p52':
+        os.chdir('appca')
+        ca = appca.ca.CA()
+        if not args.config or args.config[0] == '':
+            args.config = ['appcacnf']
+        ca.init_config(config=args.config[0], OCSPPORT=get_value(args.ocspport),
+                       OPENSSL_PATH=get_value(args.opensslpath))
+        ca.publish_crl(args.crlfull)
     elif args.package[0] == 'p6':
         os.chdir('appserver')
         server = appserver.server.Server()
@@ -371,16 +458,25 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
@@ -403,22 +499,34 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
                              PASSWORD=get_value(args.passwd), USER=get_value(args.user),
                              SINK_INTERFACE=get_value(args.sink_interface), CLIENT_SCRIPT=get_value(args.client_script),
-                             TYPE='server')
+                             SINKMODE=get_value(args.sinkmode), SINKSOCKETS=get_value(args.sinksockets),
+                             SINKWORKERS=get_value(args.sinkworkers), SINKLOG=get_value(args.sinklog),
+                             STATSPORT=get_value(args.statsport), HANDSHAKES=get_value(args.handshakes),
+                             HANDSHAKETIMEOUT=get_value(args.handshake_timeout), TYPE='server')
         exp.start_sink(dtls=args.dtls)
     elif args.package[0] == 'p83':
         os.chdir('testbed')
@@ -435,16 +543,25 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
@@ -472,16 +589,25 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
@@ -512,16 +638,25 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
@@ -544,23 +679,33 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
                              PASSWORD=get_value(args.passwd), USER=get_value(args.user),
                              SINK_INTERFACE=get_value(args.sink_interface), CLIENT_SCRIPT=get_value(args.client_script),
                              TYPE='server')
-        exp.analyze()
+        exp.analyze(workers=int(get_value(args.workers) or cpu_count()),
+                    cache_dir='' if args.nocache else 'logs/.cache')
     elif args.package[0] == 'p87':  # stop experiment
         os.chdir('testbed')
         if args.exp_config is not None:
@@ -581,16 +726,25 @@ def main():
                                CERT=get_value(args.certpath), CSR=get_value(args.csr),
                                CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                                SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                               CERT_REQS=get_value(args.certreq), TIMEZONE=get_value(args.timezone),
+                               CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                               CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                               OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                               TIMEZONE=get_value(args.timezone),
                                SYNCTIME=get_value(args.synctime), REFLOWPAN=get_value(args.rflowpan),
                                SYSWAIT=get_value(args.syswait), PAYLOADLEN=get_value(args.payloadlen),
                                DATE=get_value(args.date), SENDTIME=get_value(args.sendtime),
-                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum), TYPE='client')
+                               SENDRATE=get_value(args.sendrate), DEVNUM=get_value(args.devnum),
+                               TRAFFIC=get_value(args.traffic), BURSTSIZE=get_value(args.burstsize),
+                               TRACEFILE=get_value(args.tracefile), SENDLOG=get_value(args.sendlog),
+                               TYPE='client')
         exp.init_sink_config(exp_config=args.exp_config[1], CAIP=get_value(args.caip), CAPORT=get_value(args.caport),
                              CERT=get_value(args.certpath), CSR=get_value(args.csr),
                              CACERT=get_value(args.cacert), SK=get_value(args.sk), SERVERIP=get_value(args.serverip),
                              SERVERPORT=get_value(args.serverport), CACHAIN=get_value(args.cacert),
-                             CERT_REQS=get_value(args.certreq), ROUTER_IP6=get_value(args.router_ip6),
+                             CERT_REQS=get_value(args.certreq), RESUME=get_value(args.resume),
+                             CIPHERS=get_value(args.ciphers), BACKEND=get_value(args.certbackend),
+                             OCSP=get_value(args.ocsp), STAPLE=get_value(args.staple),
+                             ROUTER_IP6=get_value(args.router_ip6),
                              CLIENT_IP6=get_value(args.client_ip6), CLIENT_IP4=get_value(args.client_ip4),
                              DATE=get_value(args.date), CLIENT_WKD=get_value(args.client_workdir),
                              ROUTER_WKD=get_value(args.router_workdir), SINK2CLIENT=get_value(args.sink2client),
@@ -23,10 +23,19 @@ from datetime import datetime
 import os
 import sys
 import subprocess
+import time
+import csv
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
 
 sys.path.insert(0, '../../')
 sys.path.insert(0, '../../../')
 from smit import utils
+import sinkrecord
+import pcapindex
+import analysiscache
+import payload
 
 
 class Analysis(object):
@@ -37,7 +46,11 @@ class Analysis(object):
     sink_data = {'LogTime': [], 'Sequence': [], 'Message': [], 'SentTimestamp': [], 'RcvdTimeStamp': [], 'TimeDiff': [],
                  'SentPakcets': 0, 'RcvdPackets': 0}
     sink_summary = {'Client IP': [], '(7) Sink Eth': [], '(8) Sink Rcvd': [], 'Packet Loss': [], 'Latency (ms)': [],
-                    'Start': [], 'End': [], 'Running time (s)': [], 'Client sent': [], }
+                    'Start': [], 'End': [], 'Running time (s)': [], 'Client sent': [], 'Latency p50 (ms)': [],
+                    'Latency p90 (ms)': [], 'Latency p95 (ms)': [], 'Latency p99 (ms)': [], 'Latency p99.9 (ms)': [],
+                    'Jitter (ms)': []}
+    sink_latency = {}  # latency (in milliseconds) of every received packet: client ip -> numpy.ndarray
+    sink_throughput = {}  # received packets per second: client ip -> pandas.Series indexed by time
     router_summary = {'Client IP': [], '(4) Router wpan0': [], '(5) Router lowpan0': [], '(6) Router eth0': []}
     client_summary = {'Client IP': [], '(1) Client Send': [], '(2) Client lowpan0': [], '(3) Client wpan0': []}
     run_time = []  # store the begin,end time of client program. this is a list of tuple (client ip, begin_time,
@@ -46,37 +59,149 @@ class Analysis(object):
                       # sink ip, sink port)
     router_mac = ''
     utl = utils.Utils()
+    SINK_COLUMNS = ['LogTime', 'Sequence', 'Message', 'SentTimestamp', 'RcvdTimeStamp', 'ConnInfo']  # sink log fields
+    PERCENTILES = [50, 90, 95, 99, 99.9]  # percentiles of latency in the summary
+    HISTOGRAM_BIN = 10  # width (in milliseconds) of the bins of latency histogram
+    DAY_MS = 86400000  # milliseconds of a day
 
-    def __init__(self):
+    def __init__(self, cache_dir=''):
         """Constructor initializes variables
+
+        :param cache_dir: path to the directory to cache the intermediate results of log files, the results are not
+                          cached if it is empty.
+        :type cache_dir: str.
         """
+        self.pcaps = {}  # indexes of capture files which have been read: absolute path -> PcapIndex
+        self.cache_dir = cache_dir
+        self.cache = analysiscache.AnalysisCache(cache_dir)
 
     def read_sink_data(self, file):
-        """Read a formatted file line by line. The format: Date Time ClientID SequenceNum MessagePld Timestamp ConnInfo
+        """Read a formatted file in one pass into typed arrays.
+           The format: Date Time<TAB>SequenceNum<TAB>MessagePld<TAB>SentTimestamp<TAB>RcvdTimestamp<TAB>ConnInfo
         :param file: a file name.
         :type file: str.
         """
         try:
-            with open(file) as s_file:
-                for num, line in enumerate(s_file, 1):
-                    words = str(line).split()
-                    self.sink_data['LogTime'].append(words[0] + ' ' + words[1])
-                    self.sink_data['Sequence'].append(words[2])
-                    self.sink_data['Message'].append(words[3])
-                    self.sink_data['SentTimestamp'].append(words[4])
-                    self.sink_data['RcvdTimeStamp'].append(words[5])
-                    self.sink_data['TimeDiff'].append(self.time_diff(words[4], words[5]))
-                    self.sink_data['RcvdPackets'] = num
-                    self.sink_data['SentPackets'] = words[2]
-                    if num == 1:  # Get the client connection information.
-                        info = words[6].split('|')  # client_info format: client|ip.port|sink|ip.port
-                        client_ip, client_port = info[1].rsplit('.', 1)
-                        sink_ip, sink_port = info[3].rsplit('.', 1)
-                        if self.client_info.count((client_ip, client_port, sink_ip, sink_port)) == 0:
-                            self.client_info.append((client_ip, client_port, sink_ip, sink_port))
-        except IOError:
+            df = pd.read_csv(file, sep='\t', header=None, names=self.SINK_COLUMNS, usecols=range(6), dtype=str,
+                             quoting=csv.QUOTE_NONE, na_filter=False)
+        except (IOError, pd.errors.EmptyDataError):
             print ('ERROR: cannot read the file: \"' + file + '\".')
             return {}
+        if len(df) == 0:
+            return {}
+        seq = pd.to_numeric(df['Sequence'], errors='coerce').fillna(0).astype(np.int64).values
+        self.set_sink_data(df['LogTime'].values, seq, df['Message'].values, self.to_ms(df['SentTimestamp']),
+                           self.to_ms(df['RcvdTimeStamp']), df['ConnInfo'].iat[0])
+
+    def to_ms(self, timestamps):
+        """Convert timestamps in format 'HHMMSSXXX' to milliseconds of the day. Invalid timestamps are converted to -1.
+
+        :param timestamps: timestamps.
+        :type timestamps: pandas.Series.
+
+        Return:
+                numpy.ndarray - milliseconds of the day.
+        """
+        num = pd.to_numeric(timestamps, errors='coerce').fillna(-1).astype(np.int64).values
+        ms = (num // 10000000) * 3600000 + (num // 100000 % 100) * 60000 + (num // 1000 % 100) * 1000 + num % 1000
+        return np.where(num < 0, -1, ms)
+
+    def time_diffs(self, sent, rcvd):
+        """Return the time differences (in milliseconds) between arrays of sent and received timestamps, computed in
+           the same way as time_diff. The difference is 0 if any of timestamps is invalid (see valid_diffs).
+
+        :param sent: sent timestamps in milliseconds of the day.
+        :param rcvd: received timestamps in milliseconds of the day.
+        :type sent: numpy.ndarray.
+        :type rcvd: numpy.ndarray.
+
+        Return:
+                numpy.ndarray - time differences.
+        """
+        diff = np.abs(rcvd - sent)
+        diff = np.minimum(diff, self.DAY_MS - diff)  # the timestamps are on both sides of midnight
+        return np.where((sent < 0) | (rcvd < 0), 0, diff)
+
+    def valid_diffs(self):
+        """Return the latency (in milliseconds) of the received packets whose timestamps are valid, in the order of
+           arrival.
+
+        Return:
+                numpy.ndarray - latency samples.
+        """
+        valid = (self.sink_data['SentTimestamp'] >= 0) & (self.sink_data['RcvdTimeStamp'] >= 0)
+        return np.asarray(self.sink_data['TimeDiff'])[valid]
+
+    def set_sink_data(self, log_time, seq, message, sent, rcvd, conn_info):
+        """Store the arrays of a sink log in the data storage.
+
+        :param log_time: log time of packets, format: DD/MM/YYYY HH:MM:SS.
+        :param seq: sequence numbers.
+        :param message: payloads other than sequence number and timestamp, or payload lengths.
+        :param sent: sent timestamps in milliseconds of the day.
+        :param rcvd: received timestamps in milliseconds of the day.
+        :param conn_info: client connection information, format: client|ip.port|sink|ip.port.
+        :type log_time: numpy.ndarray.
+        :type seq: numpy.ndarray.
+        :type message: numpy.ndarray.
+        :type sent: numpy.ndarray.
+        :type rcvd: numpy.ndarray.
+        :type conn_info: str.
+        """
+        self.sink_data['LogTime'] = log_time
+        self.sink_data['Sequence'] = seq
+        self.sink_data['Message'] = message
+        self.sink_data['SentTimestamp'] = sent
+        self.sink_data['RcvdTimeStamp'] = rcvd
+        self.sink_data['TimeDiff'] = self.time_diffs(sent, rcvd)
+        self.sink_data['RcvdPackets'] = len(seq)
+        self.sink_data['SentPackets'] = int(seq[-1])
+        info = conn_info.split('|')  # client_info format: client|ip.port|sink|ip.port
+        if len(info) == 4:
+            client_ip, client_port = info[1].rsplit('.', 1)
+            sink_ip, sink_port = info[3].rsplit('.', 1)
+            if self.client_info.count((client_ip, client_port, sink_ip, sink_port)) == 0:
+                self.client_info.append((client_ip, client_port, sink_ip, sink_port))
+
+    def read_sink_records(self, file):
+        """Read a binary record log of sink server (see sinkrecord) into NumPy arrays.
+
+        :param file: path to the record log.
+        :type file: str.
+
+        Return:
+                tuple - (records, clients), where records is a structured array with fields seq, length, sent, rcvd and
+                client, and clients is a dictionary of client id -> client connection information.
+        """
+        with open(file, 'rb') as r_file:
+            if r_file.read(len(sinkrecord.MAGIC)) != sinkrecord.MAGIC:
+                raise IOError('File \"' + file + '\" is not a record log.')
+            records = np.fromfile(r_file, dtype=np.dtype(sinkrecord.RECORD_DTYPE))
+        return records, sinkrecord.read_clients(file[:-len(sinkrecord.EXT)])
+
+    def load_sink_records(self, file):
+        """Read a binary record log of sink server into the data storage, in the same way as read_sink_data.
+
+        :param file: path to the record log.
+        :type file: str.
+        """
+        try:
+            records, clients = self.read_sink_records(file)
+        except IOError as e:
+            print ('ERROR: cannot read the file: \"' + file + '\". ' + str(e))
+            return {}
+        if len(records) == 0:
+            return {}
+        # Convert received time to local time once per distinct second.
+        seconds, inverse = np.unique(records['rcvd'] // 1000, return_inverse=True)
+        local = [time.localtime(second) for second in seconds]
+        log_time = np.array([time.strftime('%d/%m/%Y %H:%M:%S', t) for t in local])
+        day_ms = np.array([(t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec) * 1000 for t in local], dtype=np.int64)
+        rcvd = day_ms[inverse] + records['rcvd'] % 1000
+        sent = records['sent'].astype(np.int64)
+        sent[sent == sinkrecord.SENT_NONE] = -1
+        self.set_sink_data(log_time[inverse], records['seq'].astype(np.int64), records['length'], sent, rcvd,
+                           clients.get(int(records['client'][0]), ''))
 
     def get_sink_data(self):
         """Get the data stored in the data storage.
@@ -97,18 +222,63 @@ class Analysis(object):
             begin = after
             after = temp
         difference = after - begin
-        return difference.microseconds / 1000
+        diff = difference.seconds * 1000 + difference.microseconds / 1000
+        return min(diff, self.DAY_MS - diff)  # the timestamps are on both sides of midnight
 
     def get_latency(self):
         """Return the average latency (in milliseconds) of the received packets based on the dataset from log file.
 
         :return:
         """
-        time_diff = 0
-        for item in self.sink_data['TimeDiff']:
-            time_diff += int(item)
+        return float(np.sum(self.sink_data['TimeDiff'])) / self.sink_data['RcvdPackets']
+
+    def get_latency_percentiles(self):
+        """Return the percentiles (see PERCENTILES) of latency (in milliseconds) of the received packets.
+
+        Return:
+                list - latency percentiles.
+        """
+        return self.percentiles(self.valid_diffs())
+
+    def percentiles(self, samples):
+        """Return the percentiles (see PERCENTILES) of latency samples.
+
+        :param samples: latency samples in milliseconds.
+        :type samples: numpy.ndarray.
+
+        Return:
+                list - latency percentiles, NaN if there is no sample.
+        """
+        if len(samples) == 0:
+            return [float('nan')] * len(self.PERCENTILES)
+        return [float(value) for value in np.percentile(samples, self.PERCENTILES)]
 
-        return float(time_diff) / self.sink_data['RcvdPackets']
+    def jitter(self, samples):
+        """Return the jitter of latency samples, i.e., the mean absolute difference between the latency of consecutive
+           packets.
+
+        :param samples: latency samples in milliseconds, in the order of arrival.
+        :type samples: numpy.ndarray.
+
+        Return:
+                float - jitter in milliseconds, NaN if there are less than two samples.
+        """
+        if len(samples) < 2:
+            return float('nan')
+        return float(np.mean(np.abs(np.diff(samples))))
+
+    def get_throughput(self):
+        """Return the number of received packets in every second from the first to the last packet, based on the log
+           time of packets.
+
+        Return:
+                pandas.Series - received packets indexed by time.
+        """
+        log_time = np.asarray(self.sink_data['LogTime'])
+        starts = np.flatnonzero(np.r_[True, log_time[1:] != log_time[:-1]])  # the first packet of every second
+        counts = np.diff(np.r_[starts, len(log_time)])
+        series = pd.Series(counts, index=pd.to_datetime(log_time[starts], format='%d/%m/%Y %H:%M:%S'))
+        return series.groupby(level=0).sum().asfreq('S', fill_value=0)
 
     def clear_sink_alydata(self):
         """Reset dataset and other stateful parameters for sink log analysis.
@@ -118,73 +288,175 @@ class Analysis(object):
                           'TimeDiff': [],
                           'SentPakcets': 0, 'RcvdPackets': 0}
 
-    def analyze_sink(self, sink_info):
+    def summarize_sink_log(self, path):
+        """Return the partial summary of a sink log file (text log or record log), which is read from the cache if the
+           log file is not changed since it was analyzed.
+
+        :param path: path to the log file.
+        :type path: str.
+
+        Return:
+                dict - partial summary, see read_sink_summary.
+        """
+        paths = [path]
+        if path.endswith(sinkrecord.EXT):
+            paths.append(path[:-len(sinkrecord.EXT)] + sinkrecord.CLIENTS_EXT)
+        return self.cache.cached('sink', paths, self.read_sink_summary, path)
+
+    def read_sink_summary(self, path):
+        """Analyze a sink log file (text log or record log) and return its partial summary.
+
+        :param path: path to the log file.
+        :type path: str.
+
+        Return:
+                dict - partial summary with the keys of sink_summary (except '(7) Sink Eth'), 'Client info' and
+                'Latency samples' (latency of the received packets with valid timestamps) and 'Throughput samples'
+                (received packets per second), or None if the log file is empty or cannot be read.
+        """
+        self.client_info = []
+        self.clear_sink_alydata()
+        filename = os.path.basename(path)
+        if filename.endswith(sinkrecord.EXT):
+            self.load_sink_records(path)
+            filename = filename[:-len(sinkrecord.EXT)]
+        else:
+            self.read_sink_data(path)
+        data_set = self.get_sink_data()
+        if data_set['RcvdPackets'] == 0:  # empty or unreadable log file.
+            return None
+        sent = int(data_set['SentPackets'])
+        start = data_set['LogTime'][0].split()
+        end = data_set['LogTime'][-1].split()
+        begin = datetime.strptime(start[0] + ' ' + start[1], '%d/%m/%Y %H:%M:%S')
+        after = datetime.strptime(end[0] + ' ' + end[1], '%d/%m/%Y %H:%M:%S')
+        difference = after - begin
+        summary = {'Log file': filename, 'Client IP': filename[:-21], 'Client sent': sent,
+                   '(8) Sink Rcvd': int(data_set['RcvdPackets']),
+                   'Packet Loss': 1 - float(data_set['RcvdPackets']) / sent, 'Latency (ms)': self.get_latency(),
+                   'Start': start[0] + ' ' + start[1], 'End': end[0] + ' ' + end[1],
+                   'Running time (s)': int(difference.days * 86400 + difference.seconds),
+                   'Client info': self.client_info, 'Latency samples': self.valid_diffs(),
+                   'Jitter (ms)': self.jitter(self.valid_diffs()), 'Throughput samples': self.get_throughput()}
+        for i, percentile in enumerate(self.get_latency_percentiles()):
+            summary['Latency p' + str(self.PERCENTILES[i]) + ' (ms)'] = percentile
+        self.clear_sink_alydata()
+        return summary
+
+    def sink_logs(self, log_path):
+        """Return the log files in the exp directory of sink logs, which contains the application layer logs from
+           clients to sink server.
+
+        :param log_path: path to the sink log directory.
+        :type log_path: str.
+
+        Return:
+                list - paths to the log files.
+        """
+        logs = []
+        for root, dirs, filenames in os.walk(os.path.join(log_path, 'exp')):
+            for filename in filenames:
+                if not filename.endswith(sinkrecord.CLIENTS_EXT):  # skip client tables of record logs.
+                    logs.append(os.path.join(root, filename))
+        return logs
+
+    def merge_sink(self, summaries):
+        """Merge the partial summaries of sink log files into sink_summary.
+
+        :param summaries: partial summaries returned by summarize_sink_log.
+        :type summaries: list.
+        """
+        for summary in summaries:
+            if summary is None:
+                continue
+            # print statistic summary
+            print ('=============================================================')
+            print ('Log file: ' + summary['Log file'])
+            print ('Total sent packets: ' + str(summary['Client sent']))
+            print ('Received packets: ' + str(summary['(8) Sink Rcvd']))
+            print ('Packet Loss: ' + str(summary['Packet Loss']))
+            print ('Average latency: ' + str(summary['Latency (ms)']))
+            print ('Latency p99 (ms): ' + str(summary['Latency p99 (ms)']))
+            for key in self.sink_summary:
+                if key in summary:
+                    self.sink_summary[key].append(summary[key])
+            # Logs of Ethernet interface of sink server are not analyzed.
+            self.sink_summary['(7) Sink Eth'].append(0)
+            # add client ip, begin and end time to list.
+            self.run_time.append((summary['Client IP'], summary['Start'], summary['End']))
+            for info in summary['Client info']:
+                if self.client_info.count(info) == 0:
+                    self.client_info.append(info)
+            # keep the samples of latency distribution and throughput, a client may have several log files.
+            client_ip = summary['Client IP']
+            if client_ip in self.sink_latency:
+                self.sink_latency[client_ip] = np.concatenate([self.sink_latency[client_ip],
+                                                               summary['Latency samples']])
+                self.sink_throughput[client_ip] = self.sink_throughput[client_ip].add(summary['Throughput samples'],
+                                                                                      fill_value=0)
+            else:
+                self.sink_latency[client_ip] = summary['Latency samples']
+                self.sink_throughput[client_ip] = summary['Throughput samples']
+
+    def latency_report(self):
+        """Return the reports of latency distribution and throughput of the sink logs which have been analyzed:
+            Latency: number of samples, mean, max, jitter and percentiles of latency of every client and all clients.
+            Latency histogram: number of packets in every latency bin (see HISTOGRAM_BIN) of every client.
+            Throughput: received packets per second of every client.
+
+        Return:
+                dict - report name -> pandas.DataFrame, empty if no sink log has been analyzed.
+        """
+        clients = sorted(self.sink_latency)
+        if not clients:
+            return {}
+        samples = dict(self.sink_latency)
+        samples['All'] = np.concatenate([self.sink_latency[client] for client in clients])
+        names = clients + ['All']
+        jitters = [self.jitter(samples[client]) for client in clients]
+        jitters.append(float(np.nanmean(jitters)) if not np.all(np.isnan(jitters)) else float('nan'))
+        rows = []
+        for i, name in enumerate(names):
+            values = samples[name]
+            mean = float(np.mean(values)) if len(values) else float('nan')
+            top = float(np.max(values)) if len(values) else float('nan')
+            rows.append([len(values), mean, top, jitters[i]] + self.percentiles(values))
+        columns = ['Samples', 'Mean (ms)', 'Max (ms)', 'Jitter (ms)']
+        columns += ['p' + str(percentile) + ' (ms)' for percentile in self.PERCENTILES]
+        df_latency = pd.DataFrame(rows, index=names, columns=columns)
+        df_latency.index.name = 'Client IP'
+        top = int(np.max(samples['All'])) if len(samples['All']) else 0
+        edges = np.arange(0, top + 2 * self.HISTOGRAM_BIN, self.HISTOGRAM_BIN)
+        df_histogram = pd.DataFrame(dict((name, np.histogram(samples[name], edges)[0]) for name in names),
+                                    index=edges[:-1], columns=names)
+        df_histogram.index.name = 'Latency from (ms)'
+        df_throughput = pd.concat([self.sink_throughput[client] for client in clients], axis=1, keys=clients)
+        df_throughput = df_throughput.fillna(0).astype(np.int64)
+        df_throughput['All'] = df_throughput.sum(axis=1)
+        df_throughput.index.name = 'Time'
+        return {'Latency': df_latency, 'Latency histogram': df_histogram, 'Throughput': df_throughput}
+
+    def analyze_sink(self, sink_info, pool=None):
         """This function analysis sink server logs and output a summary of logs.
 
         :param sink_info: list of sink server information, including [ip, port, interface, log_path].
+        :param pool: process pool to analyze the log files in parallel, the log files are analyzed in this process if
+                     it is None.
         :type sink_info: list
+        :type pool: multiprocessing.Pool
 
         Return:
                 A summary of analyzed data. The returned values are in a dictionary.
         """
-        # analysis = Analysis()
-        server_ip = sink_info[0]
-        server_port = sink_info[1]
-        interface = sink_info[2]
         log_path = sink_info[3]
-        cur_path = os.path.abspath(os.path.curdir)
-        os.chdir(log_path)
-
-        # Analyze logs in exp directory which contains the application layer logs from clients to sink server.
-        for root, dirs, filenames in os.walk('exp'):
-            for filename in filenames:
-                os.chdir(root)
-                self.read_sink_data(filename)
-                data_set = self.get_sink_data()
-                loss_rate = 1 - float(data_set['RcvdPackets']) / int(str(data_set['SentPackets']).lstrip('0'))
-
-                # print statistic summary
-                print ('=============================================================')
-                print ('Log file: ' + filename)
-                print ('Total sent packets: ' + str(data_set['SentPackets']).lstrip('0'))
-                print ('Received packets: ' + str(data_set['RcvdPackets']))
-                print ('Packet Loss: ' + str(loss_rate))
-                print ('Average latency: ' + str(self.get_latency()))
-                start = data_set['LogTime'][0].split()
-                end = data_set['LogTime'][-1].split()
-                begin = start[0] + ' ' + start[1]
-                after = end[0] + ' ' + end[1]
-                begin = datetime.strptime(begin, '%d/%m/%Y %H:%M:%S')
-                after = datetime.strptime(after, '%d/%m/%Y %H:%M:%S')
-                difference = after - begin
-                self.sink_summary['Packet Loss'].append(loss_rate)
-                self.sink_summary['Client sent'].append(int(str(data_set['SentPackets']).lstrip('0')))
-                self.sink_summary['(8) Sink Rcvd'].append(int(str(data_set['RcvdPackets'])))
-                self.sink_summary['Latency (ms)'].append(float(self.get_latency()))
-                self.sink_summary['Client IP'].append(filename[:-21])
-                self.sink_summary['Start'].append(start[0] + ' ' + start[1])
-                self.sink_summary['End'].append(end[0] + ' ' + end[1])
-                self.sink_summary['Running time (s)'].append(int(difference.days * 86400 + difference.seconds))
-                self.run_time.append((filename[:-21], start[0] + ' ' + start[1], end[0] + ' ' + end[
-                    1]))  # add client ip, endtime to list. only takes time w/o date.
-                self.clear_sink_alydata()
-                os.chdir(cur_path + '/logs/sink')  # change back to package directory
-        # Analyze logs of Ethernet interface of sink server.
-        for client in self.sink_summary['Client IP']:
-            dst_port = server_port
-            for info in self.client_info:  # info = (client_ip, client_port, sink_ip, sink_port)
-                if client == info[0]:
-                    dst_port = info[3]
-                    break
-            print 'Sink analysis for client IP: ' + str(client)
-            begin_time, end_time = self.get_run_time(client)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presence lines
-            count = 0
-            self.sink_summary['(7) Sink Eth'].append(count)
-        os.chdir(cur_path)
-
+        client_info = self.client_info
+        logs = self.sink_logs(log_path)
+        if pool is None:
+            summaries = [self.summarize_sink_log(log) for log in logs]
+        else:
+            summaries = pool.map(summarize_sink_log, [(self.context(), log) for log in logs])
+        self.client_info = client_info
+        self.merge_sink(summaries)
         return self.sink_summary
 
     def get_run_time(self, ip):
@@ -233,14 +505,183 @@ class Analysis(object):
             raise IOError("IP address: " + ip + " is invalid.")
         return mac
 
-    def analyze_router(self, logdir, client_info=None):
+    def get_pcap(self, log):
+        """Return the index of a capture file. Every capture file is read only once, and the index is read from the
+           cache if the capture file is not changed since it was indexed.
+
+        :param log: path to the capture file.
+        :type log: str.
+
+        Return:
+                PcapIndex - index of the capture file.
+        """
+        path = os.path.abspath(log)
+        if path not in self.pcaps:
+            self.pcaps[path] = self.cache.cached('pcap', [path], pcapindex.PcapIndex, path)
+        return self.pcaps[path]
+
+    def count_lines(self, path):
+        """Count the lines of a file as "wc -l".
+
+        :param path: path to the file.
+        :type path: str.
+
+        Return:
+                int - number of lines.
+        """
+        lines = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), ''):
+                lines += chunk.count('\n')
+        return lines
+
+    def count_ip6_packets(self, log, client_ip, sink_ip, sink_port):
+        """Count the packets sent from a client to sink server in a capture file during the running time of the client.
+           The capture file is analyzed by tcpdump if it cannot be read by PcapIndex.
+
+        :param log: path to the capture file.
+        :param client_ip: client IP address.
+        :param sink_ip: sink IP address.
+        :param sink_port: sink port.
+        :type log: str.
+        :type client_ip: str.
+        :type sink_ip: str.
+        :type sink_port: str.
+
+        Return:
+                int - number of packets.
+        """
+        begin_time, end_time = self.get_run_time(client_ip)
+        try:
+            return self.get_pcap(log).count_ip6(client_ip.split('%')[0], sink_ip.split('%')[0], sink_port,
+                                                pcapindex.to_second(begin_time), pcapindex.to_second(end_time))
+        except IOError as e:
+            print (str(e) + ' Analyzing by tcpdump.')
+            return self.count_by_tcpdump("sudo tcpdump -r " + log + " -ttttnnvvS dst " + sink_ip + " and dst port " +
+                                         sink_port + " and src " + client_ip, 'cat', begin_time, end_time)
+
+    def count_wpan_frames(self, log, client_ip):
+        """Count the IEEE 802.15.4 frames sent from a client to border router in a capture file during the running time
+           of the client. The capture file is analyzed by tcpdump if it cannot be read by PcapIndex.
+
+        :param log: path to the capture file.
+        :param client_ip: client IP address.
+        :type log: str.
+        :type client_ip: str.
+
+        Return:
+                int - number of frames.
+        """
+        begin_time, end_time = self.get_run_time(client_ip)
+        try:
+            return self.get_pcap(log).count_wpan(self.router_mac, self.ip6_to_mac(client_ip),
+                                                 pcapindex.to_second(begin_time), pcapindex.to_second(end_time))
+        except IOError as e:
+            print (str(e) + ' Analyzing by tcpdump.')
+            read_log = os.path.join(os.path.dirname(log), 'read_' + os.path.basename(log))
+            subprocess.call('sudo tcpdump -r ' + log + ' -ttttnnvvS > ' + read_log, shell=True)
+            return self.count_by_tcpdump('cat ' + read_log, "grep -e \'" + self.router_mac + " <\' | grep -e \'" +
+                                         self.ip6_to_mac(client_ip) + "\'", begin_time, end_time)
+
+    def count_by_tcpdump(self, source, line_filter, begin_time, end_time):
+        """Count the lines of tcpdump output during the running time of a client by shell pipelines.
+
+        :param source: command printing tcpdump output.
+        :param line_filter: command filtering the lines to be counted.
+        :param begin_time: begin time of client, format: YYYY-MM-DD HH:MM:SS.
+        :param end_time: end time of client, format: YYYY-MM-DD HH:MM:SS.
+        :type source: str.
+        :type line_filter: str.
+        :type begin_time: str.
+        :type end_time: str.
+
+        Return:
+                int - number of lines.
+        """
+        dup = 0  # multiple presence lines
+        count = 0
+        if begin_time != '' and end_time != '':  # begin/end time presented, count more precisely.
+            proc = subprocess.Popen(source + " | " + line_filter + " | grep -c -e \'" + end_time + "'",
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+            (out, err) = proc.communicate()
+            dup = int(out.strip())
+            proc = subprocess.Popen(source + " | sed -n -e '/" + begin_time.replace(':', '\:') + "/,/" +
+                                    end_time.replace(':', '\:') + "/p\' | " + line_filter + " | wc -l",
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+            (out, err) = proc.communicate()
+            count = int(out.strip())
+        if count == 0:  # begin/end time does not present or record not found, trying to count as usual
+            proc = subprocess.Popen(source + " | " + line_filter + " | wc -l", stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, shell=True)
+            (out, err) = proc.communicate()
+            count = int(out.strip())
+        if dup > 1:  # there are multiple lines with the same end_time point.
+            count = count + dup - 1
+        return count
+
+    def read_router_mac(self, logdir):
+        """Get the router mac from router.info in the router log directory.
+
+        :param logdir: path to the router log directory.
+        :type logdir: str
+        """
+        with open(os.path.join(logdir, 'router.info'), 'r') as router_file:
+            started = False
+            for (num, line) in enumerate(router_file, 1):
+                if str(line).find('lowpan0') != -1:  # lowpan information started.
+                    started = True
+                if started:
+                    if str(line).find('Scope:Link') != -1:  # found the line contain lladdr.
+                        pos_begin = str(line).find('fe80::')  # begin position of lladdr.
+                        pos_end = str(line).find('/', pos_begin)  # end position of lladdr.
+                        self.router_mac = self.ip6_to_mac(line[pos_begin: pos_end])
+                        break
+
+    def count_capture(self, log, kind, clients):
+        """Count the packets of clients in a capture file.
+
+        :param log: path to the capture file.
+        :param kind: "ip6" to count IPv6 packets sent to sink server, or "wpan" to count IEEE 802.15.4 frames sent to
+                     border router.
+        :param clients: list of tuple (client_ip, sink_ip, sink_port).
+        :type log: str.
+        :type kind: str.
+        :type clients: list.
+
+        Return:
+                list - number of packets of every client.
+        """
+        if kind == 'wpan':
+            return [self.count_wpan_frames(log, client[0]) for client in clients]
+        return [self.count_ip6_packets(log, client[0], client[1], client[2]) for client in clients]
+
+    def router_tasks(self, logdir, client_info):
+        """Return the analysis tasks of border router logs, one task for each capture file.
+
+        :param logdir: path to the router log directory.
+        :param client_info: list of tuple (client_ip, client_port, sink_ip, sink_port).
+        :type logdir: str
+        :type client_info: list
+
+        Return:
+                list - tasks in the form of (summary key, capture file, kind, clients).
+        """
+        clients = [(client[0], client[2], client[3]) for client in client_info]
+        return [('(5) Router lowpan0', os.path.join(logdir, 'lowpan0.log'), 'ip6', clients),
+                ('(6) Router eth0', os.path.join(logdir, 'eth0.log'), 'ip6', clients),
+                ('(4) Router wpan0', os.path.join(logdir, 'wpan0.log'), 'wpan', clients)]
+
+    def analyze_router(self, logdir, client_info=None, pool=None):
         """This function analyzes border router logs and output a summary of data.
 
         :param client_info: information to be used in the analysis, including a list of tuple (client_ip, client_port,
                             sink_ip, sink_port)
         :param logdir: path to the router log directory.
+        :param pool: process pool to analyze the capture files in parallel, the capture files are analyzed in this
+                     process if it is None.
         :type client_info: list
         :type logdir: str
+        :type pool: multiprocessing.Pool
 
         Return:
                 dict - a summary of logs.
@@ -249,212 +690,209 @@ class Analysis(object):
             client_info = self.client_info
         if not os.path.exists(logdir):
             raise IOError("Log directory: " + logdir + " does not exist.")
-        # Get the router mac from router.info
-        cwd = os.getcwd()
-        os.chdir(logdir)
-        with open('router.info', 'r') as router_file:
-            started = False
-            for (num, line) in enumerate(router_file, 1):
-                if str(line).find('lowpan0') != -1:  # lowpan information started.
-                    started = True
-                if started:
-                    if str(line).find('Scope:Link') != -1:  # found the line contain lladdr.
-                        pos_begin = str(line).find('fe80::')  # begin position of lladdr.
-                        pos_end = str(line).find('/', pos_begin)  # end position of lladdr.
-                        self.router_mac = self.ip6_to_mac(line[pos_begin: pos_end])
-                        break
-        print ('Preparing log files.')
-        subprocess.call("sudo tcpdump -r wpan0.log -ttttnnvvS > read_wpan0.log", shell=True)
-        # Analyze router logs for every client
-        for client in client_info:
-            client_ip = client[0]
-            client_port = client[1]
-            sink_ip = client[2]
-            sink_port = client[3]
-            self.router_summary['Client IP'].append(client_ip)
-            print 'Analyzing router logs for Client IP: ' + str(client_ip)
-            # Analyze lowpan0 log
-            begin_time, end_time = self.get_run_time(client_ip)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presence lines
-            count = 0
-            if begin_time != '' and end_time != '':  # begin/end time presented, count more precisely.
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | grep -c -e \'" + end_time.replace('\:', ':') +
-                    "'", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                dup = int(out.strip())
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | sed -n -e '/" + begin_time + "/,/" + end_time +
-                    "/p\' | wc -l", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if count == 0:  # begin/end time does not present or not record found, trying to count as usual
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | wc -l",
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if dup > 1:  # there are multiple lines with the same end_time point.
-                count = count + dup - 1
-            self.router_summary['(5) Router lowpan0'].append(count)
-            # Analyze eth0 log
-            begin_time, end_time = self.get_run_time(client_ip)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presense lines
-            count = 0
-            if begin_time != '' and end_time != '':  # begin/end time presented, count more precisely.
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r eth0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | grep -c -e \'" + end_time.replace('\:', ':') +
-                    "'", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                dup = int(out.strip())
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r eth0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | sed -n -e '/" + begin_time + "/,/" + end_time +
-                    "/p\' | wc -l", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if count == 0:  # begin/end time does not present, count as usual
-                proc = subprocess.Popen(
-                    "sudo tcpdump -r eth0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | wc -l",
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if dup > 1:  # there are multiple lines with the same end_time point.
-                count = count + dup - 1
-            self.router_summary['(6) Router eth0'].append(count)
-            # Analyze wpan0 log
-            begin_time, end_time = self.get_run_time(client_ip)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presense lines
-            count = 0
-            if begin_time != '' and end_time != '':  # begin/end time presented, count more precisely.
-                proc = subprocess.Popen("grep read_wpan0.log -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                        self.ip6_to_mac(client_ip) + "\' | grep -c -e \'" +
-                                        end_time.replace('\:', ':') + "'",
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                dup = int(out.strip())
-                proc = subprocess.Popen("sed -n -e '/" + begin_time + "/,/" + end_time + "/p\' read_wpan0.log | \
-                                                    grep -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                        self.ip6_to_mac(client_ip) + "\' | wc -l",
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if count == 0:  # begin/end time does not present or record not found, trying to count as usual
-                proc = subprocess.Popen("grep read_wpan0.log -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                        self.ip6_to_mac(client_ip) + "\' | wc -l", stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE, shell=True)
-                (out, err) = proc.communicate()
-                count = int(out.strip())
-            if dup > 1:  # there are multiple lines with the same end_time point.
-                count = count + dup - 1
-            self.router_summary['(4) Router wpan0'].append(count)
-        os.chdir(cwd)
+        self.read_router_mac(logdir)
+        tasks = self.router_tasks(logdir, client_info)
+        self.merge_router(client_info, tasks, self.run_tasks(count_capture, tasks, pool))
         return self.router_summary
 
-    def analyze_client(self, log_path):
-        """This function analyze client logs and output a summary of data.
+    def merge_router(self, client_info, tasks, results):
+        """Merge the counts of capture files into router_summary.
 
-        :param log_path: directory of client log files
+        :param client_info: list of tuple (client_ip, client_port, sink_ip, sink_port).
+        :param tasks: tasks returned by router_tasks.
+        :param results: counts of every task.
+        :type client_info: list
+        :type tasks: list
+        :type results: list
+        """
+        for i, client in enumerate(client_info):
+            print 'Analyzing router logs for Client IP: ' + str(client[0])
+            self.router_summary['Client IP'].append(client[0])
+            for task, counts in zip(tasks, results):
+                self.router_summary[task[0]].append(counts[i])
+
+    def context(self):
+        """Return the context of analysis which is passed to worker processes.
 
         Return:
-                dict - a summary of logs.
+                tuple - (running time of clients, router mac, cache directory).
+        """
+        return self.run_time, self.router_mac, self.cache_dir
+
+    def run_tasks(self, func, tasks, pool=None):
+        """Run analysis tasks in a process pool or in this process.
+
+        :param func: module level function to run a task, which takes the task as the only argument.
+        :param tasks: tasks.
+        :param pool: process pool, the tasks are run in this process if it is None.
+        :type func: function.
+        :type tasks: list.
+        :type pool: multiprocessing.Pool
+
+        Return:
+                list - results of the tasks.
+        """
+        tasks = [(self.context(), task) for task in tasks]
+        if pool is None:
+            return [func(task) for task in tasks]
+        return pool.map(func, tasks)
+
+    def summarize_client_logs(self, path):
+        """Analyze the logs of a client device and return its partial summary.
+
+        :param path: path to the log directory of client.
+        :type path: str.
+
+        Return:
+                dict - partial summary with the keys of client_summary.
+        """
+        # get from conn.log for client ip, sink ip and sink port
+        client_ip = ''
+        sink_ip = ''
+        sink_port = ''
+        with open(os.path.join(path, 'conn.log'), 'r') as c_file:
+            for (num, line) in enumerate(c_file, 1):
+                if str(line).find('Client') != -1:  # line for client ip.
+                    client_ip = line.strip().split('|')[1]
+                if line.find('Sink') != -1:  # line for sink|ip.port
+                    sink_ip, sink_port = line.strip().split('|')[1].rsplit('.', 1)
+        # proceed send.log, or send.rec if the client recorded a binary send log
+        sent = payload.count_sent(path)
+        if sent is None:
+            send_log = os.path.join(path, payload.TEXT_LOG)
+            sent = self.cache.cached('lines', [send_log], self.count_lines, send_log)
+        return {'Client IP': client_ip, '(1) Client Send': sent,
+                '(2) Client lowpan0': self.count_ip6_packets(os.path.join(path, 'lowpan0.log'), client_ip, sink_ip,
+                                                             sink_port),
+                '(3) Client wpan0': self.count_wpan_frames(os.path.join(path, 'wpan0.log'), client_ip)}
+
+    def client_tasks(self, log_path):
+        """Return the analysis tasks of client logs, one task for each client device.
+
+        :param log_path: directory of client log files.
+        :type log_path: str.
+
+        Return:
+                list - paths to the log directories of clients.
         """
         if not os.path.exists(log_path):
             raise IOError("Log directory: " + log_path + " does not exist.")
-        cur_path = os.path.abspath(os.path.curdir)
-        os.chdir(log_path)
         log_dirs = []
-        for root, dirs, files in os.walk('.'):
+        for root, dirs, files in os.walk(log_path):
             log_dirs = dirs
             break
-        # Walk though the log directory and analyze data in each subdirectory.
-        for path in log_dirs:
-            os.chdir(path)
-            # get from conn.log for client ip, sink ip and sink port
-            client_ip = ''
-            sink_ip = ''
-            sink_port = ''
-            with open('conn.log', 'r') as c_file:
-                for (num, line) in enumerate(c_file, 1):
-                    if str(line).find('Client') != -1:  # line for client ip.
-                        client_ip = line.strip().split('|')[1]
-                    if line.find('Sink') != -1:  # line for sink|ip.port
-                        sink_ip, sink_port = line.strip().split('|')[1].rsplit('.', 1)
-
-            print 'Analyzing logs for Client IP: ' + str(client_ip)
-            # proceed send.log
-            p = subprocess.Popen("wc -l < send.log", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            (out, err) = p.communicate()
-            self.client_summary['(1) Client Send'].append(int(out.strip()))
-            # proceed lowpan0.log
-            begin_time, end_time = self.get_run_time(client_ip)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presence lines
-            count = 0
-            if begin_time != '' and end_time != '':  # begin/end time presented, ount more precisely.
-                p = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | grep -c -e \'" + end_time.replace('\:',
-                                                                                    ':') +
-                    "'", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                dup = int(out.strip())
-                p = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | sed -n -e '/" + begin_time + "/,/" + end_time +
-                    "/p\' | wc -l", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                count = int(out.strip())
-            if count == 0:  # begin/end time does not present or record not found, trying to count as usual
-                p = subprocess.Popen(
-                    "sudo tcpdump -r lowpan0.log -ttttnnvvS dst " + sink_ip + " and dst port " + sink_port +
-                    " and src " + client_ip + " | wc -l",
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                count = int(out.strip())
-            if dup > 1:  # there are multiple lines with the same end_time point.
-                count = count + dup - 1
-            self.client_summary['(2) Client lowpan0'].append(count)
-            # proceed wpan0.log
-            begin_time, end_time = self.get_run_time(client_ip)
-            begin_time = begin_time.replace(':', '\:')
-            end_time = end_time.replace(':', '\:')
-            dup = 0  # multiple presense lines
-            count = 0
-            subprocess.call('sudo tcpdump -r wpan0.log -ttttnnvvS > read_wpan0.log', shell=True)
-            if begin_time != '' and end_time != '':  # begin/end time presented, count more precisely.
-                p = subprocess.Popen("grep read_wpan0.log -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                     self.ip6_to_mac(client_ip) + "\' | grep -c -e \'" + end_time.replace('\:', ':') +
-                                     "'", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                dup = int(out.strip())
-                p = subprocess.Popen("sed -n -e '/" + begin_time + "/,/" + end_time + "/p\' read_wpan0.log | \
-                                        grep -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                     self.ip6_to_mac(client_ip) + "\' | wc -l",
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                count = int(out.strip())
-            if count == 0:  # begin/end time does not present, count as usual
-                p = subprocess.Popen("grep read_wpan0.log -e \'" + self.router_mac + " <\' | grep -e \'" +
-                                     self.ip6_to_mac(client_ip) + "\' | wc -l", stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE, shell=True)
-                (out, err) = p.communicate()
-                count = int(out.strip())
-            if dup > 1:  # there are multiple lines with the same end_time point.
-                count = count + dup - 1
-            self.client_summary['(3) Client wpan0'].append(count)
-            os.chdir('..')
-        os.chdir(cur_path)
+        return [os.path.join(log_path, path) for path in log_dirs]
+
+    def merge_client(self, summaries):
+        """Merge the partial summaries of clients into client_summary.
+
+        :param summaries: partial summaries returned by summarize_client_logs.
+        :type summaries: list.
+        """
+        for summary in summaries:
+            print 'Analyzing logs for Client IP: ' + str(summary['Client IP'])
+            for key in self.client_summary:
+                self.client_summary[key].append(summary[key])
+
+    def analyze_client(self, log_path, pool=None):
+        """This function analyze client logs and output a summary of data.
+
+        :param log_path: directory of client log files
+        :param pool: process pool to analyze the clients in parallel, the clients are analyzed in this process if it
+                     is None.
+        :type log_path: str.
+        :type pool: multiprocessing.Pool
+
+        Return:
+                dict - a summary of logs.
+        """
+        self.merge_client(self.run_tasks(summarize_client_logs, self.client_tasks(log_path), pool))
         return self.client_summary
+
+    def analyze_all(self, sink_info, router_logdir, client_logdir, workers=1):
+        """This function analyzes sink server, border router and client logs with a pool of worker processes. Sink logs
+           are analyzed first for the running time of clients, and then the capture files of border router and the logs
+           of clients are analyzed at the same time.
+
+        :param sink_info: list of sink server information, including [ip, port, interface, log_path].
+        :param router_logdir: path to the router log directory.
+        :param client_logdir: directory of client log files.
+        :param workers: number of worker processes.
+        :type sink_info: list
+        :type router_logdir: str
+        :type client_logdir: str
+        :type workers: int
+
+        Return:
+                tuple - (sink summary, router summary, client summary).
+        """
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            print "===== Processing sink logs ====="
+            self.analyze_sink(sink_info, pool)
+            print "===== Processing router and client logs ====="
+            if pool is None:
+                self.analyze_router(router_logdir)
+                self.analyze_client(client_logdir)
+            else:
+                if not os.path.exists(router_logdir):
+                    raise IOError("Log directory: " + router_logdir + " does not exist.")
+                self.read_router_mac(router_logdir)
+                client_info = list(self.client_info)
+                router = self.router_tasks(router_logdir, client_info)
+                router_results = pool.map_async(count_capture, [(self.context(), task) for task in router])
+                client_results = pool.map_async(summarize_client_logs,
+                                                [(self.context(), task) for task in self.client_tasks(client_logdir)])
+                self.merge_router(client_info, router, router_results.get())
+                self.merge_client(client_results.get())
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.sink_summary, self.router_summary, self.client_summary
+
+
+def worker_analysis(context):
+    """Create an Analysis object for a worker process.
+
+    :param context: context of analysis, see Analysis.context.
+    :type context: tuple.
+
+    Return:
+            Analysis - the Analysis object.
+    """
+    run_time, router_mac, cache_dir = context
+    anal = Analysis(cache_dir)
+    anal.run_time = run_time
+    anal.router_mac = router_mac
+    return anal
+
+
+def summarize_sink_log(task):
+    """Analyze a sink log file in a worker process, see Analysis.summarize_sink_log.
+
+    :param task: tuple (context, path to the log file).
+    :type task: tuple.
+    """
+    context, path = task
+    return worker_analysis(context).summarize_sink_log(path)
+
+
+def count_capture(task):
+    """Count the packets of clients in a capture file in a worker process, see Analysis.count_capture.
+
+    :param task: tuple (context, (summary key, capture file, kind, clients)).
+    :type task: tuple.
+    """
+    context, (key, log, kind, clients) = task
+    return worker_analysis(context).count_capture(log, kind, clients)
+
+
+def summarize_client_logs(task):
+    """Analyze the logs of a client device in a worker process, see Analysis.summarize_client_logs.
+
+    :param task: tuple (context, path to the log directory of client).
+    :type task: tuple.
+    """
+    context, path = task
+    return worker_analysis(context).summarize_client_logs(path)
@@ -0,0 +1,146 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+
+CACHE_VERSION = 2  # version of cached results, increase it when the format of results changes
+
+
+class AnalysisCache(object):
+    """
+    This class persists intermediate analysis results of log files in a cache directory. A result is keyed by the kind
+    of result and the paths of the log files it is computed from, and it is valid only if the size and modification
+    time of the log files are not changed, so that only changed log files are analyzed again.
+    """
+
+    def __init__(self, cache_dir):
+        """Constructor initializes variables
+
+        :param cache_dir: path to the cache directory, the cache is disabled if it is empty.
+        :type cache_dir: str.
+        """
+        self.cache_dir = cache_dir
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def fingerprint(self, paths):
+        """Return the fingerprint of log files, which includes the path, size and modification time of every file.
+
+        :param paths: paths to log files.
+        :type paths: list.
+
+        Return:
+                tuple - fingerprint, a missing file has the size and modification time None.
+        """
+        items = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+                items.append((path, stat.st_size, stat.st_mtime))
+            except OSError:
+                items.append((path, None, None))
+        return tuple(items)
+
+    def entry(self, kind, paths):
+        """Return the path to the cache file of a result.
+
+        :param kind: kind of result.
+        :param paths: paths to log files.
+        :type kind: str.
+        :type paths: list.
+        """
+        key = repr((CACHE_VERSION, kind, [os.path.abspath(path) for path in paths]))
+        return os.path.join(self.cache_dir, kind + '-' + hashlib.sha1(key).hexdigest() + '.pkl')
+
+    def get(self, kind, paths):
+        """Return the cached result of log files.
+
+        :param kind: kind of result.
+        :param paths: paths to log files.
+        :type kind: str.
+        :type paths: list.
+
+        Return:
+                object - the cached result, None if the result is not cached or the log files are changed.
+        """
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.entry(kind, paths), 'rb') as f:
+                fingerprint, result = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if fingerprint != self.fingerprint(paths):
+            return None
+        return result
+
+    def put(self, kind, paths, result, fingerprint=None):
+        """Store the result of log files. The cache file is replaced atomically, so that it can be written by parallel
+           workers.
+
+        :param kind: kind of result.
+        :param paths: paths to log files.
+        :param result: the result to be cached.
+        :param fingerprint: fingerprint of log files taken before the result was computed.
+        :type kind: str.
+        :type paths: list.
+        :type result: object.
+        :type fingerprint: tuple.
+        """
+        if not self.cache_dir:
+            return
+        if fingerprint is None:
+            fingerprint = self.fingerprint(paths)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((fingerprint, result), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.entry(kind, paths))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def cached(self, kind, paths, func, *args):
+        """Return the cached result of log files, or compute and store the result if it is not cached.
+
+        :param kind: kind of result.
+        :param paths: paths to log files.
+        :param func: function to compute the result.
+        :param args: arguments of func.
+        :type kind: str.
+        :type paths: list.
+        :type func: function.
+
+        Return:
+                object - the result.
+        """
+        result = self.get(kind, paths)
+        if result is None:
+            fingerprint = self.fingerprint(paths)
+            result = func(*args)
+            if result is not None:
+                self.put(kind, paths, result, fingerprint)
+        return result
@@ -0,0 +1,208 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import socket
+import select
+import errno
+import ctypes
+import ctypes.util
+import os
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)  # non-blocking receive flag
+MSG_WAITFORONE = 0x10000  # recvmmsg returns as soon as one packet is received
+SOCKADDR_LEN = 28  # length of sockaddr_in6
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_Iovec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t), ('msg_flags', ctypes.c_int)]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _Msghdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    """Load the recvmmsg system call from the C library.
+
+    Return:
+            function - recvmmsg, or None if it is not available on this platform.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = libc.recvmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    func.restype = ctypes.c_int
+    return func
+
+
+_recvmmsg = _load_recvmmsg()
+
+
+class BatchReceiver(object):
+    """
+    This class receives UDP packets from an IPv6 socket in batches, so that the packets which arrive together are read
+    by one wakeup instead of one system call per packet. The packets are received into a preallocated ring of buffers,
+    by recvmmsg if the C library provides it, otherwise by recvfrom_into over memoryviews of the ring.
+    """
+
+    def __init__(self, sock, batch=64, max_len=1536, use_mmsg=True):
+        """Constructor initializes variables
+
+        :param sock: a bound IPv6 UDP socket.
+        :param batch: the max number of packets received in a batch.
+        :param max_len: the max length of packet.
+        :param use_mmsg: use recvmmsg if it is available.
+        :type sock: socket.
+        :type batch: int.
+        :type max_len: int.
+        :type use_mmsg: bool.
+        """
+        self.sock = sock
+        self.batch = batch
+        self.max_len = max_len
+        self.ring = bytearray(batch * max_len)
+        self.view = memoryview(self.ring)
+        self.addrs = {}  # cache of converted client addresses: raw sockaddr -> address tuple
+        self.mmsg = None
+        if use_mmsg and _recvmmsg is not None:
+            self.init_mmsg()
+
+    def init_mmsg(self):
+        """Prepare the message headers of recvmmsg, which point to the buffers in the ring.
+        """
+        ring = (ctypes.c_char * len(self.ring)).from_buffer(self.ring)
+        base = ctypes.addressof(ring)
+        self.names = ctypes.create_string_buffer(self.batch * SOCKADDR_LEN)
+        names = ctypes.addressof(self.names)
+        self.iovs = (_Iovec * self.batch)()
+        self.mmsg = (_Mmsghdr * self.batch)()
+        for i in xrange(self.batch):
+            self.iovs[i].iov_base = base + i * self.max_len
+            self.iovs[i].iov_len = self.max_len
+            hdr = self.mmsg[i].msg_hdr
+            hdr.msg_name = names + i * SOCKADDR_LEN
+            hdr.msg_iov = ctypes.pointer(self.iovs[i])
+            hdr.msg_iovlen = 1
+        self.ring_buf = ring  # keep the exported buffer alive
+
+    def wait(self):
+        """Wait until the socket is readable if the socket has a timeout, since recvmmsg bypasses the timeout of
+           Python socket.
+        """
+        timeout = self.sock.gettimeout()
+        if timeout:
+            readable, writable, errors = select.select([self.sock], [], [], timeout)
+            if not readable:
+                raise socket.timeout('timed out')
+
+    def convert_addr(self, name):
+        """Convert a raw sockaddr_in6 into the address tuple returned by socket.recvfrom.
+
+        :param name: raw sockaddr_in6.
+        :type name: str.
+
+        Return:
+                tuple - (host, port, flowinfo, scopeid).
+        """
+        addr = self.addrs.get(name)
+        if addr is None:
+            port = (ord(name[2]) << 8) | ord(name[3])
+            flowinfo = ctypes.c_uint32.from_buffer_copy(name, 4).value
+            scope_id = ctypes.c_uint32.from_buffer_copy(name, 24).value
+            host = socket.inet_ntop(socket.AF_INET6, name[8:24])
+            if scope_id:  # link-local address, keep the same format as socket.recvfrom
+                host = socket.getnameinfo((host, port, flowinfo, scope_id),
+                                          socket.NI_NUMERICHOST | socket.NI_NUMERICSERV)[0]
+            addr = (host, port, flowinfo, scope_id)
+            self.addrs[name] = addr
+        return addr
+
+    def receive_mmsg(self):
+        """Receive a batch of packets by recvmmsg.
+
+        Return:
+                list - received packets in the form of (data, address).
+        """
+        self.wait()
+        for i in xrange(self.batch):
+            self.mmsg[i].msg_hdr.msg_namelen = SOCKADDR_LEN
+        num = _recvmmsg(self.sock.fileno(), self.mmsg, self.batch, MSG_WAITFORONE, None)
+        if num < 0:
+            err = ctypes.get_errno()
+            if err == errno.EAGAIN or err == errno.EWOULDBLOCK or err == errno.EINTR:
+                return []
+            raise socket.error(err, os.strerror(err))
+        packets = []
+        names = self.names.raw
+        for i in xrange(num):
+            start = i * self.max_len
+            name = names[i * SOCKADDR_LEN:(i + 1) * SOCKADDR_LEN]
+            packets.append((self.view[start:start + self.mmsg[i].msg_len].tobytes(), self.convert_addr(name)))
+        return packets
+
+    def receive_into(self):
+        """Receive a batch of packets by recvfrom_into. Only the first call may block, the following calls return
+           immediately when there is no pending packet.
+
+        Return:
+                list - received packets in the form of (data, address).
+        """
+        packets = []
+        flags = 0
+        timeout = self.sock.gettimeout()
+        for i in xrange(self.batch):
+            start = i * self.max_len
+            if packets and timeout:  # Python socket waits for the timeout even if MSG_DONTWAIT is set.
+                readable, writable, errors = select.select([self.sock], [], [], 0)
+                if not readable:
+                    break
+            try:
+                nbytes, addr = self.sock.recvfrom_into(self.view[start:start + self.max_len], self.max_len, flags)
+            except socket.timeout:
+                if packets:
+                    break
+                raise
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                raise
+            packets.append((self.view[start:start + nbytes].tobytes(), addr))
+            flags = MSG_DONTWAIT
+        return packets
+
+    def receive(self):
+        """Receive the pending packets, at most "batch" packets. If the socket is blocking, it waits for the first
+           packet. If the socket is non-blocking and there is no pending packet, an empty list is returned.
+
+        Return:
+                list - received packets in the form of (data, address).
+        """
+        if self.mmsg is not None:
+            return self.receive_mmsg()
+        return self.receive_into()
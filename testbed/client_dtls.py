@@ -31,12 +31,12 @@ from smit import utils
 from smit.security import DTLSWrap
 import traceback
 import time
-from datetime import datetime
-import signal
 from multiprocessing import Process
 import logging
 import subprocess
-import random
+import signal
+import traffic
+import payload
 
 
 class SinkClientDTLS(object):
@@ -52,12 +52,14 @@ class SinkClientDTLS(object):
     config = {'CAIP': '', 'CAPORT': '', 'CERT': '', 'TIMESERVER': '',
               'CACERT': '', 'SK': '', 'SERVERIP': '', 'SERVERPORT': '', 'CACHAIN': '',
               'TYPE': '', 'CERT_REQS': 'CERT_REQUIRED', 'TIMEZONE': '', 'SYNCTIME': 0, 'REFLOWPAN': 0,
-              'SYSWAIT': 0, 'PAYLOADLEN': 0, 'DATE': '', 'SENDTIME': 0, 'SENDRATE': 0, 'DEVNUM': 0}
+              'SYSWAIT': 0, 'PAYLOADLEN': 0, 'DATE': '', 'SENDTIME': 0, 'SENDRATE': 0, 'DEVNUM': 0,
+              'TRAFFIC': '', 'BURSTSIZE': '', 'TRACEFILE': '', 'SENDLOG': '', 'OCSP': '', 'STAPLE': ''}
     client_cnf = 'client_expcnf'  # the path to configuration file for this client package
     package_path = ''  # the path to this pakcage
     MAX_LEN = 1024  # the max length of packet which can be sent and received
     TIMER = 8200
-    send_logger = None  # a log handler for recording the information of sending messages.
+    send_log = None  # the send log for recording the information of sending messages (see payload.SendLog).
+    builder = None  # the builder of payloads (see payload.PayloadBuilder).
     counter = 0
     term = 0  # number of terms per second. For example, term=10 if the sending timer is in 100 milliseconds
     sent_counter = 0  # the number of times of sent messages.
@@ -102,9 +104,9 @@ class SinkClientDTLS(object):
         """This function initializes the configuration for the class object, where the parameters are read from a
         configuration file. This function should be called before other (class member) function call. The acceptable
         arguments are: config, C, ST, L, O, OU, CN, emailAddress, ECCPARAM, CAIP, CAPORT, CERT, CSR, MSG, SIG,
-        CACERT, SK, SERVERIP, SERVERPORT, CACHAIN, TYPE, CERT_REQS. Specifically, the keyword "config" sets the path
-        to configuration file. If arguments are passed to this function, the specified configuration file will be
-        updated.
+        CACERT, SK, SERVERIP, SERVERPORT, CACHAIN, TYPE, CERT_REQS, OCSP, STAPLE. Specifically, the keyword "config"
+        sets the path to configuration file. If arguments are passed to this function, the specified configuration
+        file will be updated.
 
         :param args: dictionary of passed arguments.
         """
@@ -123,7 +125,7 @@ class SinkClientDTLS(object):
         if update > 0:
             self.utl.update_config(self.client_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.client_cnf + ' ' + self.config['CN'] + '.clientcnf.bck', shell=True)
+        self.utl.backup_file(self.client_cnf, self.config['CN'] + '.clientcnf.bck')
 
     def install_dependencies(self):
         """Install some dependencies.
@@ -151,32 +153,29 @@ class SinkClientDTLS(object):
         logger.addHandler(handler)
         return logger
 
-    def signal_handler(self, signum, frame):
-        """This function handles message sending task.
+    def send_packets(self, num):
+        """This function handles message sending task. It sends a batch of messages which are due at the same time
+           according to the traffic model (see traffic.TrafficEngine). All messages of a batch have the same timestamp.
+
+        :param num: number of messages.
+        :type num: int.
         """
-        # send data in some probability (decided from configuration file) per each sending request.
-        # by default, every 100 milliseconds, it tries to send a message.
-        packet_per_sec = float(self.config['SENDRATE']) / float(self.config['DEVNUM'])
-        probability = int(packet_per_sec / (1.0 / float(self.config['SENDTIME'])) * 100)
-        coin = random.randint(0, 99)
-        if coin in range(0, probability):  # coin is in {0,1,...,probability}, then send a message, otherwise, ignore.
-            timestamp = datetime.now().strftime('%H%M%S%f')[:-3]
+        now = time.time()
+        for i in xrange(num):
             self.seq += 1
-            # data = str(self.seq).zfill(8) + '-' + timestamp
-            # create payload
-            seq_str = str(self.seq).zfill(8)
-            other_len = int(self.config['PAYLOADLEN']) - len(seq_str) - len(timestamp)
-            if other_len < 0:
-                other_len = 0
-            data = seq_str + '-' * other_len + timestamp
-            if data == '' or data is None:
-                self.send_logger.info('DATA ERRORS: the generated date is empty or None.')
-            sent = self.dw.sendto(data)
+            data = self.builder.build(self.seq, now)
+            sent = self.dw.sendto(str(data))
             if sent == 0:
-                self.send_logger.info('SENDING ERRORS: sent message length is ' + str(sent) + ' bytes.')
+                self.send_log.error(self.seq, now, 'sent message length is ' + str(sent) + ' bytes.')
                 raise RuntimeError('Socket connection broken.')
             else:
-                self.send_logger.info('Sent message length: ' + str(sent) + ' | Message content: ' + data)
+                self.send_log.write(self.seq, now, sent, data)
+
+    def terminate(self, signum, frame):
+        """Signal handler which stops sending when the client is terminated (e.g., by "pkill python"), so that the
+           buffered send log is written before exit.
+        """
+        raise KeyboardInterrupt
 
     def refresh(self, timer, cmd, logger):
         """Refresh net information periodically. If the parameter num is a negative number, the function will execute in
@@ -305,6 +304,22 @@ class SinkClientDTLS(object):
         except:
             raise ValueError('Passed IPv6 address is invalid.')
 
+    def verify_sink(self):
+        """Verify the certificate of the connected sink server with the OCSP response stapled in the DTLS handshake
+           (see DtlsWrap.save_staple). The certificate is saved to "STAPLE" with the extension ".pem", and OCSP server
+           "OCSP" is queried only if no current response was stapled.
+
+        Return:
+                bool - True if the certificate is verified.
+        """
+        staple = os.path.expanduser(self.config['STAPLE'])
+        cert_path = staple + '.pem'
+        if not self.dw.save_peer_cert(cert_path):
+            print ('Error: the sink server sent no certificate.')
+            return False
+        return self.cm.verify_cert(self.config.get('CACHAIN', ''), cert_path, self.config.get('OCSP', ''),
+                                   staple=staple)
+
     def start(self):
         """This function start a client which can interact with a DTLS server and transmit messages.
            This function checks whether the certificate and private key are valid.
@@ -379,6 +394,14 @@ class SinkClientDTLS(object):
             self.dw.connect((host, int(port), 0, scope_id))
 
             print ('Sink server connected.')
+            info = self.dw.handshake_info()
+            print ('DTLS handshake time: ' + str(round(info['time'], 3)) + ' seconds' +
+                   (' (session resumed).' if info['resumed'] else '.'))
+            if self.config.get('STAPLE', '') != '' and not self.verify_sink():
+                print ('Verification of the sink certificate failed.')
+                self.dw.shutdown(socket.SHUT_RDWR)
+                self.dw.close()
+                return
             self.create_conn_log((host, str(port)))
 
             # wait a while for other devices to finish DTLS handshake.
@@ -386,14 +409,15 @@ class SinkClientDTLS(object):
             time.sleep(float(self.config['SYSWAIT']))
             print ('Start to send packages.')
 
-            # Create a logger for recording sending information.
-            formatter = logging.Formatter(fmt='%(asctime)s\t%(message)s', datefmt='%d/%m/%Y %H:%M:%S')
-            self.send_logger = self.create_logger('Sending information log.', 'send.log', logging.INFO, formatter)
-            signal.signal(signal.SIGALRM, self.signal_handler)
-            signal.setitimer(signal.ITIMER_REAL, float(self.config['SENDTIME']), float(self.config['SENDTIME']))
-            # sleep main function to let signal handlers execute
-            while True:
-                time.sleep(1000)
+            # Create the send log and the payload template for recording and sending messages.
+            self.send_log = payload.SendLog('.', self.config['SENDLOG'])
+            self.builder = payload.PayloadBuilder(self.config['PAYLOADLEN'])
+            signal.signal(signal.SIGTERM, self.terminate)
+            # send messages at the times computed by the traffic model until the client is interrupted.
+            try:
+                traffic.TrafficEngine(traffic.create_model(self.config), self.send_packets).run()
+            finally:
+                self.send_log.close()
 
             self.dw.shutdown(socket.SHUT_RDWR)
             self.dw.close()
@@ -29,12 +29,12 @@ sys.path.insert(0, '../../../')
 from smit import utils
 import traceback
 import time
-from datetime import datetime
-import signal
 from multiprocessing import Process
 import logging
 import subprocess
-import random
+import signal
+import traffic
+import payload
 
 
 class SinkClientPlain(object):
@@ -45,10 +45,12 @@ class SinkClientPlain(object):
     seq = 0
     utl = utils.Utils()
     config = {'SERVERIP': '', 'SERVERPORT': '', 'TIMEZONE': '', 'SYNCTIME': 0, 'REFLOWPAN': 0,
-              'SYSWAIT': 0, 'PAYLOADLEN': 0, 'DATE': '', 'SENDTIME': 0, 'SENDRATE': 0, 'DEVNUM': 0}
+              'SYSWAIT': 0, 'PAYLOADLEN': 0, 'DATE': '', 'SENDTIME': 0, 'SENDRATE': 0, 'DEVNUM': 0,
+              'TRAFFIC': '', 'BURSTSIZE': '', 'TRACEFILE': '', 'SENDLOG': ''}
     clientcnf = 'client_expcnf'  # the path to configuration file for this client package
     package_path = ''  # the path to this pakcage
-    send_logger = None  # a log handler for recording the information of sending messages.
+    send_log = None  # the send log for recording the information of sending messages (see payload.SendLog).
+    builder = None  # the builder of payloads (see payload.PayloadBuilder).
     sock = 0
     addr = None
     is_first_time = 1  # indicate if it is an initial time synchronization.
@@ -112,37 +114,29 @@ class SinkClientPlain(object):
         logger.addHandler(handler)
         return logger
 
-    def signal_handler(self, signum, frame):
-        """This function handles message sending task.
+    def send_packets(self, num):
+        """This function handles message sending task. It sends a batch of messages which are due at the same time
+           according to the traffic model (see traffic.TrafficEngine). All messages of a batch have the same timestamp.
+
+        :param num: number of messages.
+        :type num: int.
         """
-        # send data in some probability (decided from configuration file) per each sending request.
-        # by default, every 100 milliseconds, it tries to send a message.
-        sock = self.sock  # socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        packet_per_sec = float(self.config['SENDRATE']) / float(self.config['DEVNUM'])
-        probability = int(packet_per_sec / (1.0 / float(self.config['SENDTIME'])) * 100)
-        coin = random.randint(0, 99)
-        if coin in range(0, probability):  # coin is in {0,1,...,probability}, then send a message, otherwise, ignore.
-            timestamp = datetime.now().strftime('%H%M%S%f')[:-3]
+        now = time.time()
+        for i in xrange(num):
             self.seq += 1
-            # create payload
-            seq_str = str(self.seq).zfill(8)
-            other_len = int(self.config['PAYLOADLEN']) - len(seq_str) - len(timestamp)
-            if other_len < 0:
-                other_len = 0
-            data = seq_str + '-' * other_len + timestamp
-            if data == '' or data is None:
-                self.send_logger.info('DATA ERRORS: the generated date is empty or None.')
-            # print self.addr
-            # local_ip = "fe80::cc1c:954d:e4e6:364f"
-            # sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-            # sock.bind((local_ip, 34311, 0, 6))
-            sent = sock.sendto(data, self.addr)
-            # sent = 1
+            data = self.builder.build(self.seq, now)
+            sent = self.sock.sendto(data, self.addr)
             if sent == 0:
-                self.send_logger.info('SENDING ERRORS: sent message length is ' + str(sent) + ' bytes.')
+                self.send_log.error(self.seq, now, 'sent message length is ' + str(sent) + ' bytes.')
                 raise RuntimeError('Socket connection broken.')
             else:
-                self.send_logger.info('Sent message length: ' + str(sent) + ' | Message content: ' + data)
+                self.send_log.write(self.seq, now, sent, data)
+
+    def terminate(self, signum, frame):
+        """Signal handler which stops sending when the client is terminated (e.g., by "pkill python"), so that the
+           buffered send log is written before exit.
+        """
+        raise KeyboardInterrupt
 
     def refresh(self, timer, cmd, logger):
         """Refresh net information periodically. If the parameter num is a negative number, the function will execute in
@@ -348,14 +342,15 @@ class SinkClientPlain(object):
             time.sleep(float(self.config['SYSWAIT']))
             print ('Start to send packages.')
 
-            # Create a logger for recording sending information.
-            formatter = logging.Formatter(fmt='%(asctime)s\t%(message)s', datefmt='%d/%m/%Y %H:%M:%S')
-            self.send_logger = self.create_logger('Sending information log.', 'send.log', logging.INFO, formatter)
-            signal.signal(signal.SIGALRM, self.signal_handler)
-            signal.setitimer(signal.ITIMER_REAL, float(self.config['SENDTIME']), float(self.config['SENDTIME']))
-            # sleep main function to let signal handlers execute
-            while True:
-                time.sleep(1000)
+            # Create the send log and the payload template for recording and sending messages.
+            self.send_log = payload.SendLog('.', self.config['SENDLOG'])
+            self.builder = payload.PayloadBuilder(self.config['PAYLOADLEN'])
+            signal.signal(signal.SIGTERM, self.terminate)
+            # send messages at the times computed by the traffic model until the client is interrupted.
+            try:
+                traffic.TrafficEngine(traffic.create_model(self.config), self.send_packets).run()
+            finally:
+                self.send_log.close()
         except KeyboardInterrupt:
             pass
         except Exception as e:
@@ -0,0 +1,386 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Load generator of sink server. It runs many virtual client devices in one process, so that the sink server can be
+tested at scale on a single Linux box. Every virtual client has its own socket (or DTLS session), sequence numbers and
+traffic schedule (see traffic), and sends the packets in the same format as client_plain and client_dtls. The packets
+of all clients are sent by one event loop ordered by a heap of send times.
+
+The logs of a virtual client are written to <out>/<index>/: the send log in the format of client devices (see payload,
+"-sendlog") and conn.log with the client and sink addresses, so that the logs can be analyzed together with the sink
+logs by the Analysis class.
+Note that the sink server and the Analysis class identify a client by its IP address. To run more than one virtual
+client, give every client its own address by -prefix, e.g., "-prefix fd00::1: -setup" adds fd00::1:1, fd00::1:2, ...
+to the loopback interface. The prefix is required for more than one client.
+
+Usage: python loadgen.py -clients 500 -server ::1 -port 56789 -sendrate 5000 -duration 60 -prefix fd00::1: [-setup]
+'''
+
+import os
+import sys
+import socket
+import select
+import errno
+import heapq
+import time
+import argparse
+import resource
+
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../../../')
+from smit import utils
+import traffic
+import payload
+
+CONNECT_TIME = 2.0  # the time (in seconds) to resend the connection requests which are not acknowledged
+FLUSH_TIME = 1.0  # the time (in seconds) to flush the send logs
+DATE_FMT = '%d/%m/%Y %H:%M:%S'  # the format of log time, it is the same as the one of client devices
+
+
+class VirtualClient(object):
+    """
+    This class keeps the state of a virtual client device.
+    """
+
+    def __init__(self, index, sock, log_dir, model, payload_len, log_format='text'):
+        """Constructor initializes variables
+
+        :param index: index of client.
+        :param sock: UDP socket of client.
+        :param log_dir: directory of the logs of client.
+        :param model: traffic model of client.
+        :param payload_len: length of payload.
+        :param log_format: format of send log, "text", "binary" or "none".
+        :type index: int.
+        :type sock: socket.
+        :type log_dir: str.
+        :type model: traffic.TrafficModel.
+        :type payload_len: int.
+        :type log_format: str.
+        """
+        self.index = index
+        self.sock = sock
+        self.dw = None  # DTLS session, None for plaintext
+        self.addr = None  # sink address which receives the packets, it is set when the connection is acknowledged
+        self.log_dir = log_dir
+        self.builder = payload.PayloadBuilder(payload_len)
+        self.seq = 0
+        # the log is not kept open, so that the number of open files does not grow with the number of clients.
+        self.send_log = payload.SendLog(log_dir, log_format, keep_open=False)
+        self.errors = 0
+        self.schedule = self.offsets(model)
+        self.start = 0
+
+    def offsets(self, model):
+        """Generate the send times of the client, as (time, True). The end of a chunk without send times is generated
+           as (end, False), so that the client is scheduled again at the end of the chunk instead of searching the
+           following chunks at once.
+
+        :param model: traffic model of client.
+        :type model: traffic.TrafficModel.
+        """
+        end = 0.0
+        for offsets in model.chunks():
+            end += model.CHUNK_TIME
+            if not offsets:
+                yield end, False
+            for offset in offsets:
+                yield offset, True
+
+    def send(self, now):
+        """Send a packet in format: sequence (8 bytes), padding, timestamp (HHMMSSXXX).
+
+        :param now: sent time in seconds since the epoch.
+        :type now: float.
+        """
+        self.seq += 1
+        data = self.builder.build(self.seq, now)
+        try:
+            if self.dw is not None:
+                sent = self.dw.sendto(str(data))
+            else:
+                sent = self.sock.sendto(data, self.addr)
+        except socket.error as e:
+            self.errors += 1
+            self.send_log.error(self.seq, now, str(e))
+            return
+        self.send_log.write(self.seq, now, sent, data)
+
+    def write_conn_log(self):
+        """Write conn.log with the client address and the sink address, in the format of client devices.
+        """
+        local = self.sock.getsockname()
+        with open(os.path.join(self.log_dir, 'conn.log'), 'w') as f:
+            f.write(time.strftime(DATE_FMT) + '\t\nClient|' + local[0] + '\nSink|' + str(self.addr[0]) + '.' +
+                    str(self.addr[1]) + '\n' + '#' * 40 + '\n')
+
+
+class LoadGenerator(object):
+    """
+    This class runs virtual client devices in one process.
+    """
+    utl = utils.Utils()
+
+    def __init__(self, num, server, port, config, out_dir='logs/clients', prefix=''):
+        """Constructor initializes variables
+
+        :param num: number of virtual clients.
+        :param server: IPv6 address of sink server.
+        :param port: port of sink server.
+        :param config: client configuration, including SENDRATE (over all clients), SENDTIME, PAYLOADLEN, TRAFFIC,
+                       BURSTSIZE, TRACEFILE and SENDLOG.
+        :param out_dir: directory of the logs of clients.
+        :param prefix: prefix of client addresses, the address of client i is prefix + hex(i + 1). All clients use
+                       the loopback address if it is empty.
+        :type num: int.
+        :type server: str.
+        :type port: int.
+        :type config: dict.
+        :type out_dir: str.
+        :type prefix: str.
+        """
+        self.num = num
+        self.server = (server, port)
+        self.config = dict(config, DEVNUM=num)
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.clients = []
+
+    def address(self, index):
+        """Return the address of a virtual client.
+
+        :param index: index of client.
+        :type index: int.
+
+        Return:
+                str - IPv6 address.
+        """
+        if not self.prefix:
+            return '::1'
+        return self.prefix + format(index + 1, 'x')
+
+    def setup_addresses(self):
+        """Add the addresses of virtual clients to the loopback interface.
+        """
+        for i in range(0, self.num):
+            self.utl.call('sudo ip -6 addr add ' + self.address(i) + '/128 dev lo 2>/dev/null', shell=True)
+
+    def create_clients(self):
+        """Create the sockets and log directories of virtual clients.
+        """
+        # every client has a socket, raise the limit of open files as far as allowed.
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = self.num + 64
+        if soft < limit:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit if hard == resource.RLIM_INFINITY else min(limit, hard),
+                                                        hard))
+        for i in range(0, self.num):
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+            sock.bind((self.address(i), 0))
+            sock.setblocking(0)
+            log_dir = os.path.join(self.out_dir, str(i))
+            self.utl.makedir(log_dir)
+            for name in (payload.TEXT_LOG, payload.BINARY_LOG, 'conn.log'):
+                if os.path.exists(os.path.join(log_dir, name)):
+                    os.remove(os.path.join(log_dir, name))
+            self.clients.append(VirtualClient(i, sock, log_dir, traffic.create_model(self.config),
+                                              int(self.config['PAYLOADLEN']), self.config.get('SENDLOG', '')))
+
+    def connect(self):
+        """Connect all virtual clients to the sink server without DTLS. A client sends "start" and the sink server
+           acknowledges it from the port which receives the packets of the client. The requests which are not
+           acknowledged are resent every CONNECT_TIME.
+        """
+        pending = dict((client.sock, client) for client in self.clients)
+        while pending:
+            for sock in pending:
+                sock.sendto('start', self.server)
+            deadline = time.time() + CONNECT_TIME
+            while pending and time.time() < deadline:
+                readable, writable, errors = select.select(pending.keys(), [], [], deadline - time.time())
+                for sock in readable:
+                    try:
+                        data, addr = sock.recvfrom(1024)
+                    except socket.error as e:
+                        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED):
+                            continue
+                        raise
+                    if data == 'ack':
+                        client = pending.pop(sock)
+                        client.addr = addr
+                        client.write_conn_log()
+            print (str(self.num - len(pending)) + ' of ' + str(self.num) + ' clients connected.')
+
+    def connect_dtls(self, client_cnf):
+        """Connect all virtual clients to the sink server via DTLS, one after another.
+
+        :param client_cnf: path to the client configuration file, which configures the certificate and private key.
+        :type client_cnf: str.
+        """
+        from smit.security import DTLSWrap
+        base = DTLSWrap.DtlsWrap()
+        base.init_config(config=client_cnf)
+        handshakes = {False: [], True: []}  # resumed -> handshake times
+        for client in self.clients:
+            client.sock.setblocking(1)
+            dw = DTLSWrap.DtlsWrap()
+            dw.config = base.config  # the configuration is read once for all clients.
+            dw.wrap_socket(client.sock)
+            dw.connect(self.server)
+            info = dw.handshake_info()
+            handshakes[info['resumed']].append(info['time'])
+            client.dw = dw
+            client.addr = self.server
+            client.write_conn_log()
+        print (str(self.num) + ' clients connected via DTLS.')
+        for resumed, times in sorted(handshakes.items()):
+            if times:
+                print (('Resumed' if resumed else 'Full') + ' handshakes: ' + str(len(times)) + ', average time: ' +
+                       str(round(sum(times) / len(times), 4)) + ' seconds.')
+
+    def run(self, duration=None, stagger=1.0):
+        """Send the packets of all virtual clients until the duration is over or the generator is interrupted.
+
+        :param duration: sending time in seconds, endless if it is None.
+        :param stagger: the start times of clients are spread over this time (in seconds).
+        :type duration: float.
+        :type stagger: float.
+
+        Return:
+                int - number of sent packets.
+        """
+        begin = traffic.monotonic()
+        end = begin + duration if duration is not None else None
+        heap = []
+        for client in self.clients:
+            client.start = begin + stagger * client.index / self.num
+            offset, send = next(client.schedule)
+            heap.append((client.start + offset, client.index, send))
+        heapq.heapify(heap)
+        sent = 0
+        last_flush = begin
+        try:
+            while heap:
+                if end is not None and heap[0][0] >= end:
+                    break
+                wait = heap[0][0] - traffic.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                now = traffic.monotonic()
+                wall = time.time()
+                # send the packets of all clients which are due, they share the timestamp.
+                while heap and heap[0][0] <= now + traffic.BATCH_TIME:
+                    due, index, send = heap[0]
+                    client = self.clients[index]
+                    if send:
+                        client.send(wall)
+                        sent += 1
+                    offset, send = next(client.schedule)
+                    heapq.heapreplace(heap, (client.start + offset, index, send))
+                if now - last_flush >= FLUSH_TIME:
+                    self.flush()
+                    last_flush = now
+        finally:
+            self.flush()
+        return sent
+
+    def flush(self):
+        """Flush the send logs of all clients.
+        """
+        for client in self.clients:
+            client.send_log.flush()
+
+    def close(self):
+        """Close the connections of all clients.
+        """
+        for client in self.clients:
+            try:
+                if client.dw is not None:
+                    client.dw.shutdown(socket.SHUT_RDWR)
+                    client.dw.close()
+                else:
+                    client.sock.close()
+            except socket.error:
+                pass
+
+
+def main():
+    utl = utils.Utils()
+    config = utl.read_config('client_expcnf', {'SENDRATE': '', 'SENDTIME': '', 'PAYLOADLEN': '', 'TRAFFIC': '',
+                                               'BURSTSIZE': '', 'TRACEFILE': '', 'SENDLOG': ''})
+    parser = argparse.ArgumentParser(description='Load generator running many virtual client devices in one process.')
+    parser.add_argument('-clients', dest='clients', type=int, default=100, help='Set the number of virtual clients.')
+    parser.add_argument('-server', dest='server', default='::1', help='Set the IPv6 address of sink server.')
+    parser.add_argument('-port', dest='port', type=int, default=56789, help='Set the port of sink server.')
+    parser.add_argument('-duration', dest='duration', type=float, help='Set the sending time in seconds.')
+    parser.add_argument('-sendrate', dest='sendrate', default=config['SENDRATE'],
+                        help='Set the number of packets per second sent by all clients.')
+    parser.add_argument('-sendtime', dest='sendtime', default=config['SENDTIME'],
+                        help='Set the time period to try to send a message in the tick traffic model.')
+    parser.add_argument('-payloadlen', dest='payloadlen', default=config['PAYLOADLEN'],
+                        help='Set the length of payload.')
+    parser.add_argument('-traffic', dest='traffic', default=config['TRAFFIC'],
+                        help='Set the traffic model [tick|constant|poisson|bursty|trace].')
+    parser.add_argument('-burstsize', dest='burstsize', default=config['BURSTSIZE'],
+                        help='Set the number of packets in a burst of the bursty traffic model.')
+    parser.add_argument('-tracefile', dest='tracefile', default=config['TRACEFILE'],
+                        help='Set the trace file of send times of the trace traffic model.')
+    parser.add_argument('-sendlog', dest='sendlog', default=config['SENDLOG'],
+                        help='Set the format of send log [text|binary|none].')
+    parser.add_argument('-stagger', dest='stagger', type=float, default=1.0,
+                        help='Spread the start times of clients over this time in seconds.')
+    parser.add_argument('-prefix', dest='prefix', default='',
+                        help='Set the prefix of client addresses, e.g., "fd00::1:". It is required for more than one '
+                             'client, a single client uses ::1.')
+    parser.add_argument('-setup', dest='setup', action='store_true',
+                        help='Add the client addresses with the prefix to the loopback interface.')
+    parser.add_argument('-out', dest='out', default='logs/clients', help='Set the directory of client logs.')
+    parser.add_argument('-dtls', dest='dtls', action='store_true', help='Connect to the sink server via DTLS.')
+    parser.add_argument('-config', dest='config', default='client_expcnf',
+                        help='Set the client configuration file for DTLS.')
+    args = parser.parse_args()
+    if args.clients > 1 and not args.prefix:
+        parser.error('the clients need their own addresses, please set -prefix, e.g., "-prefix fd00::1: -setup".')
+    config.update(SENDRATE=args.sendrate, SENDTIME=args.sendtime, PAYLOADLEN=args.payloadlen, TRAFFIC=args.traffic,
+                  BURSTSIZE=args.burstsize, TRACEFILE=args.tracefile, SENDLOG=args.sendlog)
+    gen = LoadGenerator(args.clients, args.server, args.port, config, args.out, args.prefix)
+    if args.setup:
+        gen.setup_addresses()
+    gen.create_clients()
+    try:
+        if args.dtls:
+            gen.connect_dtls(args.config)
+        else:
+            gen.connect()
+        print ('Start to send packets.')
+        begin = time.time()
+        sent = gen.run(args.duration, args.stagger)
+        print ('Sent ' + str(sent) + ' packets in ' + str(round(time.time() - begin, 3)) + ' seconds.')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gen.close()
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main()
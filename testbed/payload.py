@@ -0,0 +1,202 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Payloads and send logs of client devices.
+
+A payload has the format: sequence (8 digits), padding ('-'), timestamp (HHMMSSXXX). PayloadBuilder keeps a
+preallocated payload and patches the sequence and timestamp fields in place for every send.
+
+The send log of a client is selected by the keyword "SENDLOG" in client_expcnf:
+    text:   "send.log", one line per packet: DD/MM/YYYY HH:MM:SS<TAB>Sent message length: N | Message content: payload
+    binary: "send.rec", the 8-byte magic "SMITSND1" followed by fixed-width little-endian records:
+                seq     uint32  sequence number of packet
+                sent    int64   sent time, in milliseconds since the epoch
+                length  uint16  bytes sent, 0 if the send failed
+    none:   no send log.
+'''
+
+import os
+import time
+import struct
+
+SEQ_LEN = 8  # length of sequence number
+TS_LEN = 9  # length of timestamp in format HHMMSSXXX
+MAGIC = 'SMITSND1'  # file header of binary send logs
+RECORD = struct.Struct('<IqH')  # seq, sent, length
+TEXT_LOG = 'send.log'
+BINARY_LOG = 'send.rec'
+DATE_FMT = '%d/%m/%Y %H:%M:%S'  # the format of log time in text send logs
+
+
+class PayloadBuilder(object):
+    """
+    This class builds the payloads of a client in a preallocated buffer. The padding is written once, and only the
+    sequence number and timestamp are patched for every packet. The time of day is formatted once per second.
+    """
+
+    def __init__(self, payload_len):
+        """Constructor initializes variables
+
+        :param payload_len: length of payload, at least the length of sequence number and timestamp.
+        :type payload_len: int.
+        """
+        length = max(int(payload_len), SEQ_LEN + TS_LEN)
+        self.buf = bytearray('0' * SEQ_LEN + '-' * (length - SEQ_LEN - TS_LEN) + '0' * TS_LEN)
+        self.ts = length - TS_LEN  # offset of timestamp
+        self.second = -1  # the second of the cached time of day
+        self.clock = ''  # cached time of day, format: HHMMSS
+
+    def build(self, seq, now):
+        """Patch the sequence number and timestamp of the payload.
+
+        :param seq: sequence number, only the last 8 digits are kept.
+        :param now: sent time in seconds since the epoch.
+        :type seq: int.
+        :type now: float.
+
+        Return:
+                bytearray - the payload, which is overwritten by the next call.
+        """
+        second = int(now)
+        if second != self.second:
+            self.second = second
+            self.clock = time.strftime('%H%M%S', time.localtime(second))
+        buf = self.buf
+        buf[0:SEQ_LEN] = '%08d' % (seq % 100000000)
+        buf[self.ts:] = self.clock + '%03d' % int((now - second) * 1000)
+        return buf
+
+
+class SendLog(object):
+    """
+    This class records the sent packets of a client in a send log (see the formats above). Records are buffered and
+    written when the buffer is full, the buffer is older than FLUSH_TIME or flush is called.
+    """
+    FLUSH_SIZE = 256  # the number of buffered records which triggers a write
+    FLUSH_TIME = 1.0  # the time (in seconds) after which buffered records are written
+
+    def __init__(self, log_dir='.', log_format='text', keep_open=True):
+        """Constructor creates the send log. An existing send log is appended.
+
+        :param log_dir: directory of the send log.
+        :param log_format: format of send log, "text", "binary" or "none".
+        :param keep_open: keep the log file open, otherwise the log is opened for every write, so that many logs can
+                          be written without running out of file descriptors.
+        :type log_dir: str.
+        :type log_format: str.
+        :type keep_open: bool.
+        """
+        self.log_format = (log_format or 'text').lower()
+        if self.log_format not in ('text', 'binary', 'none'):
+            raise ValueError('Unknown format of send log: ' + log_format)
+        self.binary = self.log_format == 'binary'
+        self.path = os.path.join(log_dir, BINARY_LOG if self.binary else TEXT_LOG)
+        self.keep_open = keep_open
+        self.file = None
+        self.buf = []
+        self.last_flush = time.time()
+        self.second = -1  # the second of the cached log time
+        self.log_time = ''  # cached log time, format: DD/MM/YYYY HH:MM:SS
+        if self.binary and (not os.path.isfile(self.path) or os.path.getsize(self.path) == 0):
+            with open(self.path, 'ab') as f:
+                f.write(MAGIC)
+
+    def write(self, seq, now, sent, payload):
+        """Record a sent packet.
+
+        :param seq: sequence number.
+        :param now: sent time in seconds since the epoch.
+        :param sent: bytes sent, 0 if the send failed.
+        :param payload: the sent payload, it is only used by text logs.
+        :type seq: int.
+        :type now: float.
+        :type sent: int.
+        :type payload: bytearray.
+        """
+        if self.log_format == 'none':
+            return
+        if self.binary:
+            self.buf.append(RECORD.pack(seq & 0xffffffff, int(now * 1000), min(sent, 0xffff)))
+        else:
+            second = int(now)
+            if second != self.second:
+                self.second = second
+                self.log_time = time.strftime(DATE_FMT, time.localtime(second))
+            self.buf.append(self.log_time + '\tSent message length: ' + str(sent) + ' | Message content: ' +
+                            str(payload) + '\n')
+        if len(self.buf) >= self.FLUSH_SIZE or now - self.last_flush >= self.FLUSH_TIME:
+            self.flush()
+
+    def error(self, seq, now, message):
+        """Record a failed send.
+
+        :param seq: sequence number.
+        :param now: sent time in seconds since the epoch.
+        :param message: error message, it is only used by text logs.
+        :type seq: int.
+        :type now: float.
+        :type message: str.
+        """
+        if self.binary:
+            self.write(seq, now, 0, '')
+        elif self.log_format == 'text':
+            self.buf.append(time.strftime(DATE_FMT, time.localtime(now)) + '\tSENDING ERRORS: ' + message + '\n')
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records into the log.
+        """
+        self.last_flush = time.time()
+        if not self.buf:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        self.file.write(''.join(self.buf))
+        self.buf = []
+        if self.keep_open:
+            self.file.flush()
+        else:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        """Flush the buffered records and close the log.
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def count_sent(log_dir):
+    """Return the number of packets recorded in the send log of a client, the text log is preferred if both exist.
+
+    :param log_dir: directory of the send log.
+    :type log_dir: str.
+
+    Return:
+            int - number of records, None if there is no send log.
+    """
+    path = os.path.join(log_dir, BINARY_LOG)
+    if os.path.isfile(os.path.join(log_dir, TEXT_LOG)) or not os.path.isfile(path):
+        return None
+    return max(os.path.getsize(path) - len(MAGIC), 0) // RECORD.size
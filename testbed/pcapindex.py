@@ -0,0 +1,321 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import mmap
+import socket
+import struct
+import time
+import numpy as np
+
+# pcap magic numbers: (byte order, nanosecond resolution)
+PCAP_MAGIC = {'\xd4\xc3\xb2\xa1': '<', '\xa1\xb2\xc3\xd4': '>', '\x4d\x3c\xb2\xa1': '<', '\xa1\xb2\x3c\x4d': '>'}
+PCAP_HEADER_LEN = 24  # length of pcap global header
+RECORD_HEADER_LEN = 16  # length of pcap record header
+
+# link types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (12, 14, 101)
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IEEE802_15_4 = 195  # with FCS
+LINKTYPE_IEEE802_15_4_NONASK_PHY = 215
+LINKTYPE_IPV6 = 229
+LINKTYPE_IEEE802_15_4_NOFCS = 230
+LINKTYPE_LINUX_SLL2 = 276
+ETHERTYPE_IPV6 = 0x86dd
+AF_INET6_VALUES = (10, 24, 28, 30)  # values of AF_INET6 on Linux, BSD, FreeBSD and Darwin
+PORT_PROTOCOLS = (6, 17, 132)  # TCP, UDP and SCTP, the protocols matched by "port" of tcpdump filters
+
+
+def to_second(timestamp):
+    """Convert a local time to seconds since the epoch.
+
+    :param timestamp: local time, format: YYYY-MM-DD HH:MM:SS.
+    :type timestamp: str.
+
+    Return:
+            int - seconds since the epoch, None if the timestamp is empty.
+    """
+    if not timestamp:
+        return None
+    return int(time.mktime(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S')))
+
+
+def window_count(seconds, mask, begin, end):
+    """Count the packets in the time window of an experiment in the same way as the shell pipeline
+       "sed -n -e '/begin/,/end/p' | wc -l" over the lines printed by tcpdump: a window starts at a packet in the begin
+       second and ends at the next packet in the end second (or the last packet), and windows may repeat.
+
+    :param seconds: capture time (in seconds since the epoch) of the printed packets, in capture order.
+    :param mask: the packets to be counted in the windows.
+    :param begin: begin second of experiment.
+    :param end: end second of experiment.
+    :type seconds: numpy.ndarray.
+    :type mask: numpy.ndarray.
+    :type begin: int.
+    :type end: int.
+
+    Return:
+            int - number of counted packets in the windows.
+    """
+    starts = np.flatnonzero(seconds == begin)
+    stops = np.flatnonzero(seconds == end)
+    counted = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    count = 0
+    pos = 0
+    while True:
+        i = np.searchsorted(starts, pos)
+        if i == len(starts):
+            break
+        start = starts[i]
+        j = np.searchsorted(stops, start + 1)
+        stop = stops[j] if j < len(stops) else len(seconds) - 1
+        count += counted[stop + 1] - counted[start]
+        pos = stop + 1
+    return int(count)
+
+
+def run_count(seconds, mask, begin, end):
+    """Count the packets of a client during an experiment in the same way as the analysis based on tcpdump output:
+       the packets in the time window, plus the extra packets in the end second, or all packets if there is no packet
+       in the window.
+
+    :param seconds: capture time (in seconds since the epoch) of the printed packets, in capture order.
+    :param mask: the packets of the client.
+    :param begin: begin second of experiment, None if it is unknown.
+    :param end: end second of experiment, None if it is unknown.
+    :type seconds: numpy.ndarray.
+    :type mask: numpy.ndarray.
+    :type begin: int.
+    :type end: int.
+
+    Return:
+            int - number of packets.
+    """
+    dup = 0  # multiple presence lines
+    count = 0
+    if begin is not None and end is not None:  # begin/end time presented, count more precisely.
+        dup = int(np.count_nonzero(mask & (seconds == end)))
+        count = window_count(seconds, mask, begin, end)
+    if count == 0:  # begin/end time does not present or record not found, count as usual
+        count = int(np.count_nonzero(mask))
+    if dup > 1:  # there are multiple lines with the same end_time point.
+        count = count + dup - 1
+    return count
+
+
+def le64addr_string(addr):
+    """Format an IEEE 802.15.4 extended address in the same way as tcpdump.
+
+    :param addr: extended address in little-endian order.
+    :type addr: str.
+
+    Return:
+            str - address, format: xx:xx:xx:xx:xx:xx:xx:xx.
+    """
+    return ':'.join('%02x' % ord(c) for c in reversed(addr))
+
+
+class PcapIndex(object):
+    """
+    This class reads a pcap capture file once by memory mapping and builds indexes of the captured packets: the capture
+    time of all packets, the IPv6 packets by (source, destination, destination port), and the IEEE 802.15.4 frames by
+    (destination, source) extended addresses. Count queries are answered from the indexes and give the same results
+    as the tcpdump based analysis.
+    """
+
+    def __init__(self, path):
+        """Constructor reads the capture file and builds the indexes.
+
+        :param path: path to the pcap file.
+        :type path: str.
+        """
+        self.path = path
+        self.linktype = -1
+        self.seconds = np.zeros(0, dtype=np.int64)  # capture time of packets, in seconds since the epoch
+        self.flows = {}  # (src, dst, dport) -> indexes of IPv6 packets, src and dst are 16-byte addresses
+        self.frames = {}  # (dst, src) -> indexes of IEEE 802.15.4 frames with extended addresses
+        self.read()
+
+    def read(self):
+        """Read the capture file and build the indexes.
+        """
+        with open(self.path, 'rb') as f:
+            header = f.read(PCAP_HEADER_LEN)
+            if len(header) < PCAP_HEADER_LEN or header[0:4] not in PCAP_MAGIC:
+                raise IOError('File \"' + self.path + '\" is not a pcap file.')
+            order = PCAP_MAGIC[header[0:4]]
+            self.linktype = struct.unpack(order + 'I', header[20:24])[0] & 0x0fffffff
+            decode = self.get_decoder()
+            f.seek(0, 2)
+            size = f.tell()
+            if size <= PCAP_HEADER_LEN:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        record = struct.Struct(order + 'IIII')
+        seconds = []
+        flows = {}
+        frames = {}
+        offset = PCAP_HEADER_LEN
+        index = 0
+        try:
+            while offset + RECORD_HEADER_LEN <= size:
+                ts_sec, ts_frac, caplen, length = record.unpack_from(data, offset)
+                offset += RECORD_HEADER_LEN
+                if offset + caplen > size:  # truncated capture
+                    break
+                key = decode(data[offset:offset + caplen])
+                if key is not None:
+                    table = flows if key[0] == 'ip6' else frames
+                    table.setdefault(key[1], []).append(index)
+                seconds.append(ts_sec)
+                offset += caplen
+                index += 1
+        finally:
+            data.close()
+        self.seconds = np.array(seconds, dtype=np.int64)
+        self.flows = dict((k, np.array(v, dtype=np.int64)) for k, v in flows.iteritems())
+        self.frames = dict((k, np.array(v, dtype=np.int64)) for k, v in frames.iteritems())
+
+    def get_decoder(self):
+        """Return the decoder of packets for the link type of capture file.
+
+        Return:
+                function - decoder which returns ('ip6', (src, dst, dport)), ('wpan', (dst, src)) or None.
+        """
+        if self.linktype == LINKTYPE_ETHERNET:
+            return lambda p: self.decode_ip6(p, 14) if p[12:14] == '\x86\xdd' else None
+        if self.linktype in LINKTYPE_RAW or self.linktype == LINKTYPE_IPV6:
+            return lambda p: self.decode_ip6(p, 0)
+        if self.linktype == LINKTYPE_LINUX_SLL:
+            return lambda p: self.decode_ip6(p, 16) if p[14:16] == '\x86\xdd' else None
+        if self.linktype == LINKTYPE_LINUX_SLL2:
+            return lambda p: self.decode_ip6(p, 20) if p[0:2] == '\x86\xdd' else None
+        if self.linktype == LINKTYPE_NULL or self.linktype == LINKTYPE_LOOP:
+            return self.decode_null
+        if self.linktype in (LINKTYPE_IEEE802_15_4, LINKTYPE_IEEE802_15_4_NOFCS):
+            return lambda p: self.decode_wpan(p, 0)
+        if self.linktype == LINKTYPE_IEEE802_15_4_NONASK_PHY:
+            return lambda p: self.decode_wpan(p, 6)
+        raise IOError('Link type ' + str(self.linktype) + ' of file \"' + self.path + '\" is not supported.')
+
+    def decode_null(self, packet):
+        """Decode a packet of BSD loopback encapsulation.
+
+        :param packet: captured packet.
+        :type packet: str.
+        """
+        if len(packet) < 4:
+            return None
+        family = struct.unpack('<I', packet[0:4])[0]
+        if family not in AF_INET6_VALUES:
+            family = struct.unpack('>I', packet[0:4])[0]
+        if family in AF_INET6_VALUES:
+            return self.decode_ip6(packet, 4)
+        return None
+
+    def decode_ip6(self, packet, offset):
+        """Decode the IPv6 header of a packet. As the "port" primitive of tcpdump filters, the destination port is only
+           taken from TCP, UDP and SCTP headers which directly follow the IPv6 header.
+
+        :param packet: captured packet.
+        :param offset: offset of IPv6 header.
+        :type packet: str.
+        :type offset: int.
+        """
+        if len(packet) < offset + 40 or ord(packet[offset]) >> 4 != 6:
+            return None
+        dport = None
+        if ord(packet[offset + 6]) in PORT_PROTOCOLS and len(packet) >= offset + 44:
+            dport = (ord(packet[offset + 42]) << 8) | ord(packet[offset + 43])
+        return 'ip6', (packet[offset + 8:offset + 24], packet[offset + 24:offset + 40], dport)
+
+    def decode_wpan(self, packet, offset):
+        """Decode the addresses of an IEEE 802.15.4 frame. Only frames with extended destination and source addresses
+           are indexed, since only they can be matched by MAC addresses.
+
+        :param packet: captured frame.
+        :param offset: offset of MAC header.
+        :type packet: str.
+        :type offset: int.
+        """
+        if len(packet) < offset + 3:
+            return None
+        fc = ord(packet[offset]) | (ord(packet[offset + 1]) << 8)
+        dst_mode = (fc >> 10) & 0x3
+        src_mode = (fc >> 14) & 0x3
+        if dst_mode != 3 or src_mode != 3:
+            return None
+        pos = offset + 3 + 2  # frame control, sequence number and destination PAN
+        dst = packet[pos:pos + 8]
+        pos += 8
+        if not fc & (1 << 6):  # no PAN ID compression
+            pos += 2
+        src = packet[pos:pos + 8]
+        if len(src) < 8:
+            return None
+        return 'wpan', (le64addr_string(dst), le64addr_string(src))
+
+    def count_ip6(self, src, dst, dport, begin=None, end=None):
+        """Count the IPv6 packets of a flow, the same as the analysis of
+           "tcpdump -r <file> dst <dst> and dst port <dport> and src <src>".
+
+        :param src: source IPv6 address.
+        :param dst: destination IPv6 address.
+        :param dport: destination port.
+        :param begin: begin second of experiment, None if it is unknown.
+        :param end: end second of experiment, None if it is unknown.
+        :type src: str.
+        :type dst: str.
+        :type dport: int.
+        :type begin: int.
+        :type end: int.
+
+        Return:
+                int - number of packets.
+        """
+        key = (socket.inet_pton(socket.AF_INET6, src), socket.inet_pton(socket.AF_INET6, dst), int(dport))
+        indexes = self.flows.get(key, np.zeros(0, dtype=np.int64))
+        seconds = self.seconds[indexes]
+        return run_count(seconds, np.ones(len(seconds), dtype=bool), begin, end)
+
+    def count_wpan(self, dst_mac, src_mac, begin=None, end=None):
+        """Count the IEEE 802.15.4 frames sent to a MAC address from another MAC address, the same as the analysis of
+           "tcpdump -r <file>" output by "grep -e '<dst_mac> <' | grep -e '<src_mac>'".
+
+        :param dst_mac: destination MAC address, format: xx:xx:xx:xx:xx:xx, the tail of extended address.
+        :param src_mac: source MAC address, format: xx:xx:xx:xx:xx:xx, the tail of extended address.
+        :param begin: begin second of experiment, None if it is unknown.
+        :param end: end second of experiment, None if it is unknown.
+        :type dst_mac: str.
+        :type src_mac: str.
+        :type begin: int.
+        :type end: int.
+
+        Return:
+                int - number of frames.
+        """
+        mask = np.zeros(len(self.seconds), dtype=bool)
+        for (dst, src), indexes in self.frames.iteritems():
+            if dst.endswith(dst_mac) and (src_mac in dst or src_mac in src):
+                mask[indexes] = True
+        return run_count(self.seconds, mask, begin, end)
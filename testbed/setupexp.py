@@ -45,16 +45,21 @@ class SetupExp(object):
                            'emailAddress': '', 'ECCPARAM': '', 'CAIP': '', 'CAPORT': '', 'CERT': '', 'CSR': '',
                            'MSG': '',
                            'SIG': '', 'CACERT': '', 'SK': '', 'SERVERIP': '', 'SERVERPORT': '', 'CACHAIN': '',
-                           'TYPE': '',
-                           'CERT_REQS': '', 'TIMEZONE': '', 'SYNCTIME': '', 'REFLOWPAN': '', 'SYSWAIT': '',
-                           'PAYLOADLEN': '', 'DATE': '', 'SENDTIME': '', 'SENDRATE': '', 'DEVNUM': ''}
+                           'TYPE': '', 'BACKEND': '',
+                           'CERT_REQS': '', 'RESUME': '', 'CIPHERS': '', 'TIMEZONE': '', 'SYNCTIME': '',
+                           'REFLOWPAN': '',
+                           'SYSWAIT': '', 'PAYLOADLEN': '', 'DATE': '', 'SENDTIME': '', 'SENDRATE': '', 'DEVNUM': '',
+                           'TRAFFIC': '', 'BURSTSIZE': '', 'TRACEFILE': '', 'SENDLOG': '', 'OCSP': '', 'STAPLE': ''}
     sink_config_items = {'C': '', 'ST': '', 'L': '', 'O': '', 'OU': '', 'CN': '',
                          'emailAddress': '', 'ECCPARAM': '', 'CAIP': '', 'CAPORT': '', 'CERT': '', 'CSR': '', 'MSG': '',
                          'SIG': '', 'CACERT': '', 'SK': '', 'SERVERIP': '', 'SERVERPORT': '', 'CACHAIN': '', 'TYPE': '',
-                         'CERT_REQS': '', 'ROUTER_IP6': '', 'CLIENT_IP6': '', 'CLIENT_LINK_IP6': '', 'CLIENT_IP4': '',
+                         'BACKEND': '', 'CERT_REQS': '', 'RESUME': '', 'CIPHERS': '', 'ROUTER_IP6': '',
+                         'CLIENT_IP6': '', 'CLIENT_LINK_IP6': '', 'CLIENT_IP4': '',
                          'CLIENT_WKD': '', 'ROUTER_WKD': '', 'PASSWORD': '', 'SINK_INTERFACE': '', 'DATE': '',
                          'ROUTER_LOGDIR': '', 'SINK2CLIENT': '', 'CLIENT_SCRIPT': '', 'USER': '',
-                         'CLIENT_SCRIPT_DIR': ''}
+                         'CLIENT_SCRIPT_DIR': '', 'SINKMODE': '', 'SINKSOCKETS': '', 'SINKWORKERS': '',
+                         'SINKLOG': '', 'STATSPORT': '', 'HANDSHAKES': '', 'HANDSHAKETIMEOUT': '', 'OCSP': '',
+                         'STAPLE': ''}
 
     def install_dependencies(self):
         """Install dependencies for experiment on a device, e.g., sink server, border router and client device.
@@ -99,7 +104,7 @@ class SetupExp(object):
         if update > 0:
             self.utl.update_config(client_config, self.client_config_items)
         # Backup configuration file
-        self.utl.call('cp -f ' + client_config + ' ' + client_config + '.bck', shell=True)
+        self.utl.backup_file(client_config, client_config + '.bck')
 
     def init_sink_config(self, **args):
         """This function sets configuration for sink server. The function takes the input from command line and writes
@@ -128,7 +133,7 @@ class SetupExp(object):
         if update > 0:
             self.utl.update_config(sink_config, self.sink_config_items)
         # Backup configuration file
-        self.utl.call('cp -f ' + sink_config + ' ' + sink_config + '.bck', shell=True)
+        self.utl.backup_file(sink_config, sink_config + '.bck')
 
     def create_shell_scripts(self):
         """This function creates shell scripts which are used during the experiment setup.
@@ -569,17 +574,19 @@ sshpass -p $password scp -o "StrictHostKeyChecking no" -r $user@\[$ip\]:$remote
         self.utl.call('./collect_ip' + inet + '.sh', shell=True)
         self.utl.call('rm ./collect_ip' + inet + '.sh', shell=True)
 
-    def analyze(self):
+    def analyze(self, workers=1, cache_dir='logs/.cache'):
         """This function analyzes the log data and outputs spreadsheet as report.
+
+        :param workers: number of worker processes to analyze the logs of clients and capture files in parallel.
+        :param cache_dir: directory to cache the intermediate results of log files, so that only the changed log files
+                          are analyzed again. The results are not cached if it is empty.
+        :type workers: int.
+        :type cache_dir: str.
         """
-        anal_logs = analysis.Analysis()
-        print "===== Processing sink logs ====="
-        sink_summary = anal_logs.analyze_sink([self.sink_config_items['SERVERIP'], self.sink_config_items['SERVERPORT'],
-                                               self.sink_config_items['SINK_INTERFACE'], 'logs/sink'])
-        print "===== Processing router logs ====="
-        router_summary = anal_logs.analyze_router('logs/router')
-        print "===== Processing client logs ====="
-        client_summary = anal_logs.analyze_client('logs/clients')
+        anal_logs = analysis.Analysis(cache_dir)
+        sink_summary, router_summary, client_summary = anal_logs.analyze_all(
+            [self.sink_config_items['SERVERIP'], self.sink_config_items['SERVERPORT'],
+             self.sink_config_items['SINK_INTERFACE'], 'logs/sink'], 'logs/router', 'logs/clients', workers)
         df_client = pd.DataFrame(client_summary, columns=['(1) Client Send', '(2) Client lowpan0', '(3) Client wpan0'],
                                  index=client_summary['Client IP'])
         df_router = pd.DataFrame(router_summary, columns=['(4) Router wpan0', '(5) Router lowpan0', '(6) Router eth0'],
@@ -623,6 +630,13 @@ sshpass -p $password scp -o "StrictHostKeyChecking no" -r $user@\[$ip\]:$remote
         # print '----------------------------------'
         writer = pd.ExcelWriter('summary.xlsx', engine='xlsxwriter')
         df_final.to_excel(writer, sheet_name='Sheet1')
+        # latency distribution and throughput of clients, one sheet per report.
+        reports = anal_logs.latency_report()
+        if 'Latency' in reports:
+            print reports['Latency']
+            print '----------------------------------'
+        for name in sorted(reports):
+            reports[name].to_excel(writer, sheet_name=name)
         writer.save()
 
     def stop(self, inet):
@@ -0,0 +1,185 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Benchmark of the receive path of sink server. Sender processes flood the sink port on the loopback interface with
+packets in the format of client devices, and the receiver reads and records them by one of the receive paths:
+    single: one recvfrom per packet and one record per packet (the path before batched receive).
+    into:   batches received by recvfrom_into over a preallocated buffer ring.
+    mmsg:   batches received by recvmmsg.
+The receiving rate (packets per second) of each path is printed.
+
+Usage: python sinkbench.py [-packets 200000] [-senders 2] [-paths single,into,mmsg]
+'''
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import time
+from multiprocessing import Process
+
+from batchrecv import BatchReceiver
+from sinkserver import SinkRecorder
+
+HOST = '::1'
+IDLE_TIME = 0.5  # the receiver stops if no packet is received in this time (in seconds)
+RCVBUF = 8 * 1024 * 1024  # receive buffer of the benchmark socket
+PAYLOADLEN = 64  # length of packets sent by senders
+
+
+def send_packets(port, num, index):
+    """Send packets to the receiver as fast as possible.
+
+    :param port: port of the receiver.
+    :param num: number of packets.
+    :param index: index of sender.
+    :type port: int.
+    :type num: int.
+    :type index: int.
+    """
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    timestamp = time.strftime('%H%M%S') + '000'
+    padding = '-' * (PAYLOADLEN - 8 - len(timestamp))
+    for i in xrange(num):
+        sock.sendto(str(i + index * num).zfill(8) + padding + timestamp, (HOST, port))
+    sock.close()
+
+
+def receive_single(sock, recorder, keys):
+    """Receive and record one packet per system call.
+
+    :param sock: benchmark socket.
+    :param recorder: the recorder of received packets.
+    :param keys: known clients.
+    :type sock: socket.
+    :type recorder: SinkRecorder.
+    :type keys: set.
+
+    Return:
+            int - number of received packets.
+    """
+    data, addr = sock.recvfrom(1536)
+    key = addr[:2]
+    if key not in keys:
+        recorder.add_client(addr)
+        keys.add(key)
+    recorder.record(data, key)
+    return 1
+
+
+def receive_batch(receiver, recorder, keys):
+    """Receive and record a batch of packets.
+
+    :param receiver: the batch receiver of benchmark socket.
+    :param recorder: the recorder of received packets.
+    :param keys: known clients.
+    :type receiver: BatchReceiver.
+    :type recorder: SinkRecorder.
+    :type keys: set.
+
+    Return:
+            int - number of received packets.
+    """
+    batch = []
+    for data, addr in receiver.receive():
+        key = addr[:2]
+        if key not in keys:
+            recorder.add_client(addr)
+            keys.add(key)
+        batch.append((data, key))
+    recorder.record_batch(batch)
+    return len(batch)
+
+
+def run(path, packets, senders, batch):
+    """Run the benchmark of a receive path.
+
+    :param path: receive path, single, into or mmsg.
+    :param packets: number of packets sent by each sender.
+    :param senders: number of sender processes.
+    :param batch: max number of packets in a batch.
+    :type path: str.
+    :type packets: int.
+    :type senders: int.
+    :type batch: int.
+
+    Return:
+            tuple - (received packets, receiving time in seconds).
+    """
+    log_dir = tempfile.mkdtemp(prefix='sinkbench')
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+    sock.bind((HOST, 0))
+    sock.settimeout(IDLE_TIME)
+    port = sock.getsockname()[1]
+    recorder = SinkRecorder(HOST, port, log_dir)
+    receiver = BatchReceiver(sock, batch, use_mmsg=(path == 'mmsg'))
+    if path == 'mmsg' and receiver.mmsg is None:
+        print ('recvmmsg is not available on this platform.')
+    keys = set()
+    procs = [Process(target=send_packets, args=(port, packets, i,)) for i in range(0, senders)]
+    for p in procs:
+        p.start()
+    received = 0
+    start = end = 0
+    try:
+        while True:
+            if path == 'single':
+                num = receive_single(sock, recorder, keys)
+            else:
+                num = receive_batch(receiver, recorder, keys)
+            if received == 0:
+                start = time.time()  # the timer starts from the first packet
+            received += num
+            end = time.time()
+    except socket.timeout:
+        pass
+    finally:
+        for p in procs:
+            p.join()
+        recorder.close()
+        sock.close()
+        shutil.rmtree(log_dir)
+    return received, end - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the receive path of sink server.')
+    parser.add_argument('-packets', dest='packets', type=int, default=200000,
+                        help='Set the number of packets sent by each sender.')
+    parser.add_argument('-senders', dest='senders', type=int, default=2, help='Set the number of sender processes.')
+    parser.add_argument('-batch', dest='batch', type=int, default=64, help='Set the max number of packets in a batch.')
+    parser.add_argument('-paths', dest='paths', default='single,into,mmsg',
+                        help='Set the receive paths to be compared, separated by comma.')
+    args = parser.parse_args()
+    sent = args.packets * args.senders
+    print ('%-8s %10s %10s %10s %12s' % ('path', 'sent', 'received', 'time (s)', 'packets/s'))
+    for path in args.paths.split(','):
+        received, elapsed = run(path, args.packets, args.senders, args.batch)
+        rate = received / elapsed if elapsed > 0 else 0
+        print ('%-8s %10d %10d %10.3f %12.0f' % (path, sent, received, elapsed, rate))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main()
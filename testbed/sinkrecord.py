@@ -0,0 +1,244 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Binary packet-record log of sink server.
+
+A record log "<log name>.rec" starts with the 8-byte magic "SMITREC1", followed by fixed-width little-endian records:
+    seq     uint32  sequence number of packet
+    length  uint16  payload length
+    sent    uint32  sent timestamp from the payload, in milliseconds of the day (SENT_NONE if it is invalid)
+    rcvd    int64   received timestamp, in milliseconds since the epoch
+    client  uint32  client id, i.e., (client port << 16) | sink port
+The client table "<log name>.clients" maps a client id to the client connection information, one "id<TAB>info" line
+per client, where the information has the format client|ip.port|sink|ip.port.
+
+Usage: python sinkrecord.py <log name>.rec ... exports record logs to text logs of the same format as the text mode.
+'''
+
+import os
+import sys
+import struct
+import time
+
+MAGIC = 'SMITREC1'  # file header of record logs
+EXT = '.rec'  # extension of record logs
+CLIENTS_EXT = '.clients'  # extension of client tables
+RECORD = struct.Struct('<IHIqI')  # seq, length, sent, rcvd, client
+RECORD_DTYPE = [('seq', '<u4'), ('length', '<u2'), ('sent', '<u4'), ('rcvd', '<i8'), ('client', '<u4')]
+SENT_NONE = 0xffffffff  # sent timestamp which cannot be parsed
+TS_LEN = 9  # length of timestamp in format HHMMSSXXX
+DATE_FMT = '%d/%m/%Y %H:%M:%S'  # the format of log time in text logs
+
+
+def client_id(client_port, sink_port):
+    """Return the client id of a connection, which is the same in all processes writing the same log.
+
+    :param client_port: client port.
+    :param sink_port: sink port which receives the packets.
+    :type client_port: int.
+    :type sink_port: int.
+
+    Return:
+            int - client id.
+    """
+    return ((int(client_port) & 0xffff) << 16) | (int(sink_port) & 0xffff)
+
+
+def parse_packet(data):
+    """Parse the sequence number and sent timestamp of a packet in format: sequence (8 bytes), padding, timestamp
+       (HHMMSSXXX).
+
+    :param data: received packet.
+    :type data: str.
+
+    Return:
+            tuple - (seq, sent), where sent is in milliseconds of the day.
+    """
+    try:
+        seq = int(data[0:8])
+    except ValueError:
+        seq = 0
+    ts = data[-TS_LEN:]
+    try:
+        sent = int(ts[0:2]) * 3600000 + int(ts[2:4]) * 60000 + int(ts[4:6]) * 1000 + int(ts[6:9])
+    except ValueError:
+        sent = SENT_NONE
+    return seq, sent
+
+
+def format_ms(ms):
+    """Format milliseconds of the day in format HHMMSSXXX.
+
+    :param ms: milliseconds of the day.
+    :type ms: int.
+
+    Return:
+            str - formatted time.
+    """
+    seconds, millis = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%02d%02d%02d%03d' % (hours, minutes, seconds, millis)
+
+
+class RecordWriter(object):
+    """
+    This class appends packet records to a binary record log. Records are buffered in memory and written by one system
+    call when the buffer is full, the buffer is older than FLUSH_TIME or flush is called, so that processes appending to
+    the same log do not split records.
+    """
+    FLUSH_SIZE = 1024  # the number of buffered records which triggers a write
+    FLUSH_TIME = 1.0  # the time (in seconds) after which buffered records are written
+
+    def __init__(self, log_name):
+        """Constructor opens the record log and the client table.
+
+        :param log_name: log name without extension.
+        :type log_name: str.
+        """
+        self.log_name = log_name
+        new = not os.path.isfile(log_name + EXT) or os.path.getsize(log_name + EXT) == 0
+        self.file = open(log_name + EXT, 'ab', 0)
+        if new:
+            self.file.write(MAGIC)
+        self.clients = set()  # registered client ids
+        self.buf = []
+        self.last_flush = time.time()
+
+    def add_client(self, conn_info, client_port, sink_port):
+        """Register a client in the client table.
+
+        :param conn_info: client connection information, format: client|ip.port|sink|ip.port.
+        :param client_port: client port.
+        :param sink_port: sink port which receives the packets.
+        :type conn_info: str.
+        :type client_port: int.
+        :type sink_port: int.
+
+        Return:
+                int - client id.
+        """
+        cid = client_id(client_port, sink_port)
+        if cid not in self.clients:
+            with open(self.log_name + CLIENTS_EXT, 'a') as table:
+                table.write(str(cid) + '\t' + conn_info + '\n')
+            self.clients.add(cid)
+        return cid
+
+    def write(self, data, rcvd, cid):
+        """Append the record of a received packet.
+
+        :param data: received packet.
+        :param rcvd: received time in seconds since the epoch.
+        :param cid: client id.
+        :type data: str.
+        :type rcvd: float.
+        :type cid: int.
+        """
+        seq, sent = parse_packet(data)
+        self.buf.append(RECORD.pack(seq & 0xffffffff, min(len(data), 0xffff), sent, int(rcvd * 1000), cid))
+        if len(self.buf) >= self.FLUSH_SIZE or rcvd - self.last_flush >= self.FLUSH_TIME:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records into the log.
+        """
+        if self.buf:
+            self.file.write(''.join(self.buf))
+            self.buf = []
+        self.last_flush = time.time()
+
+    def close(self):
+        """Flush the buffered records and close the log.
+        """
+        self.flush()
+        self.file.close()
+
+
+def read_clients(log_name):
+    """Read the client table of a record log.
+
+    :param log_name: log name without extension.
+    :type log_name: str.
+
+    Return:
+            dict - client id -> client connection information.
+    """
+    clients = {}
+    if os.path.isfile(log_name + CLIENTS_EXT):
+        with open(log_name + CLIENTS_EXT) as table:
+            for line in table:
+                items = line.strip().split('\t')
+                if len(items) == 2:
+                    clients[int(items[0])] = items[1]
+    return clients
+
+
+def export_text(path, out=None):
+    """Export a record log to a text log with the same format as the text mode of sink server. The padding of payload
+       is restored as '-' characters, which is the padding sent by client devices.
+
+    :param path: path to the record log.
+    :param out: path to the text log, the default is the record log without extension.
+    :type path: str.
+    :type out: str.
+
+    Return:
+            int - the number of exported records.
+    """
+    log_name = path[:-len(EXT)] if path.endswith(EXT) else path
+    if out is None:
+        out = log_name
+    clients = read_clients(log_name)
+    num = 0
+    with open(log_name + EXT, 'rb') as rec, open(out, 'w') as text:
+        if rec.read(len(MAGIC)) != MAGIC:
+            raise IOError('File \"' + path + '\" is not a record log.')
+        second = -1
+        log_time = ''
+        clock = 0
+        while True:
+            chunk = rec.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            lines = []
+            for offset in xrange(0, len(chunk) - RECORD.size + 1, RECORD.size):
+                seq, length, sent, rcvd, cid = RECORD.unpack_from(chunk, offset)
+                if rcvd // 1000 != second:
+                    second = rcvd // 1000
+                    local = time.localtime(second)
+                    log_time = time.strftime(DATE_FMT, local)
+                    clock = (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec) * 1000
+                sent_ts = format_ms(sent) if sent != SENT_NONE else ''
+                lines.append(log_time + '\t' + str(seq).zfill(8) + '\t' + '-' * max(length - 8 - TS_LEN, 0) + '\t' +
+                             sent_ts + '\t' + format_ms(clock + rcvd % 1000) + '\t' + clients.get(cid, '') + '\n')
+            text.write(''.join(lines))
+            num += len(lines)
+    return num
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print ('Usage: python sinkrecord.py <log name>.rec ...')
+        sys.exit(1)
+    for arg in sys.argv[1:]:
+        print (arg + ': ' + str(export_text(arg)) + ' records exported.')
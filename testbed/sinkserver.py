@@ -23,6 +23,12 @@ import os
 import sys
 import socket
 import inspect
+import select
+import errno
+import ctypes
+import ssl
+import threading
+import Queue
 
 sys.path.insert(0, '../../')
 sys.path.insert(0, '../../../')
@@ -33,10 +39,420 @@ import traceback
 import time
 from datetime import datetime
 from multiprocessing import Process
+from multiprocessing import cpu_count
 import logging
 import random
+from collections import OrderedDict
+from batchrecv import BatchReceiver
+import sinkrecord
+import sinkstats
 
 TIMEOUT = 30  # timeout for scoket connection
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)  # socket option to share a port, 15 on Linux
+SO_ATTACH_REUSEPORT_CBPF = 51  # socket option to attach a classic BPF program selecting a socket, Linux only
+SKF_NET_OFF = -0x100000  # offset of network header in classic BPF
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16), ('jt', ctypes.c_uint8), ('jf', ctypes.c_uint8), ('k', ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_uint16), ('filter', ctypes.POINTER(_SockFilter))]
+
+
+def attach_shard_filter(sock, num):
+    """Attach a classic BPF program to a group of sockets sharing a port by SO_REUSEPORT. The program selects the
+       socket by the last 32 bits of client IPv6 address modulo the number of sockets, so that all packets of a client
+       device are received by the same socket.
+
+    :param sock: a socket of the group.
+    :param num: number of sockets in the group.
+    :type sock: socket.
+    :type num: int.
+
+    Return:
+            bool - True if the program is attached, False if it is not supported by the kernel. In this case, the kernel
+            selects the socket by the hash of client address and port.
+    """
+    # ld [net + 20]; mod #num; ret a
+    prog = (_SockFilter * 3)(_SockFilter(0x20, 0, 0, (SKF_NET_OFF + 20) & 0xffffffff), _SockFilter(0x94, 0, 0, num),
+                             _SockFilter(0x16, 0, 0, 0))
+    fprog = _SockFprog(len(prog), prog)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF,
+                        ctypes.string_at(ctypes.addressof(fprog), ctypes.sizeof(fprog)))
+        return True
+    except socket.error as e:
+        print ('Sharding by client address is not supported: ' + str(e))
+        return False
+
+
+def create_shard_sockets(host, port, num):
+    """Create a group of UDP sockets sharing the address of sink server by SO_REUSEPORT, one for each worker.
+       The sockets must be kept open by the supervisor, so that the group does not change when a worker is restarted
+       and a client is always served by the same worker.
+
+    :param host: IPv6 address of sink server.
+    :param port: port of sink server.
+    :param num: number of sockets.
+    :type host: str.
+    :type port: int.
+    :type num: int.
+
+    Return:
+            list - the created sockets.
+    """
+    socks = []
+    for i in range(0, num):
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        socks.append(sock)
+    if num > 1:
+        attach_shard_filter(socks[0], num)
+    return socks
+
+
+class SinkSupervisor(object):
+    """
+    This class starts sink workers in individual processes, one for each socket of a group sharing the port of sink
+    server, and restarts the workers which exit unexpectedly. The worker keeps serving the same socket after restart.
+    """
+    CHECK_TIME = 1.0  # the time (in seconds) to check the workers
+
+    def __init__(self, target, socks):
+        """Constructor initializes variables
+
+        :param target: worker function which takes the worker index and socket as arguments.
+        :param socks: sockets sharing the port of sink server.
+        :type target: function.
+        :type socks: list.
+        """
+        self.target = target
+        self.socks = socks
+        self.workers = [None] * len(socks)
+
+    def start_worker(self, index):
+        """Start a worker process for the socket at the given index.
+
+        :param index: index of worker.
+        :type index: int.
+        """
+        p = Process(target=self.target, args=(index, self.socks[index],))
+        p.start()
+        self.workers[index] = p
+        print ('Worker ' + str(index) + ' started, pid: ' + str(p.pid))
+
+    def start(self):
+        """Start all workers and restart the dead ones until the supervisor is interrupted.
+        """
+        try:
+            for i in range(0, len(self.socks)):
+                self.start_worker(i)
+            while True:
+                time.sleep(self.CHECK_TIME)
+                for i, p in enumerate(self.workers):
+                    if not p.is_alive():
+                        print ('Worker ' + str(i) + ' exited with code ' + str(p.exitcode) + ', restarting.')
+                        self.start_worker(i)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for p in self.workers:
+                if p is not None and p.is_alive():
+                    p.terminate()
+                    p.join()
+            for sock in self.socks:
+                sock.close()
+
+
+class SinkRecorder(object):
+    """
+    This class records received packets into per-client log files for a sink server which serves all clients in one
+    process. The log files have the same path, name and record format as the ones written by the connection handlers,
+    i.e., exp/<client ip>/<client ip>--<date time>, so that the logs can be analyzed by the Analysis class.
+    If the log format is "binary", packets are recorded in record logs (see sinkrecord) with the extension ".rec".
+    Log files are kept open in a bounded least recently used cache, so that the number of open files does not grow with
+    the number of clients.
+    """
+    utl = utils.Utils()
+    MAX_OPEN = 256  # the max number of log files which are kept open at the same time
+    DATE_FMT = '%d/%m/%Y %H:%M:%S'  # the format of log time, it is the same as the one used in connection handlers
+
+    def __init__(self, sink_ip, sink_port, log_dir='exp', log_format='text'):
+        """Constructor initializes variables
+
+        :param sink_ip: IP address of sink server.
+        :param sink_port: port of sink server which receives the packets.
+        :param log_dir: directory to contain the log files.
+        :param log_format: format of log files, "text" or "binary".
+        :type sink_ip: str.
+        :type sink_port: str.
+        :type log_dir: str.
+        :type log_format: str.
+        """
+        self.sink_info = '|sink|' + str(sink_ip) + '.' + str(sink_port)
+        self.sink_port = int(sink_port)
+        self.log_dir = log_dir
+        self.binary = log_format == 'binary'
+        self.clients = {}  # client (ip, port) -> (log file path, connection information, client id)
+        self.files = OrderedDict()  # opened log files in the least recently used order
+        self.second = -1  # the second of the cached time strings
+        self.log_time = ''  # cached log time, format: DD/MM/YYYY HH:MM:SS
+        self.clock = ''  # cached time of day, format: HHMMSS
+
+    def add_client(self, addr):
+        """Register a new client and create the directory for its log file.
+
+        :param addr: client address.
+        :type addr: tuple.
+        """
+        dt = time.strftime('%d-%m-%Y-%H-%M-%S')  # get the date and current time of connection.
+        path = os.path.join(self.log_dir, addr[0])
+        self.utl.makedir(path)
+        log_name = os.path.join(path, addr[0] + '--' + dt)
+        # Log client connection information including client (IP, port) and the port of sink.
+        conn_info = 'client|' + str(addr[0]) + '.' + str(addr[1]) + self.sink_info
+        self.clients[addr[:2]] = (log_name, conn_info, sinkrecord.client_id(addr[1], self.sink_port))
+
+    def get_file(self, key):
+        """Return the opened log file of a client. The least recently used file is closed if too many files are open.
+           Clients sharing a log file (the same IP address connected in the same second) share the opened file.
+
+        :param key: client (ip, port).
+        :type key: tuple.
+        """
+        log_name = self.clients[key][0]
+        f = self.files.pop(log_name, None)
+        if f is None:
+            if len(self.files) >= self.MAX_OPEN:
+                self.files.popitem(last=False)[1].close()
+            if self.binary:
+                f = sinkrecord.RecordWriter(log_name)
+            else:
+                f = open(log_name, 'a')
+        self.files[log_name] = f
+        return f
+
+    def tick(self, now):
+        """Update the cached time strings, which only change once per second.
+
+        :param now: current time in seconds since the epoch.
+        :type now: float
+        """
+        second = int(now)
+        if second != self.second:
+            local = time.localtime(second)
+            self.second = second
+            self.log_time = time.strftime(self.DATE_FMT, local)
+            self.clock = time.strftime('%H%M%S', local)
+
+    def write_binary(self, data, now, key):
+        """Write a packet record into the record log of the client.
+
+        :param data: received packet.
+        :param now: received time in seconds since the epoch.
+        :param key: client (ip, port).
+        :type data: str.
+        :type now: float.
+        :type key: tuple.
+        """
+        log_name, conn_info, cid = self.clients[key]
+        writer = self.get_file(key)
+        if cid not in writer.clients:
+            writer.add_client(conn_info, key[1], self.sink_port)
+        writer.write(data, now, cid)
+
+    def record(self, data, key):
+        """Write a received packet into the log file of the client.
+
+        :param data: received packet.
+        :param key: client (ip, port).
+        :type data: str.
+        :type key: tuple.
+        """
+        now = time.time()
+        if self.binary:
+            self.write_binary(data, now, key)
+            return
+        self.tick(now)
+        timestamp = self.clock + '%03d' % int((now - self.second) * 1000)
+        # Calculate length of message other than the sequence number and timestamp.
+        # The length of sequence number is fixed 8 bytes.
+        other_len = len(data) - 8 - len(timestamp)
+        record = self.log_time + '\t' + data[0:8] + '\t' + data[8:8 + other_len] + '\t' + data[8 + other_len:] + \
+                 '\t' + timestamp + '\t' + self.clients[key][1] + '\n'
+        self.get_file(key).write(record)
+
+    def record_batch(self, packets):
+        """Write a batch of received packets into the log files of the clients. The packets of a batch are read from
+           the socket at the same time, so they share the receiving timestamp.
+
+        :param packets: received packets in the form of (data, client (ip, port)).
+        :type packets: list.
+        """
+        now = time.time()
+        if self.binary:
+            for data, key in packets:
+                self.write_binary(data, now, key)
+            return
+        self.tick(now)
+        timestamp = self.clock + '%03d' % int((now - self.second) * 1000)
+        ts_len = len(timestamp)
+        tail = '\t' + timestamp + '\t'
+        for data, key in packets:
+            other_len = len(data) - 8 - ts_len
+            record = self.log_time + '\t' + data[0:8] + '\t' + data[8:8 + other_len] + '\t' + data[8 + other_len:] + \
+                     tail + self.clients[key][1] + '\n'
+            self.get_file(key).write(record)
+
+    def flush(self):
+        """Flush the opened log files.
+        """
+        for f in self.files.itervalues():
+            f.flush()
+
+    def close(self):
+        """Close all opened log files.
+        """
+        for f in self.files.itervalues():
+            f.close()
+        self.files.clear()
+
+
+class SessionWorker(object):
+    """
+    This class serves established DTLS sessions in a thread of the sink server. The sessions of a worker are
+    multiplexed by select and their packets are recorded by a SinkRecorder, so that a fixed number of workers serves
+    all client devices instead of one process for each.
+    """
+    WAIT_TIME = 0.5  # the max time (in seconds) to wait for packets before taking new sessions
+    FLUSH_TIME = 1.0  # the time (in seconds) to flush log files
+    MAX_BATCH = 64  # the max number of packets read from a session before serving other sessions
+
+    def __init__(self, index, recorder, stats=None, max_len=1536):
+        """Constructor initializes variables
+
+        :param index: index of worker.
+        :param recorder: the recorder of received packets, which is only used by this worker.
+        :param stats: live statistics of received packets.
+        :param max_len: the max length of packet.
+        :type index: int.
+        :type recorder: SinkRecorder.
+        :type stats: sinkstats.SinkStats.
+        :type max_len: int.
+        """
+        self.index = index
+        self.recorder = recorder
+        self.stats = stats
+        self.max_len = max_len
+        self.queue = Queue.Queue()  # new sessions handed over by the handshake threads
+        self.sessions = {}  # file descriptor -> (DTLS socket, client address)
+        self.running = True
+
+    def add(self, sock, addr):
+        """Hand over an established session to the worker.
+
+        :param sock: DTLS socket of the session.
+        :param addr: client address.
+        :type sock: ssl.SSLSocket.
+        :type addr: tuple.
+        """
+        self.queue.put((sock, addr))
+
+    def load(self):
+        """Return the number of sessions served by the worker.
+        """
+        return len(self.sessions) + self.queue.qsize()
+
+    def take_sessions(self):
+        """Start serving the sessions handed over since the last call.
+        """
+        while True:
+            try:
+                sock, addr = self.queue.get_nowait()
+            except Queue.Empty:
+                return
+            print ('New connection from: ' + addr[0] + ', ' + str(addr[1]) + ' (worker ' + str(self.index) + ')')
+            self.recorder.add_client(addr)
+            sock.settimeout(0.0)  # the session is read only when it is readable.
+            self.sessions[sock.fileno()] = (sock, addr)
+
+    def drop(self, fd, reason):
+        """Stop serving a session and close it.
+
+        :param fd: file descriptor of the session.
+        :param reason: the reason to print.
+        :type fd: int.
+        :type reason: str.
+        """
+        sock, addr = self.sessions.pop(fd)
+        print ('Connection from ' + addr[0] + ', ' + str(addr[1]) + ' closed: ' + reason)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+        except Exception:
+            pass
+
+    def receive(self, fd):
+        """Read and record the pending packets of a session.
+
+        :param fd: file descriptor of the session.
+        :type fd: int.
+        """
+        sock, addr = self.sessions[fd]
+        key = addr[:2]
+        for i in xrange(self.MAX_BATCH):
+            try:
+                data = sock.recv(self.max_len)
+            except ssl.SSLError as e:
+                if e.args and e.args[0] == ssl.SSL_ERROR_WANT_READ:  # no more application data.
+                    return
+                self.drop(fd, str(e))
+                return
+            except socket.error as e:
+                self.drop(fd, str(e))
+                return
+            if not data:
+                self.drop(fd, 'shut down by client.')
+                return
+            self.recorder.record(data, key)
+            if self.stats is not None:
+                self.stats.update(addr, data, time.time())
+
+    def run(self):
+        """Serve the sessions until the worker is stopped.
+        """
+        try:
+            last_flush = time.time()
+            while self.running:
+                self.take_sessions()
+                if self.sessions:
+                    readable, writable, errors = select.select(self.sessions.keys(), [], [], self.WAIT_TIME)
+                    for fd in readable:
+                        self.receive(fd)
+                else:
+                    time.sleep(self.WAIT_TIME)
+                if time.time() - last_flush >= self.FLUSH_TIME:
+                    self.recorder.flush()
+                    last_flush = time.time()
+        finally:
+            for fd in self.sessions.keys():
+                self.drop(fd, 'sink server stopped.')
+            self.recorder.close()
+
+    def start(self):
+        """Start the worker in a daemon thread.
+
+        Return:
+                threading.Thread - the thread of worker.
+        """
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return thread
 
 
 class Sink(object):
@@ -48,10 +464,17 @@ class Sink(object):
     utl = utils.Utils()
     cm = certmngr.CertManager()  # for certificate generation
     config = {'CERT': '', 'CACERT': '', 'SK': '', 'SERVERIP': '', 'SERVERPORT': '', 'CACHAIN': '',
-              'TYPE': '', 'CERT_REQS': 'CERT_REQUIRED'}  # configuration keywords
+              'TYPE': '', 'CERT_REQS': 'CERT_REQUIRED', 'SINKMODE': '', 'SINKWORKERS': '',
+              'SINKLOG': '', 'STATSPORT': '', 'HANDSHAKES': '', 'HANDSHAKETIMEOUT': '', 'OCSP': '',
+              'STAPLE': ''}  # configuration keywords
     servercnf = 'sink_expcnf'  # the path to configuration file for this client package
     package_path = ''  # the path to this pakcage
+    stats = None  # live statistics of received packets, see sinkstats
     MAXLEN = 1536  # the max length of packet which can be sent and received
+    HANDSHAKES = 16  # the default number of concurrent DTLS handshakes in pool mode
+    HANDSHAKE_TIMEOUT = 10.0  # the default time (in seconds) to finish a DTLS handshake in pool mode
+    ACCEPT_TIME = 1.0  # the max time (in seconds) to wait for a connection request in pool mode
+    STAPLE_REFRESH = 60  # the interval (in seconds) to check the stapled OCSP response
 
     def __init__(self):
         self.package_path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
@@ -62,7 +485,8 @@ class Sink(object):
     def init_config(self, **args):
         """This function initializes the configuration for the class object, where the parameters are read from a
                configuration file. This function should be called before other (class member) function call.
-               The acceptable arguments are: config, CACERT, SK, SERVERIP, SERVERPORT, CACHAIN, TYPE, CERT_REQS.
+               The acceptable arguments are: config, CACERT, SK, SERVERIP, SERVERPORT, CACHAIN, TYPE, CERT_REQS,
+               SINKMODE, SINKWORKERS, SINKLOG, STATSPORT, HANDSHAKES, HANDSHAKETIMEOUT, OCSP, STAPLE.
                Specifically, the keyword "config" sets the path to configuration file.
                If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -82,7 +506,7 @@ class Sink(object):
         if update > 0:
             self.utl.update_config(self.servercnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.servercnf + ' ' + self.servercnf + '.bck', shell=True)
+        self.utl.backup_file(self.servercnf, self.servercnf + '.bck')
 
     def connection_handler(self, sock, addr):
         """This is a connection handler for subthread. It process a new connection for certificate request.
@@ -103,10 +527,15 @@ class Sink(object):
             self.utl.makedir('exp/' + path)
             os.chdir('exp/' + path)  # change the current working directory
             log_name = addr[0] + '--' + dt
+            if self.config.get('SINKLOG', '').lower() == 'binary':
+                self.record_binary(sock, addr, log_name, self.config['SERVERPORT'])
+                return
             logging.basicConfig(filename=log_name, level=logging.INFO, format='%(asctime)s\t%(message)s',
                                 datefmt='%d/%m/%Y %H:%M:%S')
             while True:
                 data = sock.recvfrom(self.MAXLEN)
+                if self.stats is not None:
+                    self.stats.update(addr, data, time.time())
                 timestamp = datetime.now().strftime('%H%M%S%f')[:-3]
                 # Calculate length of message other than the sequence number and timestamp.
                 # The length of sequence number is fixed 8 bytes.
@@ -125,43 +554,199 @@ class Sink(object):
             print ('Unknown errors.')
             print (e)
         finally:
+            if self.stats is not None:
+                self.stats.publish()
             sock.shutdown(socket.SHUT_RDWR)
             sock.close()
 
-    def start(self):
+    def record_binary(self, sock, addr, log_name, port):
+        """Record the packets received from a client in a binary record log (see sinkrecord) until the connection is
+           closed.
+
+        :param sock: client socket.
+        :param addr: client IP address.
+        :param log_name: log name without extension.
+        :param port: sink port which receives the packets.
+        :type sock: DtlsWrap.
+        :type addr: tuple.
+        :type log_name: str.
+        :type port: str.
+        """
+        writer = sinkrecord.RecordWriter(log_name)
+        try:
+            conn_info = 'client|' + str(addr[0]) + '.' + str(addr[1]) + '|sink|' + str(
+                self.config['SERVERIP']) + '.' + str(port)
+            cid = writer.add_client(conn_info, addr[1], port)
+            while True:
+                data = sock.recvfrom(self.MAXLEN)
+                now = time.time()
+                writer.write(data, now, cid)
+                if self.stats is not None:
+                    self.stats.update(addr, data, now)
+        finally:
+            writer.close()
+
+    def handshake(self, sock, addr, timeout):
+        """Finish the DTLS handshake of an accepted connection within the timeout.
+
+        :param sock: DTLS socket of the accepted connection.
+        :param addr: client address.
+        :param timeout: the max time (in seconds) of the handshake.
+        :type sock: ssl.SSLSocket.
+        :type addr: tuple.
+        :type timeout: float.
+
+        Return:
+                bool - True if the handshake is finished, False if it fails or times out.
+        """
+        dw = DTLSWrap.DtlsWrap()
+        dw.set_dtls_socket(sock)
+        try:
+            sock.settimeout(timeout)
+            dw.do_handshake()
+        except Exception as e:
+            print ('DTLS handshake with ' + addr[0] + ', ' + str(addr[1]) + ' failed: ' + str(e))
+            try:
+                sock.close()
+            except Exception:
+                pass
+            return False
+        info = dw.handshake_info()
+        print ('DTLS handshake with ' + addr[0] + ', ' + str(addr[1]) + ' finished in ' + str(round(info['time'], 3)) +
+               ' seconds' + (' (session resumed).' if info['resumed'] else '.'))
+        return True
+
+    def run_handshakes(self, pending, workers, timeout):
+        """Handshake thread of pool mode. It takes the accepted connections, finishes their handshakes and hands the
+           established sessions over to the least loaded worker.
+
+        :param pending: queue of accepted connections (DTLS socket, client address).
+        :param workers: session workers.
+        :param timeout: the max time (in seconds) of a handshake.
+        :type pending: Queue.Queue.
+        :type workers: list.
+        :type timeout: float.
+        """
+        while True:
+            sock, addr = pending.get()
+            if self.handshake(sock, addr, timeout):
+                min(workers, key=lambda worker: worker.load()).add(sock, addr)
+
+    def serve_pool(self, server):
+        """This function serves clients in pool mode: the accept loop only accepts connection requests, "HANDSHAKES"
+           threads run the DTLS handshakes concurrently with a timeout of "HANDSHAKETIMEOUT" seconds, and the
+           established sessions are served by "SINKWORKERS" session workers (one per CPU by default), so that a slow
+           handshake does not delay the other clients.
+
+        :param server: the listening DTLS socket.
+        :type server: DtlsWrap.
+        """
+        num = int(self.config.get('SINKWORKERS') or 0) or cpu_count()
+        handshakes = int(self.config.get('HANDSHAKES') or 0) or self.HANDSHAKES
+        timeout = float(self.config.get('HANDSHAKETIMEOUT') or 0) or self.HANDSHAKE_TIMEOUT
+        log_format = self.config.get('SINKLOG', '').lower() or 'text'
+        workers = [SessionWorker(i, SinkRecorder(self.config.get('SERVERIP', '::1'), self.config['SERVERPORT'],
+                                                 log_format=log_format), self.stats, self.MAXLEN)
+                   for i in range(0, num)]
+        threads = [worker.start() for worker in workers]
+        pending = Queue.Queue()
+        for i in range(0, handshakes):
+            thread = threading.Thread(target=self.run_handshakes, args=(pending, workers, timeout,))
+            thread.daemon = True
+            thread.start()
+        print (str(num) + ' session workers and ' + str(handshakes) + ' handshake threads started.')
+        server.dtls_sock.settimeout(self.ACCEPT_TIME)  # accept returns None if no request arrives in time.
+        try:
+            while True:
+                acc = server.accept()
+                if acc:
+                    pending.put(acc)  # acc[0] is SSLSocket object, acc[1] is a tuple (host, port, long, long)
+        finally:
+            for worker in workers:
+                worker.running = False
+            for thread in threads:
+                thread.join(SessionWorker.WAIT_TIME * 4)
+            if self.stats is not None:
+                self.stats.publish()
+
+    def refresh_staple(self):
+        """Keep the OCSP response of the sink certificate in the file "STAPLE" current, which is stapled to the
+           certificate in DTLS handshakes (see DtlsWrap). The response is checked every STAPLE_REFRESH seconds and
+           queried from the OCSP server "OCSP" when it is out of date.
+        """
+        while True:
+            time.sleep(self.STAPLE_REFRESH)
+            try:
+                self.cm.ocsp_response(self.config.get('CACHAIN', ''), self.config.get('CERT', ''),
+                                      self.config['OCSP'], self.config['STAPLE'])
+            except Exception as e:
+                print ('Error: the OCSP response to staple is not refreshed: ' + str(e))
+
+    def start_stapling(self):
+        """Fetch the OCSP response of the sink certificate to staple, and start a thread to refresh it.
+        """
+        try:
+            if self.cm.ocsp_response(self.config.get('CACHAIN', ''), self.config.get('CERT', ''),
+                                     self.config['OCSP'], self.config['STAPLE']) != '':
+                print ('OCSP response to staple: ' + self.config['STAPLE'])
+        except Exception as e:
+            print ('Error: the OCSP response to staple is not available: ' + str(e))
+        thread = threading.Thread(target=self.refresh_staple)
+        thread.daemon = True
+        thread.start()
+
+    def start(self, sock=None):
         """This function start a server which can interact with a DTLS client and receive messages.
            This function depends on DTLSWrap class and the related arguments are configured in the configuration file.
+           If the keyword "SINKMODE" is "sharded", the server is started in worker processes (see start_sharded).
+           If it is "pool", the clients are served by handshake threads and session workers (see serve_pool).
+
+        :param sock: a bound UDP socket to serve, a new socket is created if it is None.
+        :type sock: socket.
         """
-        print ('Start server.')
-        print ('Checking certificate...')
-        # Check certificate environment
-        try:
-            ca_path = os.path.expanduser(self.config.get('CACERT', ''))
-            chain_path = os.path.expanduser(self.config.get('CACHAIN', ''))
-            if self.cm.verify_cert_key() and self.cm.verify_cert(chain_path, ca_path, ''):
-                print ('Verification of local certificate succeeded.')
-            else:
+        if sock is None:
+            print ('Start server.')
+            print ('Checking certificate...')
+            # Check certificate environment
+            try:
+                ca_path = os.path.expanduser(self.config.get('CACERT', ''))
+                chain_path = os.path.expanduser(self.config.get('CACHAIN', ''))
+                if self.cm.verify_cert_key() and self.cm.verify_cert(chain_path, ca_path, ''):
+                    print ('Verification of local certificate succeeded.')
+                else:
+                    return
+            except Exception as e:
+                print (e)
+                return
+            if self.config.get('STAPLE', '') != '' and self.config.get('OCSP', '') != '':
+                self.start_stapling()
+            # Connection handlers and workers inherit the statistics and publish them to the stats server.
+            self.stats = sinkstats.start_stats(self.config.get('STATSPORT', ''),
+                                               local=(self.config.get('SINKMODE', '').lower() == 'pool'))
+            if self.config.get('SINKMODE', '').lower() == 'sharded':
+                self.start_sharded()
                 return
-        except Exception as e:
-            print (e)
-            return
         try:
             # Create socket for DTLS handshake.
             server = DTLSWrap.DtlsWrap()
             client = DTLSWrap.DtlsWrap()
             print ('Read DTLS configuration.')
             server.init_config(config=self.servercnf)
-            print ('Create DTLS socket.')
-            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-            host = self.config.get('SERVERIP', '::1')
-            port = self.config.get('SERVERPORT', 12345)
-            print ("HOST: " + host + ", port: " + port)
-            sock.bind((host, int(port)))
+            if sock is None:
+                print ('Create DTLS socket.')
+                sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                host = self.config.get('SERVERIP', '::1')
+                port = self.config.get('SERVERPORT', 12345)
+                print ("HOST: " + host + ", port: " + port)
+                sock.bind((host, int(port)))
             server.wrap_socket(sock)
 
             # Listen connection request.
             server.listen(3)
             print ('Listen DTLS handshake request ...')
+            if self.config.get('SINKMODE', '').lower() == 'pool':
+                self.serve_pool(server)
+                return
             while True:
                 acc = server.accept()
                 if acc:
@@ -177,6 +762,28 @@ class Sink(object):
         except Exception as e:
             print (e)
 
+    def serve_shard(self, index, sock):
+        """This function is the worker of sharded mode, which serves DTLS clients on a socket of the group.
+
+        :param index: index of worker.
+        :param sock: a socket sharing the port of sink server.
+        :type index: int.
+        :type sock: socket.
+        """
+        print ('Worker ' + str(index) + ': listen DTLS handshake request ...')
+        self.start(sock)
+
+    def start_sharded(self):
+        """This function starts "SINKWORKERS" worker processes (one per CPU by default) sharing the port of sink
+           server by SO_REUSEPORT. Each client device is always served by the same worker, and a supervisor restarts
+           the workers which exit unexpectedly.
+        """
+        host = self.config.get('SERVERIP', '::1')
+        port = int(self.config.get('SERVERPORT', 12345))
+        num = int(self.config.get('SINKWORKERS') or 0) or cpu_count()
+        print ('Start ' + str(num) + ' sink workers on HOST: ' + host + ', port: ' + str(port))
+        SinkSupervisor(self.serve_shard, create_shard_sockets(host, port, num)).start()
+
 
 class SinkPlain(object):
     """
@@ -184,10 +791,14 @@ class SinkPlain(object):
     This class needs a configuration file 'sink_expcnf' to configure certificate, network and experiment parameters.
     """
     utl = utils.Utils()
-    config = {'SERVERIP': '', 'SERVERPORT': ''}  # configuration keywords
+    config = {'SERVERIP': '', 'SERVERPORT': '', 'SINKMODE': '', 'SINKSOCKETS': '',
+              'SINKWORKERS': '', 'SINKLOG': '', 'STATSPORT': ''}  # configuration keywords
     server_cnf = 'sink_expcnf'  # the path to configuration file for this client package
     package_path = ''  # the path to this pakcage
+    stats = None  # live statistics of received packets, see sinkstats
     MAX_LEN = 1536  # the max length of packet which can be sent and received
+    MAX_BATCH = 64  # the max number of packets read from a socket before serving other sockets
+    FLUSH_TIME = 1.0  # the time (in seconds) to flush log files in event loop mode
 
     def __init__(self):
         self.package_path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
@@ -198,7 +809,8 @@ class SinkPlain(object):
     def init_config(self, **kwargs):
         """This function initializes the configuration for the class object, where the parameters are read from a
                configuration file. This function should be called before other (class member) function call.
-               The acceptable arguments are: config, SERVERIP, SERVERPORT.
+               The acceptable arguments are: config, SERVERIP, SERVERPORT, SINKMODE, SINKSOCKETS, SINKWORKERS,
+               SINKLOG, STATSPORT.
                Specifically, the keyword "config" sets the path to configuration file.
                If arguments are passed to this function, the specified configuration file will be updated.
 
@@ -218,7 +830,7 @@ class SinkPlain(object):
         if update > 0:
             self.utl.update_config(self.server_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.server_cnf + ' ' + self.server_cnf + '..bck', shell=True)
+        self.utl.backup_file(self.server_cnf, self.server_cnf + '..bck')
 
     def connection_handler(self, addr):
         """This is a connection handler for subthread. It process a new connection for certificate request.
@@ -247,20 +859,29 @@ class SinkPlain(object):
             self.utl.makedir('exp/' + path)
             os.chdir('exp/' + path)  # change the current working directory
             log_name = addr[0] + '--' + dt
+            receiver = BatchReceiver(rpl_sock, self.MAX_BATCH, self.MAX_LEN)
+            if self.config.get('SINKLOG', '').lower() == 'binary':
+                self.record_binary(receiver, addr, log_name, port)
+                return
             logging.basicConfig(filename=log_name, level=logging.INFO, format='%(asctime)s\t%(message)s',
                                 datefmt='%d/%m/%Y %H:%M:%S')
             while True:
-                data, addr = rpl_sock.recvfrom(self.MAX_LEN)
+                # Packets arrived together are read in one batch and share the receiving timestamp.
+                packets = receiver.receive()
                 timestamp = datetime.now().strftime('%H%M%S%f')[:-3]
-                # Calculate length of message other than the sequence number and timestamp.
-                # The length of sequence number is fixed 8 bytes.
-                other_len = len(data) - 8 - len(timestamp)
-                # Log client connection information including client (IP, port) and the port assigned to client on sink.
-                conn_info = 'client|' + str(addr[0]) + '.' + str(addr[1]) + '|sink|' + str(
-                    self.config['SERVERIP']) + '.' + str(port)
-                record = data[0:8] + '\t' + data[8:8 + other_len] + '\t' + data[8 + other_len:] + '\t' + timestamp + \
-                         '\t' + conn_info
-                logging.info(record)
+                if self.stats is not None:
+                    self.stats.update_batch(packets)
+                for data, addr in packets:
+                    # Calculate length of message other than the sequence number and timestamp.
+                    # The length of sequence number is fixed 8 bytes.
+                    other_len = len(data) - 8 - len(timestamp)
+                    # Log client connection information including client (IP, port) and the port assigned to client on
+                    # sink.
+                    conn_info = 'client|' + str(addr[0]) + '.' + str(addr[1]) + '|sink|' + str(
+                        self.config['SERVERIP']) + '.' + str(port)
+                    record = data[0:8] + '\t' + data[8:8 + other_len] + '\t' + data[8 + other_len:] + '\t' + \
+                             timestamp + '\t' + conn_info
+                    logging.info(record)
         except socket.timeout:
             print ('Time out.')
         except KeyboardInterrupt:
@@ -269,12 +890,60 @@ class SinkPlain(object):
             print ('Unknown errors.')
             print (e)
         finally:
+            if self.stats is not None:
+                self.stats.publish()
             rpl_sock.shutdown(socket.SHUT_RDWR)
             rpl_sock.close()
 
+    def record_binary(self, receiver, addr, log_name, port):
+        """Record the packets received from a client in a binary record log (see sinkrecord) until the socket is
+           closed.
+
+        :param receiver: the batch receiver of the socket assigned to the client.
+        :param addr: client IP address.
+        :param log_name: log name without extension.
+        :param port: sink port which receives the packets.
+        :type receiver: BatchReceiver.
+        :type addr: tuple.
+        :type log_name: str.
+        :type port: int.
+        """
+        writer = sinkrecord.RecordWriter(log_name)
+        try:
+            clients = {}
+            while True:
+                packets = receiver.receive()
+                now = time.time()
+                for data, addr in packets:
+                    cid = clients.get(addr[1])
+                    if cid is None:
+                        # Log client connection information including client (IP, port) and the port assigned to
+                        # client on sink.
+                        conn_info = 'client|' + str(addr[0]) + '.' + str(addr[1]) + '|sink|' + str(
+                            self.config['SERVERIP']) + '.' + str(port)
+                        cid = clients[addr[1]] = writer.add_client(conn_info, addr[1], port)
+                    writer.write(data, now, cid)
+                if self.stats is not None:
+                    self.stats.update_batch(packets, now)
+        finally:
+            writer.close()
+
     def start(self):
-        """This function start a server which can accept a DTLS client and receive messages.
+        """This function start a server which can accept a client and receive messages.
+           The keyword "SINKMODE" selects how clients are served: "process" (default) creates a process and a new
+           port for every client, "loop" serves all clients in this process (see start_loop) and "sharded" serves
+           clients in worker processes (see start_sharded).
         """
+        mode = self.config.get('SINKMODE', '').lower()
+        # In loop mode the packets are received in this process, otherwise the statistics are inherited by the
+        # connection handlers or workers and published to the stats server.
+        self.stats = sinkstats.start_stats(self.config.get('STATSPORT', ''), local=(mode == 'loop'))
+        if mode == 'loop':
+            self.start_loop()
+            return
+        if mode == 'sharded':
+            self.start_sharded()
+            return
         print ('Start server.')
         try:
             sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
@@ -295,6 +964,137 @@ class SinkPlain(object):
         except Exception as e:
             print (e)
 
+    def create_sockets(self, host, port, num):
+        """This function creates non-blocking UDP sockets bound to the same address. If more than one socket is
+           required, the sockets share the address by the option SO_REUSEPORT and the kernel distributes the clients
+           among them.
+
+        :param host: IPv6 address of sink server.
+        :param port: port of sink server.
+        :param num: number of sockets.
+        :type host: str.
+        :type port: int.
+        :type num: int.
+
+        Return:
+                list - the created sockets.
+        """
+        socks = []
+        for i in range(0, max(num, 1)):
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+            if num > 1:
+                sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+            sock.bind((host, port))
+            sock.setblocking(0)
+            socks.append(sock)
+        return socks
+
+    def serve_packets(self, receiver, recorder):
+        """This function reads the pending packets from a socket in batches and records them. The first packet from a
+           new client (ip, port) is taken as the connection request and it is acknowledged from the same socket, so that
+           the client sends the following packets to the port of sink server.
+
+        :param receiver: the batch receiver of a non-blocking socket.
+        :param recorder: the recorder of received packets.
+        :type receiver: BatchReceiver.
+        :type recorder: SinkRecorder.
+        """
+        sock = receiver.sock
+        packets = receiver.receive()
+        batch = []
+        for data, addr in packets:
+            key = addr[:2]
+            if key not in recorder.clients:  # connection request from a new client.
+                print ('New connection from: ' + addr[0] + ', ' + str(addr[1]))
+                recorder.add_client(addr)
+                sock.sendto('ack', addr)
+            elif data == 'start':  # the acknowledgement was lost and the client requests again.
+                sock.sendto('ack', addr)
+            else:
+                batch.append((data, key))
+        if batch:
+            recorder.record_batch(batch)
+            if self.stats is not None:
+                self.stats.update_batch(batch)
+
+    def start_loop(self):
+        """This function starts a server which serves all clients in one process by an event loop. Packets from all
+           clients are received on the port of sink server ("SINKSOCKETS" sockets sharing the port) and recorded in
+           the per-client log files by their source address. The log files are the same as the ones from the
+           connection handlers.
+        """
+        print ('Start server in event loop mode.')
+        socks = []
+        try:
+            host = self.config.get('SERVERIP', '::1')
+            port = self.config.get('SERVERPORT', 12345)
+            socks = self.create_sockets(host, int(port), int(self.config.get('SINKSOCKETS') or 1))
+            self.serve_loop(socks)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print (e)
+        finally:
+            for sock in socks:
+                sock.close()
+
+    def serve_loop(self, socks):
+        """This function runs the event loop which serves clients on the given sockets until it is interrupted.
+
+        :param socks: non-blocking sockets bound to the port of sink server.
+        :type socks: list.
+        """
+        recorder = SinkRecorder(self.config.get('SERVERIP', '::1'), self.config.get('SERVERPORT', 12345),
+                                log_format=self.config.get('SINKLOG', '').lower() or 'text')
+        receivers = dict((sock, BatchReceiver(sock, self.MAX_BATCH, self.MAX_LEN)) for sock in socks)
+        try:
+            last_flush = time.time()
+            while True:
+                readable, writable, errors = select.select(socks, [], [], self.FLUSH_TIME)
+                for sock in readable:
+                    self.serve_packets(receivers[sock], recorder)
+                if time.time() - last_flush >= self.FLUSH_TIME:
+                    recorder.flush()
+                    last_flush = time.time()
+        finally:
+            recorder.close()
+            if self.stats is not None:
+                self.stats.publish()
+
+    def serve_shard(self, index, sock):
+        """This function is the worker of sharded mode, which serves clients on a socket of the group by an event loop.
+
+        :param index: index of worker.
+        :param sock: a socket sharing the port of sink server.
+        :type index: int.
+        :type sock: socket.
+        """
+        try:
+            sock.setblocking(0)
+            self.serve_loop([sock])
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print ('Worker ' + str(index) + ': ' + str(e))
+            raise
+
+    def start_sharded(self):
+        """This function starts "SINKWORKERS" worker processes (one per CPU by default) sharing the port of sink
+           server by SO_REUSEPORT. Each client device is always served by the same worker, so that its records are
+           written by one process, and a supervisor restarts the workers which exit unexpectedly.
+        """
+        host = self.config.get('SERVERIP', '::1')
+        port = int(self.config.get('SERVERPORT', 12345))
+        num = int(self.config.get('SINKWORKERS') or 0) or cpu_count()
+        print ('Start ' + str(num) + ' sink workers on HOST: ' + host + ', port: ' + str(port))
+        try:
+            socks = create_shard_sockets(host, port, num)
+        except Exception as e:
+            print (e)
+            return
+        SinkSupervisor(self.serve_shard, socks).start()
+
+
 # sink = Sink()
 # sink = SinkPlain()
 # sink.start()
@@ -82,7 +82,7 @@ class Sink(object):
         if update > 0:
             self.utl.update_config(self.server_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.server_cnf + ' ' + self.server_cnf + '.bck', shell=True)
+        self.utl.backup_file(self.server_cnf, self.server_cnf + '.bck')
 
     def connection_handler(self, sock, addr):
         """This is a connection handler for subthread. It process a new connection for certificate request.
@@ -217,7 +217,7 @@ class SinkPlain(object):
         if update > 0:
             self.utl.update_config(self.server_cnf, self.config)
         # Backup configuration file
-        self.utl.call('cp -f ' + self.server_cnf + ' ' + self.server_cnf + '..bck', shell=True)
+        self.utl.backup_file(self.server_cnf, self.server_cnf + '..bck')
 
     def connection_handler(self, addr):
         """This is a connection handler for subthread. It process a new connection for certificate request.
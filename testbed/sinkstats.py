@@ -0,0 +1,333 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Live statistics of sink server. Every process which receives packets keeps rolling per-client counters (received
+packets, sequence gaps, reorderings and a latency histogram from the timestamps embedded in packets), and publishes
+them to the stats server in the process which started the sink server. A client is identified by its address in the
+format ip.port, the same as the connection information in sink logs. The stats server serves the merged statistics
+as JSON over HTTP, e.g., "curl http://127.0.0.1:<STATSPORT>/stats".
+'''
+
+import os
+import time
+import json
+import threading
+from multiprocessing import Queue
+from BaseHTTPServer import HTTPServer
+from BaseHTTPServer import BaseHTTPRequestHandler
+import sinkrecord
+
+HOST = '127.0.0.1'  # the stats endpoint is only served on the local host
+DAY_MS = 86400000  # milliseconds of a day
+BIN_MS = 10  # width (in milliseconds) of the bins of latency histogram
+BINS = 500  # number of bins of latency histogram, the last bin counts all latency larger than (BINS - 1) * BIN_MS
+PERCENTILES = [50, 90, 99, 99.9]  # percentiles of latency in the statistics
+
+
+class ClientStats(object):
+    """
+    This class keeps the counters of a client device, which are updated at constant cost per packet.
+    """
+    __slots__ = ('received', 'max_seq', 'gaps', 'reordered', 'latency_sum', 'latency_count', 'histogram')
+
+    def __init__(self):
+        self.received = 0  # received packets
+        self.max_seq = 0  # the largest sequence number, i.e., the number of packets sent by the client so far
+        self.gaps = 0  # the number of times that the sequence number jumps forward
+        self.reordered = 0  # packets which arrive after a packet with a larger sequence number
+        self.latency_sum = 0
+        self.latency_count = 0  # packets with a valid sent timestamp
+        self.histogram = [0] * BINS
+
+    def snapshot(self):
+        """Return a copy of the counters.
+
+        Return:
+                dict - counters.
+        """
+        return {'received': self.received, 'sent': self.max_seq, 'gaps': self.gaps, 'reordered': self.reordered,
+                'latency_sum': self.latency_sum, 'latency_count': self.latency_count,
+                'histogram': list(self.histogram)}
+
+
+class SinkStats(object):
+    """
+    This class keeps the statistics of the packets received by a process. If a queue is given, the statistics are
+    published to the stats server through the queue every PUBLISH_TIME by a thread of the process, which is started
+    when the process receives the packets of its first client. The statistics are updated under a lock, since the
+    worker threads of pool mode share them.
+    """
+    PUBLISH_TIME = 1.0  # the time (in seconds) to publish the statistics
+
+    def __init__(self, queue=None):
+        """Constructor initializes variables
+
+        :param queue: queue of the stats server, None if the stats server reads the statistics in the same process.
+        :type queue: multiprocessing.Queue.
+        """
+        self.queue = queue
+        self.clients = {}  # client ip.port -> ClientStats
+        self.second = -1  # the second of the cached time of day
+        self.day_ms = 0  # cached time of day (in milliseconds) at the beginning of the second
+        self.publisher = 0  # id of the process which runs the publishing thread
+        self.changed = False  # the counters are changed since the last publish
+        self.lock = threading.Lock()  # it guards the counters of clients and the cached time of day
+
+    def update(self, addr, data, now):
+        """Update the counters of a client with a received packet.
+
+        :param addr: client address (ip, port, ...).
+        :param data: received packet.
+        :param now: received time in seconds since the epoch.
+        :type addr: tuple.
+        :type data: str.
+        :type now: float.
+        """
+        seq, sent = sinkrecord.parse_packet(data)
+        with self.lock:
+            client = self.clients.get(addr[:2])
+            if client is None:
+                client = self.clients[addr[:2]] = ClientStats()
+                if self.queue is not None and self.publisher != os.getpid():  # the statistics are inherited by fork.
+                    self.start_publisher()
+            client.received += 1
+            if seq > client.max_seq:
+                if seq > client.max_seq + 1:
+                    client.gaps += 1
+                client.max_seq = seq
+            else:
+                client.reordered += 1
+            if sent != sinkrecord.SENT_NONE:
+                second = int(now)
+                if second != self.second:
+                    local = time.localtime(second)
+                    self.second = second
+                    self.day_ms = (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec) * 1000
+                latency = abs(self.day_ms + int((now - second) * 1000) - sent)
+                latency = min(latency, DAY_MS - latency)  # the timestamps are on both sides of midnight
+                client.latency_sum += latency
+                client.latency_count += 1
+                client.histogram[min(latency // BIN_MS, BINS - 1)] += 1
+            self.changed = True
+
+    def update_batch(self, packets, now=None):
+        """Update the counters with a batch of packets received at the same time.
+
+        :param packets: received packets in the form of (data, client address (ip, port, ...)).
+        :param now: received time in seconds since the epoch, the current time if it is None.
+        :type packets: list.
+        :type now: float.
+        """
+        if now is None:
+            now = time.time()
+        for data, addr in packets:
+            self.update(addr, data, now)
+
+    def snapshot(self):
+        """Return a copy of the counters of all clients.
+
+        Return:
+                dict - client ip.port -> counters.
+        """
+        with self.lock:
+            return dict((addr[0] + '.' + str(addr[1]), client.snapshot()) for addr, client in self.clients.items())
+
+    def publish(self):
+        """Publish the statistics to the stats server if they are changed since the last publish.
+        """
+        if self.queue is None or not self.changed:
+            return
+        self.changed = False
+        self.queue.put((os.getpid(), self.snapshot()))
+
+    def start_publisher(self):
+        """Start a daemon thread which publishes the statistics of this process every PUBLISH_TIME.
+        """
+        self.publisher = os.getpid()
+        thread = threading.Thread(target=self.run_publisher)
+        thread.daemon = True
+        thread.start()
+
+    def run_publisher(self):
+        """Publish the statistics periodically until the process exits.
+        """
+        while True:
+            time.sleep(self.PUBLISH_TIME)
+            self.publish()
+
+
+def merge(snapshots):
+    """Merge the statistics from several processes. A client may be served by several processes, e.g., when a worker of
+       sharded mode is restarted.
+
+    :param snapshots: statistics in the form of client ip.port -> counters.
+    :type snapshots: list.
+
+    Return:
+            dict - client ip.port -> merged counters.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for client, counters in snapshot.iteritems():
+            total = merged.get(client)
+            if total is None:
+                merged[client] = dict(counters, histogram=list(counters['histogram']))
+                continue
+            for key in ('received', 'gaps', 'reordered', 'latency_sum', 'latency_count'):
+                total[key] += counters[key]
+            total['sent'] = max(total['sent'], counters['sent'])
+            total['histogram'] = [a + b for a, b in zip(total['histogram'], counters['histogram'])]
+    return merged
+
+
+def summarize(counters):
+    """Add the packet loss, average latency and latency percentiles to the counters of a client. The percentiles are
+       the upper bounds of histogram bins.
+
+    :param counters: counters of a client.
+    :type counters: dict.
+
+    Return:
+            dict - statistics of the client.
+    """
+    histogram = counters.pop('histogram')
+    sent = counters['sent']
+    counters['lost'] = max(sent - counters['received'], 0)
+    counters['loss'] = float(counters['lost']) / sent if sent else 0.0
+    count = counters['latency_count']
+    counters['latency_mean'] = float(counters.pop('latency_sum')) / count if count else None
+    ranks = [(percentile, count * percentile / 100.0) for percentile in PERCENTILES]
+    cumulative = 0
+    for i, num in enumerate(histogram):
+        cumulative += num
+        while ranks and cumulative >= ranks[0][1] and count:
+            counters['latency_p' + str(ranks.pop(0)[0])] = (i + 1) * BIN_MS
+    for percentile, rank in ranks:
+        counters['latency_p' + str(percentile)] = None
+    return counters
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    """
+    This class handles the HTTP requests to the stats endpoint.
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/stats'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.stats.report(), sort_keys=True, indent=1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # requests are not logged to keep the output of sink server readable.
+
+
+class StatsServer(object):
+    """
+    This class serves the statistics of sink server over HTTP in a background thread. The statistics are collected
+    from the processes receiving packets through a queue, and from a SinkStats in this process if it is given.
+    """
+
+    def __init__(self, port, host=HOST, local=None):
+        """Constructor initializes variables
+
+        :param port: port of the stats endpoint.
+        :param host: address of the stats endpoint.
+        :param local: the statistics updated in this process.
+        :type port: int.
+        :type host: str.
+        :type local: SinkStats.
+        """
+        self.queue = Queue()
+        self.local = local
+        self.snapshots = {}  # process id -> the latest statistics published by the process
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.httpd = HTTPServer((host, port), _StatsHandler)
+        self.httpd.stats = self
+
+    def collect(self):
+        """Receive the statistics published by processes until the process exits.
+        """
+        while True:
+            pid, snapshot = self.queue.get()
+            with self.lock:
+                self.snapshots[pid] = snapshot
+
+    def report(self):
+        """Return the merged statistics of all clients.
+
+        Return:
+                dict - statistics, including the per-client statistics and the total of all clients.
+        """
+        with self.lock:
+            snapshots = self.snapshots.values()
+        if self.local is not None:
+            snapshots.append(self.local.snapshot())
+        clients = merge(snapshots)
+        total = merge([{'total': counters} for counters in clients.itervalues()]).get('total')
+        if total is not None:
+            total['sent'] = sum(counters['sent'] for counters in clients.itervalues())
+            total = summarize(total)
+        return {'time': time.time(), 'uptime': time.time() - self.started, 'total': total,
+                'clients': dict((client, summarize(counters)) for client, counters in clients.iteritems())}
+
+    def start(self):
+        """Start the HTTP server and the collector in daemon threads.
+        """
+        for target in (self.httpd.serve_forever, self.collect):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        print ('Stats endpoint: http://' + self.httpd.server_address[0] + ':' + str(self.httpd.server_address[1]) +
+               '/stats')
+
+
+def start_stats(port, local=False):
+    """Start a stats server and return the statistics to be updated with the received packets.
+
+    :param port: port of the stats endpoint, the stats server is not started if it is empty.
+    :param local: True if the packets are received in this process, False if they are received in child processes
+                  which inherit the returned statistics and publish them through the queue of stats server.
+    :type port: str.
+    :type local: bool.
+
+    Return:
+            SinkStats - the statistics, None if the stats server is not started.
+    """
+    if not port:
+        return None
+    stats = SinkStats()
+    try:
+        server = StatsServer(int(port), local=stats if local else None)
+    except Exception as e:
+        print ('Cannot start the stats endpoint: ' + str(e))
+        return None
+    if not local:
+        stats.queue = server.queue
+    server.start()
+    return stats
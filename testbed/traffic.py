@@ -0,0 +1,301 @@
+'''
+SMIT package implements a basic IoT platform.
+
+Copyright 2016-2018 Distributed Systems Security, Data61, CSIRO
+
+This file is part of SMIT package.
+
+SMIT package is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+SMIT package is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SMIT package.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+'''
+Traffic generator of client devices. A traffic model computes the send times of packets up front, one chunk of
+CHUNK_TIME seconds at a time, and the traffic engine sends the packets at these times against a monotonic clock, so
+that the sending rate does not drift when a send is late. Packets which are due at the same time are sent in a batch.
+
+The models (keyword "TRAFFIC" in client_expcnf):
+    tick:     every SENDTIME seconds, send a packet with the probability to reach SENDRATE / DEVNUM packets per second.
+              This is the behaviour of the SIGALRM timer used before, and it is the default.
+    constant: SENDRATE / DEVNUM packets per second at fixed intervals.
+    poisson:  Poisson arrivals of SENDRATE / DEVNUM packets per second on average.
+    bursty:   Poisson arrivals of bursts of BURSTSIZE packets, SENDRATE / DEVNUM packets per second on average.
+    trace:    replay the send times in TRACEFILE, repeatedly.
+'''
+
+import time
+import math
+import bisect
+import random
+import ctypes
+import ctypes.util
+
+CLOCK_MONOTONIC = 1  # clock id of clock_gettime on Linux
+BATCH_TIME = 0.001  # packets due within this time (in seconds) are sent in one batch
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    """Load the clock_gettime function from the C library.
+
+    Return:
+            function - clock_gettime, or None if it is not available on this platform.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = libc.clock_gettime
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    func.restype = ctypes.c_int
+    return func
+
+
+_clock_gettime = _load_clock_gettime()
+_timespec = _Timespec()
+
+
+def monotonic():
+    """Return the time of a monotonic clock in seconds, which is not affected by the time synchronization of client
+       devices. The wall clock is used if the monotonic clock is not available.
+
+    Return:
+            float - time in seconds.
+    """
+    if _clock_gettime is None or _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(_timespec)) != 0:
+        return time.time()
+    return _timespec.tv_sec + _timespec.tv_nsec * 1e-9
+
+
+class TrafficModel(object):
+    """
+    This is the abstract base class of traffic models. A model returns the send times (offsets in seconds from the
+    start of sending) of the packets in consecutive chunks of CHUNK_TIME seconds, subclasses implement offsets. A
+    chunk may have no send time, the consumers of the schedule wait until the end of such a chunk.
+    """
+    CHUNK_TIME = 10.0  # the length (in seconds) of a chunk of schedule
+
+    def offsets(self, begin, end):
+        """Return the send times in a chunk.
+
+        :param begin: the beginning of the chunk, included.
+        :param end: the end of the chunk, excluded.
+        :type begin: float.
+        :type end: float.
+
+        Return:
+                list - sorted send times, a time is repeated for packets sent at the same time.
+        """
+        raise NotImplementedError(self.__class__.__name__ + ' does not implement the send times of traffic.')
+
+    def chunks(self):
+        """Generate the schedule chunk by chunk, endlessly.
+        """
+        begin = 0.0
+        while True:
+            yield self.offsets(begin, begin + self.CHUNK_TIME)
+            begin += self.CHUNK_TIME
+
+
+class TickModel(TrafficModel):
+    """
+    Every period, send a packet with a probability. The probability is an integer percentage, as in the SIGALRM timer
+    of the clients before the traffic engine.
+    """
+
+    def __init__(self, rate, period):
+        """Constructor initializes variables
+
+        :param rate: average packets per second.
+        :param period: the period (in seconds) to try to send a packet.
+        :type rate: float.
+        :type period: float.
+        """
+        if not float(rate) > 0:
+            raise ValueError('The rate of tick traffic must be positive: ' + str(rate))
+        if not float(period) > 0:
+            raise ValueError('The period of tick traffic must be positive: ' + str(period))
+        self.period = float(period)
+        self.probability = int(rate * self.period * 100)
+        if self.probability < 1:
+            raise ValueError('The probability to send a packet every ' + str(period) + ' seconds at ' + str(rate) +
+                             ' packets per second is below 1%, please increase the period.')
+        self.tick = 1  # index of the next tick, the first tick is one period after the start
+
+    def offsets(self, begin, end):
+        offsets = []
+        while self.tick * self.period < end:
+            if random.randint(0, 99) < self.probability:
+                offsets.append(self.tick * self.period)
+            self.tick += 1
+        return offsets
+
+
+class ConstantModel(TrafficModel):
+    """
+    Send packets at fixed intervals.
+    """
+
+    def __init__(self, rate):
+        """Constructor initializes variables
+
+        :param rate: packets per second.
+        :type rate: float.
+        """
+        if not float(rate) > 0:
+            raise ValueError('The rate of constant traffic must be positive: ' + str(rate))
+        self.rate = float(rate)
+
+    def offsets(self, begin, end):
+        return [k / self.rate for k in xrange(int(math.ceil(begin * self.rate)), int(math.ceil(end * self.rate)))]
+
+
+class PoissonModel(TrafficModel):
+    """
+    Send packets as Poisson arrivals, i.e., with exponentially distributed intervals.
+    """
+
+    def __init__(self, rate, burst=1):
+        """Constructor initializes variables
+
+        :param rate: average packets per second.
+        :param burst: number of packets sent at each arrival.
+        :type rate: float.
+        :type burst: int.
+        """
+        if not float(rate) > 0:
+            raise ValueError('The rate of Poisson traffic must be positive: ' + str(rate))
+        if int(burst) < 1:
+            raise ValueError('The burst size of Poisson traffic must be at least 1: ' + str(burst))
+        self.rate = float(rate) / burst
+        self.burst = burst
+        self.next = random.expovariate(self.rate)
+
+    def offsets(self, begin, end):
+        offsets = []
+        while self.next < end:
+            offsets.extend([self.next] * self.burst)
+            self.next += random.expovariate(self.rate)
+        return offsets
+
+
+class TraceModel(TrafficModel):
+    """
+    Replay the send times in a trace file repeatedly. The trace file has a send time (in seconds) at the beginning of
+    each line, the other columns and the lines starting with "#" are ignored. The times are relative to the first one,
+    and the trace is repeated after the last time plus the average interval.
+    """
+
+    def __init__(self, path):
+        """Constructor reads the trace file.
+
+        :param path: path to the trace file.
+        :type path: str.
+        """
+        times = []
+        with open(path) as f:
+            for line in f:
+                items = line.split()
+                if items and not items[0].startswith('#'):
+                    times.append(float(items[0]))
+        if not times:
+            raise ValueError('Trace file \"' + path + '\" is empty.')
+        times.sort()
+        self.trace = [t - times[0] for t in times]
+        gap = self.trace[-1] / (len(self.trace) - 1) if len(self.trace) > 1 else 1.0
+        self.period = self.trace[-1] + (gap or 1.0)
+
+    def offsets(self, begin, end):
+        offsets = []
+        for rep in xrange(int(begin // self.period), int(end // self.period) + 1):
+            base = rep * self.period
+            first = bisect.bisect_left(self.trace, begin - base)
+            last = bisect.bisect_left(self.trace, end - base)
+            offsets.extend([base + t for t in self.trace[first:last]])
+        return offsets
+
+
+def create_model(config):
+    """Create the traffic model configured in a client configuration.
+
+    :param config: client configuration, including TRAFFIC, SENDRATE, DEVNUM, SENDTIME, BURSTSIZE and TRACEFILE.
+    :type config: dict.
+
+    Return:
+            TrafficModel - the traffic model.
+    """
+    model = str(config.get('TRAFFIC', '') or 'tick').lower()
+    if model == 'trace':
+        return TraceModel(config['TRACEFILE'])
+    rate = float(config['SENDRATE']) / float(config['DEVNUM'])  # packets per second of this device
+    if model == 'tick':
+        return TickModel(rate, float(config['SENDTIME']))
+    if model == 'constant':
+        return ConstantModel(rate)
+    if model == 'poisson':
+        return PoissonModel(rate)
+    if model == 'bursty':
+        return PoissonModel(rate, int(config.get('BURSTSIZE', '') or 1))
+    raise ValueError('Unknown traffic model: ' + model)
+
+
+class TrafficEngine(object):
+    """
+    This class sends packets at the times computed by a traffic model.
+    """
+
+    def __init__(self, model, send):
+        """Constructor initializes variables
+
+        :param model: the traffic model.
+        :param send: function to send a batch of packets, which takes the number of packets as argument.
+        :type model: TrafficModel.
+        :type send: function.
+        """
+        self.model = model
+        self.send = send
+
+    def run(self, duration=None):
+        """Send packets until the duration is over or the engine is interrupted. A late batch is sent at once, and the
+           following packets are still sent at their scheduled times. The next chunk of the schedule is computed at
+           the end of the current one, e.g., the engine sleeps through a chunk without send times.
+
+        :param duration: sending time in seconds, endless if it is None.
+        :type duration: float.
+        """
+        start = monotonic()
+        for index, offsets in enumerate(self.model.chunks()):
+            if duration is not None and index * self.model.CHUNK_TIME >= duration:
+                return
+            i = 0
+            num = len(offsets)
+            while i < num:
+                if duration is not None and offsets[i] >= duration:
+                    return
+                wait = offsets[i] - (monotonic() - start)
+                if wait > 0:
+                    time.sleep(wait)
+                due = monotonic() - start + BATCH_TIME
+                j = i + 1
+                while j < num and offsets[j] <= due:
+                    j += 1
+                self.send(j - i)
+                i = j
+            wait = (index + 1) * self.model.CHUNK_TIME - (monotonic() - start)
+            if duration is not None:
+                wait = min(wait, duration - (monotonic() - start))
+            if wait > 0:
+                time.sleep(wait)
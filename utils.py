@@ -25,6 +25,13 @@ import os
 import stat
 import errno
 import re
+import shutil
+import filecmp
+import tempfile
+
+# registry of configuration files parsed once per process: absolute path -> {'stat': (mtime, size, inode),
+# 'lines': lines of the file, 'quoted': parsed "Keyword = "value"", 'plain': parsed "Keyword = value"}
+_configs = {}
 
 
 class Utils(object):
@@ -229,17 +236,105 @@ class Utils(object):
         f.close()
         return del_lines
 
-    def update_config(self, filename, keywords):
+    def load_config(self, filename):
+        """Return the entry of a configuration file in the registry. The file is read only if it is not in the
+           registry or it was modified since it was read.
+
+        :param filename: configuration file.
+        :type filename: str.
+
+        Return:
+            dict. -- The entry of the file, "lines" are the lines of the file.
+        """
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size, st.st_ino)
+        entry = _configs.get(path)
+        if entry is None or entry['stat'] != key:
+            with open(path, 'r') as f:
+                entry = {'stat': key, 'lines': f.readlines(), 'quoted': None, 'plain': None}
+            _configs[path] = entry
+        return entry
+
+    def parse_config(self, filename, plain=False):
+        """Parse all keywords of a configuration file once, the result is kept in the registry until the file is
+           modified. Only the last value of a keyword is kept.
+
+        :param filename: configuration file.
+        :param plain: True for the format "Keyword = value", False for "Keyword = "value"".
+        :type filename: str.
+        :type plain: bool.
+
+        Return:
+            dict. -- keyword -> value.
         """
+        entry = self.load_config(filename)
+        form = 'plain' if plain else 'quoted'
+        if entry[form] is None:
+            values = {}
+            for line in entry['lines']:
+                words = line.split('=')
+                if len(words) > 1:
+                    value = str(words[1]).strip()
+                    if plain:
+                        end = value.find('#')
+                        value = value[:end] if end >= 0 else value
+                    else:
+                        begin = value.find('\"') + 1
+                        end = value.find('\"', begin)
+                        value = value[begin:end] if end >= begin else ''
+                    values[str(words[0]).strip()] = value
+            entry[form] = values
+        return entry[form]
+
+    def write_atomic(self, filename, content):
+        """Write a file atomically: the content is written to a temporary file in the same directory, which then
+           replaces the file, so that readers never see a partial file. The permissions of the file are kept.
 
-        :param filename:
-        :param keywords:
-        :return:
+        :param filename: a file.
+        :param content: content of the file.
+        :type filename: str.
+        :type content: str.
         """
+        path = os.path.abspath(filename)
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(path))
         try:
-            f = open(filename, 'r')
-            lines = f.readlines()
-            f.close()
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def backup_file(self, filename, backup):
+        """Copy a file to its backup, unless the backup is identical.
+
+        :param filename: a file.
+        :param backup: path to the backup.
+        :type filename: str.
+        :type backup: str.
+        """
+        try:
+            if os.path.isfile(backup) and filecmp.cmp(filename, backup, shallow=False):
+                return
+            shutil.copyfile(filename, backup)
+        except (IOError, OSError) as e:
+            print ('ERROR: cannot backup the file \"' + filename + '\": ' + str(e))
+
+    def update_config(self, filename, keywords):
+        """Update the values of keywords in a configuration file. The file is written atomically and only if a value
+           is changed.
+
+        :param filename: configuration file.
+        :param keywords: keyword -> value, empty values are not updated.
+        :type filename: str.
+        :type keywords: dict.
+        """
+        try:
+            lines = list(self.load_config(filename)['lines'])
             i = 0
             for line in lines:
                 words = line.split('=')
@@ -253,14 +348,14 @@ class Utils(object):
                         if value != '':
                             lines[i] = key + ' = \"' + value + '\"\n'
                 i += 1
-            f = open(filename, 'w')
-            f.writelines(lines)
-            f.close()
-        except IOError:
+            if lines != _configs[os.path.abspath(filename)]['lines']:
+                self.write_atomic(filename, ''.join(lines))
+        except (IOError, OSError):
             print ('ERROR: cannot read the file: \"' + filename + '\".')
 
     def read_config(self, filename, keywords):
-        """Read a configuration file with customized recognizable keywords
+        """Read a configuration file with customized recognizable keywords. The file is parsed once and kept in the
+           registry until it is modified.
 
         :param filename: configuration file
         :param keywords: keywords
@@ -279,25 +374,10 @@ class Utils(object):
         """
         keywords_dict = {}
         try:
-            with open(filename) as s_file:
-                for num, line in enumerate(s_file, 1):
-                    words = line.split('=')
-                    if words is not None and len(words) > 1:
-                        key = str(words[0]).strip()
-                        value = str(words[1]).strip()
-                        for kw in keywords:
-                            if key == kw:
-                                begin = value.find('\"') + 1
-                                end = value.find('\"', begin)
-                                if end >= begin:
-                                    keywords_dict[kw] = value[begin:end]
-                                else:
-                                    keywords_dict[kw] = ''
-                                break
+            values = self.parse_config(filename)
             for kw in keywords:
-                if keywords_dict.get(kw, '') == '':
-                    keywords_dict[kw] = ''
-        except IOError:
+                keywords_dict[kw] = values.get(kw, '')
+        except (IOError, OSError):
             print ('ERROR: cannot read the file: \"' + filename + '\".')
             return {}
         return keywords_dict
@@ -323,25 +403,10 @@ class Utils(object):
         """
         keywrds_dict = {}
         try:
-            with open(filename) as s_file:
-                for num, line in enumerate(s_file, 1):
-                    words = line.split('=')
-                    if words is not None and len(words) > 1:
-                        key = str(words[0]).strip()
-                        value = str(words[1]).strip()
-                        for kw in keywords:
-                            if key == kw:
-                                begin = 0
-                                end = value.find('#', begin)
-                                if end >= begin:
-                                    keywrds_dict[kw] = value[begin:end]
-                                else:
-                                    keywrds_dict[kw] = value.strip()
-                                break
+            values = self.parse_config(filename, plain=True)
             for kw in keywords:
-                if keywrds_dict.get(kw, '') == '':
-                    keywrds_dict[kw] = ''
-        except IOError:
+                keywrds_dict[kw] = values.get(kw, '')
+        except (IOError, OSError):
             print ('ERROR: cannot read the file: \"' + filename + '\".')
             return {}
         return keywrds_dict